@@ -0,0 +1,156 @@
+# accounts/authentication.py
+"""
+JWT authentication without a user query per request.
+
+Access tokens issued by ``ClaimsRefreshToken`` carry the user's email,
+is_staff, is_active and token_version. ``ClaimsJWTAuthentication`` trusts
+those claims and builds the user from them; the rest of the user's fields are
+deferred and only loaded if something reads them. The one thing checked
+against the database is the token version, through a cache entry that lives
+JWT_CLAIMS_CACHE_TIMEOUT seconds and is dropped whenever the version is
+bumped (password change, deactivation, staff change), so revoked tokens are
+refused at once in this process and within the timeout in the others.
+
+Tokens issued without the claims fall back to simplejwt's database lookup.
+``aauthenticate()`` does the same on the async cache and ORM for the ASGI
+routes (bookstore/asyncapi.py).
+"""
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.db import router
+from django.utils.translation import gettext_lazy as _
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import AuthenticationFailed, TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import revocations
+from .models import CustomUser
+
+VERSION_CLAIM = "ver"
+CLAIM_FIELDS = ("email", "is_staff", "is_active")
+
+
+def version_key(user_id):
+    return f"accounts:token-version:{user_id}"
+
+
+def token_cache():
+    return caches[settings.JWT_CLAIMS_CACHE_ALIAS]
+
+
+def remember_version(user_id, version):
+    token_cache().set(version_key(user_id), version, settings.JWT_CLAIMS_CACHE_TIMEOUT)
+
+
+def forget_version(user_id):
+    token_cache().delete(version_key(user_id))
+
+
+def current_version(user_id):
+    """The user's token_version, None for an unknown user"""
+    version = token_cache().get(version_key(user_id))
+    if version is None:
+        version = CustomUser.objects.filter(pk=user_id).values_list("token_version", flat=True).first()
+        if version is not None:
+            remember_version(user_id, version)
+    return version
+
+
+async def acurrent_version(user_id):
+    version = await token_cache().aget(version_key(user_id))
+    if version is None:
+        version = await CustomUser.objects.filter(pk=user_id).values_list("token_version", flat=True).afirst()
+        if version is not None:
+            await token_cache().aset(version_key(user_id), version, settings.JWT_CLAIMS_CACHE_TIMEOUT)
+    return version
+
+
+class ClaimsRefreshToken(RefreshToken):
+    @classmethod
+    def for_user(cls, user):
+        token = super().for_user(user)
+        for name in CLAIM_FIELDS:
+            token[name] = getattr(user, name)
+        token[VERSION_CLAIM] = user.token_version
+        # the access token copies these from the refresh token
+        return token
+
+    def check_blacklist(self):
+        if revocations.is_revoked(self.payload[api_settings.JTI_CLAIM]):
+            raise TokenError(_("Token is blacklisted"))
+
+    def blacklist(self):
+        revocations.revoke(
+            self.payload[api_settings.JTI_CLAIM], datetime_from_epoch(self.payload["exp"]),
+            user_id=self.payload.get(api_settings.USER_ID_CLAIM), token=str(self),
+        )
+
+
+def claims_user(validated_token):
+    """A CustomUser from the token claims, other fields load on first access"""
+    claims = {name: validated_token[name] for name in CLAIM_FIELDS}
+    claims["id"] = validated_token[api_settings.USER_ID_CLAIM]
+    claims["token_version"] = validated_token[VERSION_CLAIM]
+    # from_db() takes the values in model field order
+    names = [field.attname for field in CustomUser._meta.concrete_fields if field.attname in claims]
+    return CustomUser.from_db(router.db_for_read(CustomUser), names, [claims[name] for name in names])
+
+
+def load_deferred(user):
+    """Fetch whatever claims_user() left out in one query"""
+    deferred = user.get_deferred_fields()
+    if deferred:
+        user.refresh_from_db(fields=deferred)
+    return user
+
+
+async def aload_deferred(user):
+    deferred = user.get_deferred_fields()
+    if deferred:
+        await user.arefresh_from_db(fields=deferred)
+    return user
+
+
+def has_claims(validated_token):
+    return VERSION_CLAIM in validated_token and api_settings.USER_ID_CLAIM in validated_token
+
+
+def check_active(validated_token):
+    if not validated_token.get("is_active"):
+        raise AuthenticationFailed(_("User is inactive"), code="user_inactive")
+
+
+def versioned_user(validated_token, version):
+    """The claims user when `version` (the current one) matches the token's"""
+    if version is None:
+        raise AuthenticationFailed(_("User not found"), code="user_not_found")
+    if version != validated_token[VERSION_CLAIM]:
+        raise AuthenticationFailed(_("Token has been revoked"), code="token_revoked")
+    return claims_user(validated_token)
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+    def get_user(self, validated_token):
+        if not has_claims(validated_token):
+            return super().get_user(validated_token)
+        check_active(validated_token)
+        return versioned_user(validated_token, current_version(validated_token[api_settings.USER_ID_CLAIM]))
+
+    async def aauthenticate(self, request):
+        header = self.get_header(request)
+        if header is None:
+            return None
+        raw_token = self.get_raw_token(header)
+        if raw_token is None:
+            return None
+        validated_token = self.get_validated_token(raw_token)
+        return await self.aget_user(validated_token), validated_token
+
+    async def aget_user(self, validated_token):
+        if not has_claims(validated_token):
+            return await sync_to_async(super().get_user)(validated_token)
+        check_active(validated_token)
+        return versioned_user(validated_token, await acurrent_version(validated_token[api_settings.USER_ID_CLAIM]))
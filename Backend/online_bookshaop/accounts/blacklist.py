@@ -0,0 +1,115 @@
+# accounts/blacklist.py
+"""
+Refresh-token revocation checks without a query per token.
+
+Every process keeps a Bloom filter of the JTIs of revoked tokens that have not
+expired yet. A token the filter has never seen cannot be revoked, so the usual
+check costs one shared-cache read (the blacklist generation) and no query; only
+revoked tokens and the rare false positive are confirmed against
+``BlacklistedToken``, which stays the durable record. Revoking a token writes
+it to the database and moves the generation, and every process rebuilds its
+filter from the unexpired rows the next time it checks a token.
+
+simplejwt's tables otherwise keep every token ever issued; ``prune_expired()``
+(the ``prune_tokens`` command) deletes expired ones in batches.
+"""
+import hashlib
+import math
+import threading
+import uuid
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.utils import timezone
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+
+GENERATION_KEY = "accounts:blacklist:generation"
+
+
+class BloomFilter:
+    def __init__(self, capacity, error_rate):
+        capacity = max(capacity, 1)
+        self.size = max(8, math.ceil(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, item):
+        # double hashing, two 64-bit halves of one digest
+        digest = hashlib.blake2b(item.encode(), digest_size=16).digest()
+        first, second = int.from_bytes(digest[:8], "big"), int.from_bytes(digest[8:], "big") | 1
+        return ((first + i * second) % self.size for i in range(self.hashes))
+
+    def add(self, item):
+        for position in self.positions(item):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, item):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(item))
+
+
+def generation_cache():
+    return caches[settings.TOKEN_BLACKLIST_CACHE_ALIAS]
+
+
+class Revocations:
+    """The per-process filter, rebuilt whenever the shared generation moves"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.generation = None
+        self.bloom = None
+
+    def current_generation(self):
+        cache = generation_cache()
+        generation = cache.get(GENERATION_KEY)
+        if generation is None:
+            # first use or the cache lost it, every process starts over
+            cache.add(GENERATION_KEY, uuid.uuid4().hex, None)
+            generation = cache.get(GENERATION_KEY)
+        return generation
+
+    def sync(self):
+        generation = self.current_generation()
+        if generation == self.generation:
+            return
+        with self.lock:
+            if generation == self.generation:
+                return
+            jtis = list(
+                BlacklistedToken.objects.filter(token__expires_at__gt=timezone.now()).values_list("token__jti", flat=True)
+            )
+            bloom = BloomFilter(max(settings.TOKEN_BLACKLIST_BLOOM_CAPACITY, 2 * len(jtis)), settings.TOKEN_BLACKLIST_BLOOM_ERROR_RATE)
+            for jti in jtis:
+                bloom.add(jti)
+            self.bloom, self.generation = bloom, generation
+
+    def is_revoked(self, jti):
+        self.sync()
+        if jti not in self.bloom:
+            return False
+        return BlacklistedToken.objects.filter(token__jti=jti).exists()
+
+    def revoke(self, jti, expires_at, user_id=None, token=""):
+        outstanding, _ = OutstandingToken.objects.get_or_create(
+            jti=jti, defaults={"user_id": user_id, "token": token, "created_at": timezone.now(), "expires_at": expires_at},
+        )
+        BlacklistedToken.objects.get_or_create(token=outstanding)
+        if self.bloom is not None:
+            self.bloom.add(jti)
+        transaction.on_commit(lambda: generation_cache().set(GENERATION_KEY, uuid.uuid4().hex, None))
+
+
+revocations = Revocations()
+
+
+def prune_expired(batch_size=5000):
+    """Delete expired outstanding tokens and their blacklist rows, returns how many tokens went"""
+    deleted = 0
+    while True:
+        ids = list(OutstandingToken.objects.filter(expires_at__lte=timezone.now()).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        # blacklist rows cascade
+        OutstandingToken.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
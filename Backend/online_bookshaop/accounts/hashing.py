@@ -0,0 +1,109 @@
+# accounts/hashing.py
+"""
+Password hashing with bounded concurrency.
+
+Hashes run on a pool of PASSWORD_HASH_WORKERS threads (hashlib and argon2
+release the GIL). The request thread still blocks on the result, so the pool
+does not free it; it caps how many hashes run at once, so a login burst uses at
+most that many cores and queues instead of stealing CPU from every other
+request. Requests that cannot get a slot within PASSWORD_HASH_WAIT seconds
+raise ``HashingBusy``.
+
+Logins go through ``django.contrib.auth.authenticate()``, so every
+AUTHENTICATION_BACKENDS entry is tried and failures send ``user_login_failed``;
+``PooledModelBackend`` is the ModelBackend that checks passwords on the pool.
+Unknown emails are not hashed at all: the caller waits about as long as a real
+check takes, so response times do not reveal which emails exist.
+"""
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib import auth
+from django.contrib.auth import hashers
+from django.contrib.auth.backends import ModelBackend
+
+from .models import CustomUser
+
+
+class HashingBusy(Exception):
+    pass
+
+
+class HashPool:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.executor = None
+        self.slots = None
+        self.seconds = None  # moving average of one check
+
+    def start(self):
+        with self.lock:
+            if self.executor is None:
+                workers = max(settings.PASSWORD_HASH_WORKERS, 1)
+                self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="password-hash")
+                self.slots = threading.BoundedSemaphore(workers)
+
+    def run(self, fn, *args):
+        if self.executor is None:
+            self.start()
+        if not self.slots.acquire(timeout=settings.PASSWORD_HASH_WAIT):
+            raise HashingBusy
+        try:
+            started = time.perf_counter()
+            result = self.executor.submit(fn, *args).result()
+            elapsed = time.perf_counter() - started
+            self.seconds = elapsed if self.seconds is None else 0.9 * self.seconds + 0.1 * elapsed
+            return result
+        finally:
+            self.slots.release()
+
+
+pool = HashPool()
+
+
+def make_password(password):
+    return pool.run(hashers.make_password, password)
+
+
+def set_password(user, password):
+    user.password = make_password(password)
+    # lets save() notify the password validators, like AbstractBaseUser.set_password()
+    user._password = password
+
+
+def needs_rehash(encoded):
+    preferred = hashers.get_hasher("default")
+    return hashers.identify_hasher(encoded).algorithm != preferred.algorithm or preferred.must_update(encoded)
+
+
+class PooledModelBackend(ModelBackend):
+    """ModelBackend that checks passwords on the pool, rehashing outdated hashes"""
+
+    def authenticate(self, request, username=None, password=None, **kwargs):
+        email = kwargs.get(CustomUser.USERNAME_FIELD) if username is None else username
+        if email is None or password is None:
+            return None
+        try:
+            user = CustomUser._default_manager.get_by_natural_key(email)
+        except CustomUser.DoesNotExist:
+            if pool.seconds is None:
+                make_password(password)
+            else:
+                time.sleep(pool.seconds)
+            return None
+
+        if not pool.run(hashers.check_password, password, user.password) or not self.user_can_authenticate(user):
+            return None
+        if needs_rehash(user.password):
+            user.password = make_password(password)
+            # same password, so an update() that leaves token_version alone
+            CustomUser.objects.filter(pk=user.pk).update(password=user.password)
+            user._token_state = user.token_state()
+        return user
+
+
+def authenticate(request, email, password):
+    """The active user with these credentials or None, see PooledModelBackend"""
+    return auth.authenticate(request, email=email, password=password)
@@ -0,0 +1,104 @@
+import os
+import threading
+import time
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import Client, override_settings
+from django.utils.module_loading import import_string
+
+from accounts.hashing import pool
+from accounts.models import CustomUser
+from orders.loadtest import percentile
+
+PASSWORD = "bench-login-password"
+
+
+def algorithm_of(path):
+    return import_string(path).algorithm
+
+
+def cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+class Command(BaseCommand):
+    help = "Measure logins per second (and per core) through the login endpoint for each configured password hasher"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--threads", default=f"1,{cores()}", help="comma separated client thread counts")
+        parser.add_argument("--hashers", help="algorithms to compare (default: all configured, e.g. argon2,pbkdf2_sha256)")
+
+    def seed(self, algorithm, count):
+        prefix = f"bench-login-{algorithm}"
+        encoded = make_password(PASSWORD, hasher=algorithm)
+        CustomUser.objects.filter(email__startswith=prefix + "-").update(password=encoded)
+        CustomUser.objects.bulk_create(
+            [CustomUser(email=f"{prefix}-{n}@example.com", password=encoded) for n in range(count)],
+            ignore_conflicts=True,
+        )
+        return [f"{prefix}-{n}@example.com" for n in range(count)]
+
+    def run(self, emails, threads, seconds):
+        latencies, failures = [], []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def login(worker):
+            client = Client(HTTP_HOST="localhost")
+            n = worker
+            try:
+                while time.perf_counter() < deadline:
+                    started = time.perf_counter()
+                    response = client.post("/api/accounts/users/login/", {"email": emails[n % len(emails)], "password": PASSWORD},
+                                           content_type="application/json")
+                    with lock:
+                        (latencies if response.status_code == 200 else failures).append(time.perf_counter() - started)
+                    n += threads
+            finally:
+                connection.close()
+
+        started = time.perf_counter()
+        workers = [threading.Thread(target=login, args=(worker,)) for worker in range(threads)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        return latencies, failures, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        algorithms = [algorithm_of(path) for path in settings.PASSWORD_HASHERS]
+        if options["hashers"]:
+            unknown = set(options["hashers"].split(",")) - set(algorithms)
+            if unknown:
+                raise CommandError(f"Not in PASSWORD_HASHERS: {', '.join(sorted(unknown))}")
+            algorithms = options["hashers"].split(",")
+        thread_counts = [int(value) for value in options["threads"].split(",")]
+        available = cores()
+        self.stdout.write(f"{available} cores, {settings.PASSWORD_HASH_WORKERS} hash workers")
+        self.stdout.write(f"{'hasher':<16}{'threads':>8}{'logins/s':>10}{'per core':>10}{'p50 ms':>9}{'p95 ms':>9}{'failed':>8}")
+
+        for algorithm in algorithms:
+            path = next(path for path in settings.PASSWORD_HASHERS if algorithm_of(path) == algorithm)
+            hashers = [path] + [other for other in settings.PASSWORD_HASHERS if other != path]
+            # the rate limits would cut the run short, what is measured here is the hashing
+            with override_settings(PASSWORD_HASHERS=hashers, LOGIN_RATE_PER_EMAIL=0, LOGIN_RATE_PER_IP=0):
+                emails = self.seed(algorithm, options["users"])
+                for threads in thread_counts:
+                    latencies, failures, wall = self.run(emails, threads, options["seconds"])
+                    rate = len(latencies) / wall
+                    busy = min(threads, available, settings.PASSWORD_HASH_WORKERS)
+                    latencies = sorted(seconds * 1000 for seconds in latencies) or [0]
+                    self.stdout.write(
+                        f"{algorithm:<16}{threads:>8}{rate:>10.1f}{rate / busy:>10.1f}"
+                        f"{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}{len(failures):>8}"
+                    )
+        if pool.seconds is not None:
+            self.stdout.write(f"average hash check: {pool.seconds * 1000:.1f}ms")
@@ -8,8 +8,12 @@ class CustomUserManager(BaseUserManager):
         if not email:
             raise ValueError("Email is required")
         email = self.normalize_email(email)
+        hashed_password = extra_fields.pop("hashed_password", None)
         user = self.model(email=email, **extra_fields)
-        user.set_password(password)
+        if hashed_password:
+            user.password = hashed_password
+        else:
+            user.set_password(password)
         user.save(using=self._db)
         return user
 
@@ -27,13 +31,37 @@ class CustomUser(AbstractBaseUser, PermissionsMixin):
     phone = models.CharField(max_length=11)
     is_active = models.BooleanField(default=True)
     is_staff = models.BooleanField(default=False)
+    # bumped when issued access tokens can no longer be trusted, see accounts/authentication.py
+    token_version = models.PositiveIntegerField(default=0)
 
     objects = CustomUserManager()
 
     USERNAME_FIELD = "email"
     REQUIRED_FIELDS = ["first_name", "last_name"]  
+    # changing any of these revokes the user's tokens
+    TOKEN_FIELDS = ("password", "is_active", "is_staff")
+
     def __str__(self):
         return self.email
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._token_state = instance.token_state()
+        return instance
+
+    def token_state(self):
+        return {name: self.__dict__[name] for name in self.TOKEN_FIELDS if name in self.__dict__}
+
+    def save(self, *args, **kwargs):
+        # QuerySet.update() skips this, bump token_version there as well
+        loaded = getattr(self, "_token_state", {})
+        if any(loaded[name] != value for name, value in self.token_state().items() if name in loaded):
+            self.token_version += 1
+            if kwargs.get("update_fields") is not None:
+                kwargs["update_fields"] = {*kwargs["update_fields"], "token_version"}
+        super().save(*args, **kwargs)
+        self._token_state = self.token_state()
     
     class Meta:
         db_table = "custom_user"
@@ -0,0 +1,84 @@
+# accounts/ratelimit.py
+"""
+Sliding-window counters in the cache.
+
+Each key has one counter per fixed window; the rate is the current count plus
+the previous window's count weighted by how much of it still overlaps the
+sliding window. Two cache operations per hit, no per-attempt timestamps.
+"""
+import hashlib
+import ipaddress
+import math
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+
+
+class SlidingWindow:
+    def __init__(self, prefix, limit, window):
+        self.prefix = prefix
+        self.limit = limit
+        self.window = window
+
+    def key(self, value, index):
+        digest = hashlib.sha256(value.encode()).hexdigest()[:32]
+        return f"ratelimit:{self.prefix}:{digest}:{index}"
+
+    def hit(self, value, now=None):
+        """Count one attempt, returns 0 when allowed or the seconds to wait"""
+        if not self.limit:
+            return 0
+        cache = caches[settings.LOGIN_RATE_CACHE_ALIAS]
+        now = time.time() if now is None else now
+        index, offset = divmod(now, self.window)
+        current = self.key(value, int(index))
+        cache.add(current, 0, self.window * 2)
+        try:
+            count = cache.incr(current)
+        except ValueError:
+            # expired between add() and incr()
+            cache.set(current, 1, self.window * 2)
+            count = 1
+        previous = cache.get(self.key(value, int(index) - 1), 0)
+        if previous * (1 - offset / self.window) + count <= self.limit:
+            return 0
+        return max(1, math.ceil(self.window - offset))
+
+
+def trusted(address, networks):
+    try:
+        address = ipaddress.ip_address(address.strip())
+    except ValueError:
+        return False
+    return any(address in network for network in networks)
+
+
+def client_ip(request):
+    """
+    The address of the client behind the LOGIN_RATE_TRUSTED_PROXIES: X-Forwarded-For
+    is read right to left, each proxy appends the address it got the request from,
+    and the first address that is not a trusted proxy is the client. Without
+    trusted proxies, or from anyone else, it is REMOTE_ADDR.
+    """
+    remote = request.META.get("REMOTE_ADDR")
+    networks = [ipaddress.ip_network(value, strict=False) for value in settings.LOGIN_RATE_TRUSTED_PROXIES]
+    if not remote or not networks or not trusted(remote, networks):
+        return remote
+    hops = [hop.strip() for hop in request.META.get("HTTP_X_FORWARDED_FOR", "").split(",") if hop.strip()]
+    for hop in reversed(hops):
+        if not trusted(hop, networks):
+            return hop
+    # every hop is a proxy, the leftmost is the closest to the client
+    return hops[0] if hops else remote
+
+
+def login_limits():
+    window = settings.LOGIN_RATE_WINDOW
+    return SlidingWindow("login-email", settings.LOGIN_RATE_PER_EMAIL, window), SlidingWindow("login-ip", settings.LOGIN_RATE_PER_IP, window)
+
+
+def check_login(email, ip):
+    """Seconds the client has to wait before trying this login, 0 when allowed"""
+    by_email, by_ip = login_limits()
+    return max(by_email.hit(email.strip().lower()), by_ip.hit(ip or "unknown"))
@@ -1,4 +1,5 @@
 from rest_framework import serializers
+from bookstore.instrumentation import TimedSerializerMixin
 from .models import CustomUser
 
 class RegisterSerializer(serializers.ModelSerializer):
@@ -38,7 +39,7 @@ class SetNewPasswordSerializer(serializers.Serializer):
         return attrs
     
     
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = CustomUser
         # Include fields you want to expose
@@ -0,0 +1,14 @@
+from django.db import transaction
+from django.db.models.signals import post_save
+from django.dispatch import receiver
+
+from .authentication import forget_version
+from .models import CustomUser
+
+
+@receiver(post_save, sender=CustomUser)
+def drop_cached_token_version(sender, instance, created, **kwargs):
+    # again after commit, a request in between may have cached the old version
+    if not created:
+        forget_version(instance.pk)
+        transaction.on_commit(lambda: forget_version(instance.pk))
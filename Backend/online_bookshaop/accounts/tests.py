@@ -1,3 +1,231 @@
-from django.test import TestCase
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.hashers import get_hasher, make_password
+from django.contrib.auth.signals import user_login_failed
+from django.core.cache import cache
+from django.test import RequestFactory, TestCase, override_settings
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.token_blacklist.models import BlacklistedToken, OutstandingToken
+from rest_framework_simplejwt.tokens import RefreshToken
+
+from orders.models import Order
+from .authentication import ClaimsRefreshToken
+from .blacklist import BloomFilter, Revocations, prune_expired, revocations
+from .hashing import HashingBusy
+from .ratelimit import SlidingWindow, client_ip
+from .models import CustomUser
+
+
+class ClaimsAuthenticationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret", first_name="Ada")
+        self.client = APIClient()
+
+    def login(self):
+        response = self.client.post("/api/accounts/users/login/", {"email": "reader@example.com", "password": "secret"}, format="json")
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {response.json()['tokens']['access']}")
+
+    def test_authenticated_requests_skip_the_user_query(self):
+        self.login()
+        Order.objects.create(user=self.user, total_price=0)
+        self.client.get("/api/orders/orders/")
+        # ETag aggregate, orders, items: the same as a request without authentication cost
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/orders/orders/")
+        self.assertEqual(len(response.json()), 1)
+
+    def test_staff_claim(self):
+        self.user.is_staff = True
+        self.user.save()
+        other = CustomUser.objects.create_user(email="other@example.com", password="secret")
+        Order.objects.create(user=other, total_price=0)
+        self.login()
+        self.assertEqual(len(self.client.get("/api/orders/orders/").json()), 1)
+
+    def test_password_change_and_deactivation_revoke_tokens(self):
+        self.login()
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 200)
+        self.user.set_password("changed")
+        self.user.save()
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 401)
+
+        self.client.post("/api/accounts/users/login/", {"email": "reader@example.com", "password": "changed"}, format="json")
+        token = ClaimsRefreshToken.for_user(CustomUser.objects.get(pk=self.user.pk)).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 200)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 401)
+
+    def test_other_changes_keep_tokens(self):
+        self.login()
+        self.user.first_name = "Grace"
+        self.user.save()
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 200)
+
+    def test_verify_token_returns_the_full_user(self):
+        self.login()
+        body = self.client.get("/api/accounts/users/verify_token/").json()
+        self.assertEqual(body["user"]["first_name"], "Ada")
+        self.assertFalse(body["user"]["is_staff"])
+
+    def test_tokens_without_claims_fall_back_to_the_database(self):
+        token = RefreshToken.for_user(self.user).access_token
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {token}")
+        self.assertEqual(self.client.get("/api/cart/cart/").status_code, 200)
+
+
+class TokenBlacklistTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        revocations.generation = None
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000, 0.01)
+        for n in range(1000):
+            bloom.add(f"jti-{n}")
+        self.assertTrue(all(f"jti-{n}" in bloom for n in range(1000)))
+        false_positives = sum(f"other-{n}" in bloom for n in range(10000))
+        self.assertLess(false_positives, 300)
+
+    def test_logout_revokes_the_refresh_token(self):
+        tokens = self.client.post("/api/accounts/users/login/", {"email": "reader@example.com", "password": "secret"}, format="json").json()["tokens"]
+        self.client.credentials(HTTP_AUTHORIZATION=f"Bearer {tokens['access']}")
+        self.assertEqual(self.client.post("/api/accounts/users/refresh/", {"refresh": tokens["refresh"]}, format="json").status_code, 200)
+
+        self.assertEqual(self.client.post("/api/accounts/users/logout/", {"refresh": tokens["refresh"]}, format="json").status_code, 205)
+        self.assertEqual(self.client.post("/api/accounts/users/refresh/", {"refresh": tokens["refresh"]}, format="json").status_code, 401)
+        self.assertEqual(self.client.post("/api/accounts/users/logout/", {"refresh": tokens["refresh"]}, format="json").status_code, 400)
+
+    def test_unrevoked_tokens_are_checked_without_queries(self):
+        revoked = ClaimsRefreshToken.for_user(self.user)
+        revoked.blacklist()
+        token = str(ClaimsRefreshToken.for_user(self.user))
+        ClaimsRefreshToken(token)
+        with self.assertNumQueries(0):
+            ClaimsRefreshToken(token)
+        with self.assertNumQueries(1), self.assertRaises(TokenError):
+            ClaimsRefreshToken(str(revoked))
+
+    def test_other_processes_rebuild_on_a_new_generation(self):
+        other = Revocations()
+        token = ClaimsRefreshToken.for_user(self.user)
+        self.assertFalse(other.is_revoked(token["jti"]))
+        with self.captureOnCommitCallbacks(execute=True):
+            token.blacklist()
+        self.assertTrue(other.is_revoked(token["jti"]))
+
+    def test_prune_expired(self):
+        expired = ClaimsRefreshToken.for_user(self.user)
+        expired.blacklist()
+        live = ClaimsRefreshToken.for_user(self.user)
+        OutstandingToken.objects.filter(jti=expired["jti"]).update(expires_at=timezone.now() - timedelta(minutes=1))
+
+        self.assertEqual(prune_expired(batch_size=1), 1)
+        self.assertEqual(list(OutstandingToken.objects.values_list("jti", flat=True)), [live["jti"]])
+        self.assertFalse(BlacklistedToken.objects.exists())
+
+
+class LoginPipelineTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+
+    def login(self, email="reader@example.com", password="secret", ip="10.0.0.1"):
+        return self.client.post("/api/accounts/users/login/", {"email": email, "password": password}, format="json", REMOTE_ADDR=ip)
+
+    def test_sliding_window(self):
+        window = SlidingWindow("test", limit=3, window=60)
+        self.assertEqual([window.hit("key", now=600 + n) for n in range(3)], [0, 0, 0])
+        self.assertEqual(window.hit("key", now=603), 57)
+        # half of the previous window still counts: 4 * 0.5 + 1 <= 3
+        self.assertEqual(window.hit("key", now=690), 0)
+        self.assertEqual(window.hit("other", now=603), 0)
+
+    @override_settings(LOGIN_RATE_PER_EMAIL=3)
+    def test_email_limit_applies_before_hashing(self):
+        for _ in range(3):
+            self.assertEqual(self.login(password="wrong").status_code, 401)
+        with mock.patch("accounts.hashing.pool.run") as run:
+            response = self.login()
+        self.assertEqual(response.status_code, 429)
+        self.assertGreater(int(response["Retry-After"]), 0)
+        run.assert_not_called()
+        self.assertEqual(self.login(email="other@example.com").status_code, 401)
+
+    @override_settings(LOGIN_RATE_PER_IP=2)
+    def test_ip_limit(self):
+        self.login(email="a@example.com")
+        self.login(email="b@example.com")
+        self.assertEqual(self.login().status_code, 429)
+        self.assertEqual(self.login(ip="10.0.0.2").status_code, 200)
+
+    @override_settings(LOGIN_RATE_PER_IP=2, LOGIN_RATE_TRUSTED_PROXIES=["127.0.0.1"])
+    def test_ip_limit_behind_a_proxy(self):
+        def login(forwarded):
+            return self.client.post(
+                "/api/accounts/users/login/", {"email": "reader@example.com", "password": "secret"}, format="json",
+                REMOTE_ADDR="127.0.0.1", HTTP_X_FORWARDED_FOR=forwarded,
+            )
+
+        self.assertEqual(login("203.0.113.1").status_code, 200)
+        self.assertEqual(login("203.0.113.1").status_code, 200)
+        self.assertEqual(login("203.0.113.1").status_code, 429)
+        # other clients of the same proxy are not limited with it
+        self.assertEqual(login("203.0.113.2").status_code, 200)
+        # a spoofed leftmost address does not escape the limit
+        self.assertEqual(login("198.51.100.7, 203.0.113.1").status_code, 429)
+
+    def test_client_ip(self):
+        def ip(remote, forwarded=None, proxies=()):
+            headers = {"HTTP_X_FORWARDED_FOR": forwarded} if forwarded else {}
+            with self.settings(LOGIN_RATE_TRUSTED_PROXIES=list(proxies)):
+                return client_ip(RequestFactory().post("/", REMOTE_ADDR=remote, **headers))
+
+        self.assertEqual(ip("10.0.0.5", "1.2.3.4"), "10.0.0.5")
+        self.assertEqual(ip("10.0.0.5", "1.2.3.4", proxies=["10.0.0.0/8"]), "1.2.3.4")
+        self.assertEqual(ip("10.0.0.5", "9.9.9.9, 1.2.3.4, 10.0.0.7", proxies=["10.0.0.0/8"]), "1.2.3.4")
+        self.assertEqual(ip("10.0.0.5", "10.0.0.8, 10.0.0.7", proxies=["10.0.0.0/8"]), "10.0.0.8")
+        self.assertEqual(ip("10.0.0.5", None, proxies=["10.0.0.0/8"]), "10.0.0.5")
+        # only the trusted proxies' header counts
+        self.assertEqual(ip("1.2.3.4", "5.6.7.8", proxies=["10.0.0.0/8"]), "1.2.3.4")
+        self.assertEqual(ip("::1", "2001:db8::1", proxies=["::1"]), "2001:db8::1")
+
+    def test_unknown_email_is_not_hashed_once_timed(self):
+        self.login()
+        with mock.patch("accounts.hashing.pool.run") as run:
+            self.assertEqual(self.login(email="nobody@example.com").status_code, 401)
+        run.assert_not_called()
+
+    def test_outdated_hashes_are_rehashed_on_login(self):
+        CustomUser.objects.filter(pk=self.user.pk).update(password=make_password("secret", hasher="pbkdf2_sha1"))
+        self.assertEqual(self.login().status_code, 200)
+        user = CustomUser.objects.get(pk=self.user.pk)
+        self.assertTrue(user.password.startswith(get_hasher().algorithm + "$"))
+        # same password, issued tokens stay valid
+        self.assertEqual(user.token_version, self.user.token_version)
+
+    def test_failed_logins_send_the_signal(self):
+        failed = []
+
+        def receiver(sender, credentials, request, **kwargs):
+            failed.append(credentials["email"])
+
+        user_login_failed.connect(receiver)
+        self.addCleanup(user_login_failed.disconnect, receiver)
+        self.assertEqual(self.login(password="wrong").status_code, 401)
+        self.assertEqual(self.login(email="nobody@example.com").status_code, 401)
+        self.assertEqual(failed, ["reader@example.com", "nobody@example.com"])
+
+    def test_busy_hash_pool(self):
+        with mock.patch("accounts.hashing.pool.run", side_effect=HashingBusy):
+            response = self.login()
+        self.assertEqual(response.status_code, 503)
@@ -5,16 +5,25 @@ from rest_framework import status
 from .models import CustomUser
 from .serializers import RegisterSerializer, SetNewPasswordSerializer, PasswordResetRequestSerializer,UserSerializer
 from rest_framework.permissions import AllowAny,IsAuthenticated
-from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.exceptions import TokenError
+from .authentication import VERSION_CLAIM, ClaimsRefreshToken, aload_deferred, current_version, load_deferred
+from . import hashing
+from .ratelimit import check_login, client_ip
 from django.contrib.auth.tokens import PasswordResetTokenGenerator
 from django.utils.http import urlsafe_base64_encode, urlsafe_base64_decode
 from django.utils.encoding import smart_bytes, smart_str
 from django.core.mail import send_mail
 from drf_yasg.utils import swagger_auto_schema
-from django.contrib.auth import authenticate
+import logging
 import random
 from django.core.signing import TimestampSigner,BadSignature,SignatureExpired
 signer = TimestampSigner()
+logger = logging.getLogger(__name__)
+
+
+def busy_response():
+    return Response({"detail": "Server busy, try again shortly"}, status=status.HTTP_503_SERVICE_UNAVAILABLE,
+                    headers={"Retry-After": "1"})
 
 class UserViewSet(viewsets.ModelViewSet):
     queryset = CustomUser.objects.all()
@@ -22,19 +31,23 @@ class UserViewSet(viewsets.ModelViewSet):
    
     
     def get_permissions(self):
-        if self.action in ['register', 'login', 'password_reset_request_otp', 'password_reset']:
+        if self.action in ['register', 'login', 'refresh', 'password_reset_request_otp', 'password_reset']:
             return [AllowAny()]
         return [IsAuthenticated()]
 
     @action(detail=False, methods=["get"], permission_classes=[IsAuthenticated])
     def verify_token(self, request):
-        user = request.user 
+        user = load_deferred(request.user)
         user_data = UserSerializer(user).data
-        print("user_data-----------------",user_data)
         return Response({
             "valid": True,
             "user": user_data
         }, status=status.HTTP_200_OK)
+
+    async def averify_token(self, request):
+        """verify_token() for the ASGI route"""
+        user = await aload_deferred(request.user)
+        return Response({"valid": True, "user": UserSerializer(user).data}, status=status.HTTP_200_OK)
         
     @action(detail=False, methods=["post"])
     def register(self, request):
@@ -48,13 +61,18 @@ class UserViewSet(viewsets.ModelViewSet):
         is_staff = data.pop("is_staff")
 
        
+        try:
+            password = hashing.make_password(data["password"])
+        except hashing.HashingBusy:
+            return busy_response()
         user = CustomUser.objects.create_user(
             email=data["email"],
-            password=data["password"],
+            password=None,
             first_name=data.get("first_name", ""),
             last_name=data.get("last_name", ""),
             phone=data.get("phone", ""),
-            is_staff=is_staff
+            is_staff=is_staff,
+            hashed_password=password,
         )
 
         return Response({"message": "User registered successfully"}, status=status.HTTP_201_CREATED)
@@ -67,11 +85,20 @@ class UserViewSet(viewsets.ModelViewSet):
         if not email or not password:
             return Response({"detail": "Username and password are required"}, status=status.HTTP_400_BAD_REQUEST)
 
-        user = authenticate(email=email, password=password)
+        # counted before any hashing, so a credential-stuffing burst costs cache hits only
+        retry_after = check_login(email, client_ip(request))
+        if retry_after:
+            return Response({"detail": "Too many login attempts"}, status=status.HTTP_429_TOO_MANY_REQUESTS,
+                            headers={"Retry-After": str(retry_after)})
+
+        try:
+            user = hashing.authenticate(request, email, password)
+        except hashing.HashingBusy:
+            return busy_response()
         if not user:
             return Response({"detail": "Invalid credentials"}, status=status.HTTP_401_UNAUTHORIZED)
 
-        refresh = RefreshToken.for_user(user)
+        refresh = ClaimsRefreshToken.for_user(user)
         tokens = {
             "refresh": str(refresh),
             "access": str(refresh.access_token),
@@ -121,25 +148,39 @@ class UserViewSet(viewsets.ModelViewSet):
         
         try:
             value = signer.unsign(token ,max_age=300)
-            print("values-------------",value)
         except SignatureExpired:
+            logger.info("Expired password reset token for user %s", user.id)
             return Response({"detail":"OTP expired"},status = status.HTTP_400_BAD_REQUEST)
         except BadSignature:
             return Response({"detail":"Invalid token"},status=status.HTTP_400_BAD_REQUEST)
         
         user_id, corrent_otp = value.split(":")
-        print("user_id, correct_otp:-----------",user_id,corrent_otp)
         if str(user.id)!= user_id or otp!= corrent_otp:
+            logger.info("Rejected password reset OTP for user %s", user.id)
             return Response({"detail":"Invalid OTP"},status=status.HTTP_400_BAD_REQUEST)
-        user.set_password(new_password)
+        try:
+            hashing.set_password(user, new_password)
+        except hashing.HashingBusy:
+            return busy_response()
         user.save()
         return Response({"detail":"Password reset successfully"},status=status.HTTP_200_OK)
     
+    @action(detail=False, methods=["post"])
+    def refresh(self, request):
+        """A new access token for a refresh token that was not logged out"""
+        try:
+            token = ClaimsRefreshToken(request.data["refresh"])
+        except (KeyError, TokenError):
+            return Response({"detail": "Invalid or revoked token"}, status=status.HTTP_401_UNAUTHORIZED)
+        if VERSION_CLAIM in token and current_version(token["user_id"]) != token[VERSION_CLAIM]:
+            return Response({"detail": "Invalid or revoked token"}, status=status.HTTP_401_UNAUTHORIZED)
+        return Response({"access": str(token.access_token)}, status=status.HTTP_200_OK)
+
     @action(detail=False, methods=["post"])
     def logout(self, request):
         try:
             refresh_token = request.data["refresh"]
-            token = RefreshToken(refresh_token)
+            token = ClaimsRefreshToken(refresh_token)
             token.blacklist()
             return Response({"message": "Logout successful"}, status=status.HTTP_205_RESET_CONTENT)
         except Exception:
@@ -1,6 +1,21 @@
 from django.apps import AppConfig
+from django.db.models.signals import pre_migrate
+
+
+def create_extensions(using, **kwargs):
+    # pg_trgm backs the trigram indexes on Book, it must exist before they are created
+    from django.db import connections
+
+    connection = connections[using]
+    if connection.vendor == "postgresql":
+        with connection.cursor() as cursor:
+            cursor.execute("CREATE EXTENSION IF NOT EXISTS pg_trgm")
 
 
 class AppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'bookstore'
+
+    def ready(self):
+        pre_migrate.connect(create_extensions, sender=self)
+        from . import signals  # noqa: F401
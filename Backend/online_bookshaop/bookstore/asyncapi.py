@@ -0,0 +1,111 @@
+# bookstore/asyncapi.py
+"""
+Async routes for the hot read endpoints.
+
+Under ASGI, ``AsgiRoutesMiddleware`` resolves requests against ASGI_URLCONF,
+which puts ``async_route()`` views in front of the regular URLconf. Such a view
+runs a DRF viewset's GET action as a coroutine (the viewset's ``a<action>``
+method, e.g. ``alist``) so a request waiting on the database or the cache does
+not hold a worker thread. Authentication is awaited too, through the
+authenticators' ``aauthenticate()`` when they have one. Everything else -
+other methods, and non-JSON renderers such as the browsable API - is handed to
+the sync view of the regular URLconf, so both stacks answer the same.
+
+Under WSGI nothing changes: the middleware is a no-op there.
+"""
+from asgiref.sync import iscoroutinefunction, sync_to_async
+from django.conf import settings
+from django.http import HttpResponse
+from django.urls import resolve
+from django.utils.decorators import sync_and_async_middleware
+from django.views.decorators.csrf import csrf_exempt
+from rest_framework.exceptions import APIException
+from rest_framework.renderers import JSONRenderer
+from rest_framework.response import Response
+
+READ_METHODS = ("GET", "HEAD")
+
+
+@sync_and_async_middleware
+def AsgiRoutesMiddleware(get_response):
+    if not iscoroutinefunction(get_response):
+        return get_response
+
+    async def middleware(request):
+        request.urlconf = settings.ASGI_URLCONF
+        return await get_response(request)
+
+    return middleware
+
+
+async def authenticate(request):
+    """Request._authenticate() with the authenticators awaited"""
+    for authenticator in request.authenticators:
+        try:
+            if hasattr(authenticator, "aauthenticate"):
+                user_auth = await authenticator.aauthenticate(request)
+            else:
+                user_auth = await sync_to_async(authenticator.authenticate)(request)
+        except APIException:
+            request._not_authenticated()
+            raise
+        if user_auth is not None:
+            request._authenticator = authenticator
+            request.user, request.auth = user_auth
+            return
+    request._not_authenticated()
+
+
+def plain(response):
+    """The rendered DRF response as an HttpResponse, so the handler does not render it again on a thread"""
+    if not isinstance(response, Response):
+        # 304s
+        return response
+    plain_response = HttpResponse(response.rendered_content, status=response.status_code)
+    if "Content-Type" not in response:
+        del plain_response["Content-Type"]
+    for name, value in response.items():
+        plain_response[name] = value
+    return plain_response
+
+
+async def delegate(request):
+    """Answer with the view the regular URLconf has for this path"""
+    match = resolve(request.path_info, urlconf=settings.ROOT_URLCONF)
+    return await sync_to_async(match.func)(request, *match.args, **match.kwargs)
+
+
+def async_route(viewset_class, action, **initkwargs):
+    """A view running ``viewset_class.a<action>()`` for GET/HEAD, like ``as_view({"get": action})``"""
+    # what the router passes for an @action
+    initkwargs = {**getattr(getattr(viewset_class, action), "kwargs", {}), **initkwargs}
+
+    @csrf_exempt
+    async def view(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await delegate(request)
+
+        self = viewset_class(**initkwargs)
+        self.action_map = {"get": action, "head": action}
+        self.args, self.kwargs = args, kwargs
+        request = self.initialize_request(request, *args, **kwargs)
+        self.request = request
+        self.headers = self.default_response_headers
+        try:
+            self.format_kwarg = self.get_format_suffix(**kwargs)
+            request.accepted_renderer, request.accepted_media_type = self.perform_content_negotiation(request)
+            if not isinstance(request.accepted_renderer, JSONRenderer):
+                return await delegate(request._request)
+            request.version, request.versioning_scheme = self.determine_version(request, *args, **kwargs)
+            await authenticate(request)
+            self.check_permissions(request)
+            self.check_throttles(request)
+            response = await getattr(self, "a" + action)(request, *args, **kwargs)
+        except Exception as exc:
+            response = self.handle_exception(exc)
+        response = self.finalize_response(request, response, *args, **kwargs)
+        return plain(response)
+
+    view.cls = viewset_class
+    view.actions = {"get": action}
+    return view
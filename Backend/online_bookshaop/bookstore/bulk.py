@@ -0,0 +1,124 @@
+# bookstore/bulk.py
+"""
+Bulk create/upsert for list payloads posted to a model viewset.
+
+Rows are validated in Python only: the serializer used here must not query
+the database per row (no ``PrimaryKeyRelatedField``, no unique validators).
+Foreign keys and unique values are then checked for the whole payload with one
+query each, and the valid rows are written with ``bulk_create`` in batches.
+A bad row is reported in its result and does not reject the rest.
+"""
+from django.db import transaction
+from rest_framework import serializers, status
+from rest_framework.response import Response
+
+from .cache import bump_catalog_version
+
+
+class BulkCreateMixin:
+    """
+    ``create`` accepting a list of rows. Existing ``bulk_unique_field`` values
+    are reported as errors, or updated with the fields the posted row carries when
+    ``?upsert=true``.
+    """
+
+    bulk_serializer_class = None
+    bulk_unique_field = None
+    bulk_batch_size = 1000
+    bulk_max_rows = 10000
+
+    def create(self, request, *args, **kwargs):
+        if not isinstance(request.data, list):
+            return super().create(request, *args, **kwargs)
+        if len(request.data) > self.bulk_max_rows:
+            return Response(
+                {"detail": f"At most {self.bulk_max_rows} rows per request"},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        upsert = request.query_params.get("upsert") in ("1", "true")
+        results = self.bulk_write(request.data, upsert)
+        counts = {outcome: sum(1 for result in results if result["status"] == outcome) for outcome in ("created", "updated", "error")}
+        if not counts["error"]:
+            code = status.HTTP_201_CREATED
+        elif counts["error"] == len(results):
+            code = status.HTTP_400_BAD_REQUEST
+        else:
+            code = status.HTTP_207_MULTI_STATUS
+        return Response({**counts, "results": results}, status=code)
+
+    def bulk_write(self, rows, upsert=False):
+        child = self.bulk_serializer_class(context=self.get_serializer_context())
+        results, valid = [], []
+        for index, row in enumerate(rows):
+            try:
+                valid.append((index, child.run_validation(row)))
+                results.append(None)
+            except serializers.ValidationError as exc:
+                results.append({"index": index, "status": "error", "errors": exc.detail})
+
+        for index, errors in self.bulk_check(valid).items():
+            results[index] = {"index": index, "status": "error", "errors": errors}
+        valid = [(index, attrs) for index, attrs in valid if results[index] is None]
+
+        field = self.bulk_unique_field
+        values = [attrs[field] for _, attrs in valid]
+        model = self.bulk_serializer_class.Meta.model
+        existing = set(model.objects.filter(**{f"{field}__in": values}).values_list(field, flat=True))
+        seen, objs = set(), []
+        for index, attrs in valid:
+            value = attrs[field]
+            if value in seen or (value in existing and not upsert):
+                message = f"{model._meta.verbose_name} with this {field} already exists."
+                results[index] = {"index": index, "status": "error", "errors": {field: [message]}}
+                continue
+            seen.add(value)
+            objs.append((index, model(**attrs)))
+
+        if objs:
+            written = [obj for _, obj in objs]
+            with transaction.atomic():
+                self.bulk_writing(written, existing)
+                for update_fields, group in self.bulk_groups(objs, valid, upsert):
+                    options = {}
+                    if update_fields is not None:
+                        options = {"update_conflicts": True, "unique_fields": [field], "update_fields": update_fields}
+                    model.objects.bulk_create(group, batch_size=self.bulk_batch_size, **options)
+                self.bulk_written(written, existing)
+            for index, obj in objs:
+                outcome = "updated" if getattr(obj, field) in existing else "created"
+                results[index] = {"index": index, "status": outcome, "id": obj.pk}
+        return results
+
+    def bulk_groups(self, objs, valid, upsert):
+        """
+        (update_fields, objs) per bulk_create. An upsert only overwrites the
+        fields a row sent, plus auto_now timestamps, so rows are grouped by the
+        fields they carry; a row without `stock` keeps the stored stock.
+        """
+        if not upsert:
+            return [(None, [obj for _, obj in objs])]
+        attrs_at = dict(valid)
+        model = self.bulk_serializer_class.Meta.model
+        groups = {}
+        for index, obj in objs:
+            groups.setdefault(frozenset(attrs_at[index]), []).append(obj)
+        result = []
+        for sent, group in groups.items():
+            update_fields = [
+                f.name for f in model._meta.concrete_fields
+                if f.name != self.bulk_unique_field
+                and (f.name in sent or f.attname in sent or getattr(f, "auto_now", False))
+            ]
+            result.append((update_fields, group))
+        return result
+
+    def bulk_check(self, valid):
+        """{index: errors} for validated rows that fail a whole-payload check"""
+        return {}
+
+    def bulk_writing(self, objs, existing):
+        """Runs inside the transaction before the rows are written, e.g. to read the values they replace"""
+
+    def bulk_written(self, objs, existing):
+        """Side effects the skipped save() signals would have had, runs inside the transaction"""
+        transaction.on_commit(bump_catalog_version)
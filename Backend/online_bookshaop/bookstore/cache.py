@@ -0,0 +1,191 @@
+# bookstore/cache.py
+"""
+Read-through cache for catalog responses.
+
+Keys embed a catalog version counter that is bumped whenever a Book or
+Category is written, so a write invalidates every cached page at once without
+having to know which keys exist. Use a shared backend (REDIS_URL) when running
+more than one process, otherwise each process only sees its own bumps.
+
+Stock changes made by checkout go through bulk UPDATEs and do not bump the
+version, so cached stock can lag by up to CATALOG_CACHE_TIMEOUT seconds.
+"""
+import asyncio
+import functools
+import hashlib
+import inspect
+import threading
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from django.utils.cache import get_conditional_response
+from django.utils.http import parse_http_date_safe
+from rest_framework.response import Response
+
+VERSION_KEY = "catalog:version"
+# how long a request waits for another one that is already filling the same key
+LOCK_TIMEOUT = 10
+WAIT_STEP = 0.05
+
+
+class CacheStats:
+    """Per-process hit/miss counters"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.counts = {"hit": 0, "miss": 0, "wait": 0}
+
+    def incr(self, name):
+        with self.lock:
+            self.counts[name] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return dict(self.counts)
+
+
+stats = CacheStats()
+
+
+def get_cache():
+    return caches[settings.CATALOG_CACHE_ALIAS]
+
+
+def catalog_version():
+    cache = get_cache()
+    version = cache.get(VERSION_KEY)
+    if version is None:
+        cache.add(VERSION_KEY, 1, timeout=None)
+        version = cache.get(VERSION_KEY, 1)
+    return version
+
+
+def bump_catalog_version():
+    """Invalidate every cached catalog response"""
+    cache = get_cache()
+    try:
+        cache.incr(VERSION_KEY)
+    except ValueError:
+        cache.add(VERSION_KEY, 2, timeout=None)
+
+
+async def acatalog_version():
+    cache = get_cache()
+    version = await cache.aget(VERSION_KEY)
+    if version is None:
+        await cache.aadd(VERSION_KEY, 1, timeout=None)
+        version = await cache.aget(VERSION_KEY, 1)
+    return version
+
+
+def cache_key(request, view, kwargs, version=None):
+    params = sorted((key, value) for key in request.query_params for value in request.query_params.getlist(key))
+    raw = repr((request.get_host(), view.basename, view.action, sorted(kwargs.items()), params))
+    digest = hashlib.sha1(raw.encode("utf-8")).hexdigest()
+    return f"catalog:{version or catalog_version()}:{digest}"
+
+
+def cached_hit(request, entry):
+    """Rebuild the response for a cache entry, a 304 when the client's copy still matches"""
+    stats.incr("hit")
+    headers = {"X-Cache": "HIT", **entry["headers"]}
+    response = get_conditional_response(
+        request._request,
+        etag=headers.get("ETag"),
+        last_modified=parse_http_date_safe(headers.get("Last-Modified", "")),
+    )
+    if response is None:
+        response = Response(entry["data"])
+    for name, value in headers.items():
+        response[name] = value
+    return response
+
+
+def store_entry(response):
+    headers = {name: response[name] for name in ("ETag", "Last-Modified") if response.has_header(name)}
+    return {"data": response.data, "headers": headers}
+
+
+def cached_response(method):
+    """
+    Cache the serialized data of a GET view method. On a miss only one request
+    computes the response while concurrent ones for the same key wait for it.
+    Works on ``async def`` methods too.
+    """
+    if inspect.iscoroutinefunction(method):
+        return acached_response(method)
+
+    @functools.wraps(method)
+    def wrapper(self, request, *args, **kwargs):
+        if request.method != "GET" or not settings.CATALOG_CACHE_TIMEOUT:
+            return method(self, request, *args, **kwargs)
+
+        cache = get_cache()
+        key = cache_key(request, self, kwargs)
+        entry = cache.get(key)
+        if entry is not None:
+            return cached_hit(request, entry)
+
+        lock_key = key + ":lock"
+        if not cache.add(lock_key, 1, timeout=LOCK_TIMEOUT):
+            stats.incr("wait")
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                time.sleep(WAIT_STEP)
+                entry = cache.get(key)
+                if entry is not None:
+                    return cached_hit(request, entry)
+                if cache.get(lock_key) is None:
+                    break
+
+        stats.incr("miss")
+        try:
+            response = method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                cache.set(key, store_entry(response), timeout=settings.CATALOG_CACHE_TIMEOUT)
+        finally:
+            cache.delete(lock_key)
+        response["X-Cache"] = "MISS"
+        return response
+
+    return wrapper
+
+
+def acached_response(method):
+    """cached_response() for coroutine methods, sharing the keys of the sync views"""
+
+    @functools.wraps(method)
+    async def wrapper(self, request, *args, **kwargs):
+        if request.method != "GET" or not settings.CATALOG_CACHE_TIMEOUT:
+            return await method(self, request, *args, **kwargs)
+
+        cache = get_cache()
+        key = cache_key(request, self, kwargs, version=await acatalog_version())
+        entry = await cache.aget(key)
+        if entry is not None:
+            return cached_hit(request, entry)
+
+        lock_key = key + ":lock"
+        if not await cache.aadd(lock_key, 1, timeout=LOCK_TIMEOUT):
+            stats.incr("wait")
+            deadline = time.monotonic() + LOCK_TIMEOUT
+            while time.monotonic() < deadline:
+                await asyncio.sleep(WAIT_STEP)
+                entry = await cache.aget(key)
+                if entry is not None:
+                    return cached_hit(request, entry)
+                if await cache.aget(lock_key) is None:
+                    break
+
+        stats.incr("miss")
+        try:
+            response = await method(self, request, *args, **kwargs)
+            if response.status_code == 200:
+                await cache.aset(key, store_entry(response), timeout=settings.CATALOG_CACHE_TIMEOUT)
+        finally:
+            await cache.adelete(lock_key)
+        response["X-Cache"] = "MISS"
+        return response
+
+    return wrapper
@@ -0,0 +1,152 @@
+# bookstore/conditional.py
+"""
+ETag / Last-Modified support for read endpoints.
+
+Validators are built from ``updated_at`` columns (one row, the rows of a page,
+or a MAX/COUNT aggregate over a queryset) so a matching ``If-None-Match`` or
+``If-Modified-Since`` is answered with 304 before anything is serialized.
+Lists only get an ETag: the newest ``updated_at`` does not move when a row is
+deleted, so ``Last-Modified`` would answer 304 for a list that lost rows.
+
+``alist()``/``aretrieve()`` are the same handlers on the async ORM, served by
+the ASGI routes (bookstore/asyncapi.py).
+"""
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, Max
+from django.http import Http404
+from django.shortcuts import aget_object_or_404
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from rest_framework.response import Response
+
+
+def make_etag(*parts):
+    digest = hashlib.sha1(repr(parts).encode("utf-8")).hexdigest()
+    return f'W/"{digest}"'
+
+
+def latest(*values):
+    values = [value for value in values if value is not None]
+    return max(values) if values else None
+
+
+def not_modified(request, etag, last_modified=None):
+    """A 304 response when the client's validators still match, otherwise None"""
+    timestamp = int(last_modified.timestamp()) if last_modified else None
+    return get_conditional_response(request._request, etag=etag, last_modified=timestamp)
+
+
+def set_validators(response, etag, last_modified=None):
+    response["ETag"] = etag
+    if last_modified:
+        response["Last-Modified"] = http_date(last_modified.timestamp())
+    return response
+
+
+def request_etag(request, parts):
+    # the host and full path matter too: bodies carry absolute URLs and differ per page/filter
+    return make_etag(request.get_host(), request.get_full_path(), parts)
+
+
+class ConditionalGetMixin:
+    """
+    Conditional list/retrieve for model viewsets whose models carry ``updated_at``.
+    Override the ``*_validators`` hooks when the response also depends on
+    related rows.
+    """
+
+    def object_validators(self, obj):
+        return (obj.pk, obj.updated_at), obj.updated_at
+
+    def rows_validators(self, rows):
+        updated = latest(*(row.updated_at for row in rows))
+        return [(row.pk, row.updated_at) for row in rows], updated
+
+    def validator_aggregates(self):
+        return {"count": Count("pk"), "updated": Max("updated_at")}
+
+    def aggregate_validators(self, aggregate):
+        return (aggregate["count"], aggregate["updated"]), aggregate["updated"]
+
+    def queryset_validators(self, queryset):
+        return self.aggregate_validators(queryset.order_by().aggregate(**self.validator_aggregates()))
+
+    async def aqueryset_validators(self, queryset):
+        return self.aggregate_validators(await queryset.order_by().aaggregate(**self.validator_aggregates()))
+
+    def list(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            parts, _ = self.rows_validators(page)
+        else:
+            parts, _ = self.queryset_validators(queryset)
+        etag = request_etag(request, parts)
+        # ETag only, see the module docstring
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer(queryset, many=True)
+            response = Response(serializer.data)
+        return set_validators(response, etag)
+
+    def retrieve(self, request, *args, **kwargs):
+        instance = self.get_object()
+        parts, updated = self.object_validators(instance)
+        etag = request_etag(request, parts)
+        response = not_modified(request, etag, updated)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), etag, updated)
+
+    async def aget_object(self):
+        queryset = self.filter_queryset(self.get_queryset())
+        lookup_url_kwarg = self.lookup_url_kwarg or self.lookup_field
+        try:
+            obj = await aget_object_or_404(queryset, **{self.lookup_field: self.kwargs[lookup_url_kwarg]})
+        except (TypeError, ValueError, ValidationError):
+            # like rest_framework.generics.get_object_or_404(), a malformed pk is a 404
+            raise Http404
+        self.check_object_permissions(self.request, obj)
+        return obj
+
+    async def alist(self, request, *args, **kwargs):
+        queryset = self.filter_queryset(self.get_queryset())
+        # the paginator has to split paginate_queryset() into page_queryset() and set_page()
+        page_query = self.paginator.page_queryset(queryset, request) if self.paginator is not None else None
+        page = None
+        if page_query is not None:
+            page = self.paginator.set_page([row async for row in page_query])
+            parts, _ = self.rows_validators(page)
+        else:
+            parts, _ = await self.aqueryset_validators(queryset)
+        etag = request_etag(request, parts)
+        response = not_modified(request, etag)
+        if response is not None:
+            return response
+
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            response = self.get_paginated_response(serializer.data)
+        else:
+            serializer = self.get_serializer([row async for row in queryset], many=True)
+            response = Response(serializer.data)
+        return set_validators(response, etag)
+
+    async def aretrieve(self, request, *args, **kwargs):
+        instance = await self.aget_object()
+        parts, updated = self.object_validators(instance)
+        etag = request_etag(request, parts)
+        response = not_modified(request, etag, updated)
+        if response is not None:
+            return response
+        serializer = self.get_serializer(instance)
+        return set_validators(Response(serializer.data), etag, updated)
@@ -0,0 +1,145 @@
+# bookstore/covers.py
+"""
+Resized and re-encoded cover variants.
+
+Every uploaded cover is turned into a few fixed widths in WebP, AVIF (when the
+installed Pillow can encode it) and JPEG. Variants are stored under the SHA-256
+of their bytes, so identical covers share files, and the names are kept in
+``Book.cover_variants``:
+
+    {"source": "<cover_image name>", "variants": {"webp": [[160, "<name>"], ...], ...}}
+
+The work runs off the request path on a background thread fed by a local queue;
+``manage.py build_cover_variants`` backfills existing covers.
+"""
+import hashlib
+import io
+import logging
+import queue
+import threading
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import close_old_connections
+from django.db.models.functions import Now
+from PIL import Image, ImageOps, features
+
+from .cache import bump_catalog_version
+from .models import Book
+
+logger = logging.getLogger(__name__)
+
+# the first width is the list page thumbnail
+WIDTHS = (160, 320, 640)
+# format -> (Pillow encoder, extension, save options), best first
+FORMATS = {
+    "avif": ("AVIF", "avif", {"quality": 50}),
+    "webp": ("WEBP", "webp", {"quality": 75, "method": 4}),
+    "jpeg": ("JPEG", "jpg", {"quality": 80, "optimize": True, "progressive": True}),
+}
+
+
+def available_formats():
+    return [name for name in FORMATS if name == "jpeg" or features.check(name)]
+
+
+def store(content, extension):
+    """Save bytes under their content hash, reusing the file when it already exists"""
+    digest = hashlib.sha256(content).hexdigest()
+    name = f"covers/{digest[:2]}/{digest}.{extension}"
+    if not default_storage.exists(name):
+        name = default_storage.save(name, ContentFile(content))
+    return name
+
+
+def render_variants(source):
+    """{format: [[width, name], ...]} for an open cover file"""
+    image = ImageOps.exif_transpose(Image.open(source))
+    image = image.convert("RGBA" if image.mode in ("RGBA", "LA", "P") else "RGB")
+    variants = {}
+    for name in available_formats():
+        encoder, extension, options = FORMATS[name]
+        entries = []
+        for width in WIDTHS:
+            if width > image.width and entries:
+                break
+            resized = image.copy()
+            resized.thumbnail((width, width * 4), Image.LANCZOS)
+            if encoder == "JPEG" and resized.mode == "RGBA":
+                resized = resized.convert("RGB")
+            buffer = io.BytesIO()
+            resized.save(buffer, encoder, **options)
+            entries.append([resized.width, store(buffer.getvalue(), extension)])
+        variants[name] = entries
+    return variants
+
+
+def needs_variants(book):
+    return bool(book.cover_image) and (book.cover_variants or {}).get("source") != book.cover_image.name
+
+
+def build_variants(book_id, force=False):
+    """Generate and record the variants of one book, returns False when there was nothing to do"""
+    book = Book.objects.only("id", "cover_image", "cover_variants").filter(pk=book_id).first()
+    if book is None or not book.cover_image or not (force or needs_variants(book)):
+        return False
+    source = book.cover_image.name
+    with book.cover_image.open("rb") as handle:
+        variants = render_variants(handle)
+    # only record them if the cover was not replaced meanwhile
+    updated = Book.objects.filter(pk=book_id, cover_image=source).update(
+        cover_variants={"source": source, "variants": variants}, updated_at=Now(),
+    )
+    return bool(updated)
+
+
+def thumb_url(variants, absolute=lambda url: url):
+    """The smallest WebP (else JPEG) variant"""
+    entries = variants.get("webp") or variants.get("jpeg")
+    return absolute(default_storage.url(entries[0][1])) if entries else None
+
+
+def srcsets(variants, absolute=lambda url: url):
+    return {
+        name: ", ".join(f"{absolute(default_storage.url(path))} {width}w" for width, path in entries)
+        for name, entries in variants.items()
+    }
+
+
+class CoverWorker:
+    """One daemon thread draining a queue of book ids"""
+
+    def __init__(self):
+        self.queue = queue.Queue()
+        self.lock = threading.Lock()
+        self.thread = None
+
+    def enqueue(self, book_id):
+        if not settings.COVER_VARIANTS_ASYNC:
+            self.process(book_id)
+            return
+        with self.lock:
+            if self.thread is None or not self.thread.is_alive():
+                self.thread = threading.Thread(target=self.run, name="cover-variants", daemon=True)
+                self.thread.start()
+        self.queue.put(book_id)
+
+    def run(self):
+        while True:
+            book_id = self.queue.get()
+            try:
+                self.process(book_id)
+            finally:
+                close_old_connections()
+                self.queue.task_done()
+
+    def process(self, book_id):
+        try:
+            if build_variants(book_id):
+                bump_catalog_version()
+        except Exception:
+            logger.exception("Could not build cover variants for book %s", book_id)
+
+
+worker = CoverWorker()
@@ -0,0 +1,272 @@
+# bookstore/facets.py
+"""
+Faceted-navigation counts.
+
+Books per (category, price bucket, in stock, facet value) live in
+``BookFacetCount`` and are shifted by the Book signals on every save/delete, so
+selections by category, price and stock are answered by summing stored rows
+instead of grouping the catalog. A price bound that falls inside a bucket only
+groups the books of that edge bucket live. An author filter has no stored
+dimension: it is grouped live over every matching book, and nothing bounds how
+many that is. Bulk writes skip the signals and shift the counts with
+``replace_keys()`` instead, checkout does the same for books it sells out, and
+imports call ``rebuild()``.
+"""
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import Case, CharField, Count, F, Q, Sum, Value, When
+
+from .models import Book, BookFacetCount, Category
+
+# the price facet is read from the price_bucket column of the format rows
+FACETS = ("author", "language", "format")
+# the Book columns facet_keys() takes
+FACET_COLUMNS = ("category_id", "author", "language", "format", "price", "stock")
+# upper bounds of the price buckets, the last one is open ended
+PRICE_EDGES = (100, 250, 500, 1000)
+TOP_VALUES = 20
+LIVE_FILTERS = ("author",)
+# smallest step between two prices
+CENT = Decimal("0.01")
+
+
+def price_labels():
+    bounds = (0,) + PRICE_EDGES
+    return [f"{low}-{high}" for low, high in zip(bounds, PRICE_EDGES)] + [f"{PRICE_EDGES[-1]}+"]
+
+
+def price_bounds():
+    """(label, low, high) per bucket, high is None for the open ended one"""
+    lows = (0,) + PRICE_EDGES
+    highs = PRICE_EDGES + (None,)
+    return list(zip(price_labels(), lows, highs))
+
+
+def price_bucket(price):
+    labels = price_labels()
+    for edge, label in zip(PRICE_EDGES, labels):
+        if price < Decimal(edge):
+            return label
+    return labels[-1]
+
+
+def price_bucket_expression():
+    labels = price_labels()
+    return Case(
+        *(When(price__lt=edge, then=Value(label)) for edge, label in zip(PRICE_EDGES, labels)),
+        default=Value(labels[-1]),
+        output_field=CharField(),
+    )
+
+
+def facet_keys(category_id, author, language, book_format, price, stock):
+    """The (category_id, price_bucket, in_stock, facet, value) rows one book counts towards"""
+    bucket, in_stock = price_bucket(price), stock > 0
+    values = (author, language, book_format)
+    return [(category_id, bucket, in_stock, facet, value) for facet, value in zip(FACETS, values)]
+
+
+def book_keys(book):
+    return facet_keys(book.category_id, book.author, book.language, book.format, book.price, book.stock)
+
+
+def stored_keys(queryset):
+    """The keys of the books in `queryset` as stored, one per book and facet"""
+    return [key for row in queryset.values_list(*FACET_COLUMNS) for key in facet_keys(*row)]
+
+
+def replace_keys(old, new):
+    """Take books out of the `old` keys and into the `new` ones with a single statement"""
+    deltas = {}
+    for key in old:
+        deltas[key] = deltas.get(key, 0) - 1
+    for key in new:
+        deltas[key] = deltas.get(key, 0) + 1
+    BookFacetCount.objects.add(deltas)
+
+
+def add_keys(keys):
+    BookFacetCount.objects.add({key: 1 for key in keys})
+
+
+def remove_keys(keys):
+    """Take one book out of its rows with a single UPDATE"""
+    if not keys:
+        return
+    condition = Q()
+    for category_id, bucket, in_stock, facet, value in keys:
+        condition |= Q(category_id=category_id, price_bucket=bucket, in_stock=in_stock, facet=facet, value=value)
+    BookFacetCount.objects.filter(condition).update(count=F("count") - 1)
+
+
+def sold_out(books, quantities):
+    """Move the books that `quantities` takes to zero stock into their out of stock rows"""
+    old, new = [], []
+    for book_id, quantity in quantities.items():
+        book = books[book_id]
+        if book.stock > 0 and book.stock - quantity <= 0:
+            keys = book_keys(book)
+            old += keys
+            new += [(category_id, bucket, False, facet, value) for category_id, bucket, _, facet, value in keys]
+    replace_keys(old, new)
+
+
+def rebuild():
+    """Recount everything from Book, one GROUP BY per facet"""
+    dimensions = {
+        "price_bucket": price_bucket_expression(),
+        "in_stock": Case(When(stock__gt=0, then=Value(True)), default=Value(False)),
+    }
+    with transaction.atomic():
+        BookFacetCount.objects.all().delete()
+        for facet in FACETS:
+            rows = (
+                Book.objects.order_by()
+                .values("category_id", facet_value=F(facet), **dimensions)
+                .annotate(count=Count("id"))
+            )
+            BookFacetCount.objects.bulk_create(
+                (BookFacetCount(category_id=row["category_id"], price_bucket=row["price_bucket"],
+                                in_stock=row["in_stock"], facet=facet, value=row["facet_value"], count=row["count"])
+                 for row in rows.iterator(chunk_size=5000)),
+                batch_size=5000,
+            )
+
+
+def entries(counts):
+    return [{"value": value, "count": count} for value, count in ordered(counts)]
+
+
+def ordered(counts, limit=None):
+    rows = sorted(((value, count) for value, count in counts.items() if count > 0), key=lambda row: (-row[1], row[0]))
+    return rows[:limit] if limit else rows
+
+
+def ordered_prices(counts):
+    return [{"value": label, "count": counts[label]} for label in price_labels() if counts.get(label)]
+
+
+def category_entries(counts):
+    names = dict(Category.objects.values_list("pk", "name"))
+    return [{"value": pk, "label": names.get(pk), "count": count} for pk, count in ordered(counts)]
+
+
+def result(counts):
+    return {
+        "category": category_entries(counts["category"]),
+        "author": entries(counts["author"]),
+        "language": entries(counts["language"]),
+        "format": entries(counts["format"]),
+        "price": ordered_prices(counts["price"]),
+        "total": sum(counts["format"].values()),
+    }
+
+
+def stored_rows(buckets=None, in_stock=None):
+    rows = BookFacetCount.objects.filter(count__gt=0).order_by()
+    if buckets is not None:
+        rows = rows.filter(price_bucket__in=buckets)
+    if in_stock is not None:
+        rows = rows.filter(in_stock=in_stock)
+    return rows
+
+
+def stored_counts(category_id, buckets=None, in_stock=None):
+    """
+    Counts summed from BookFacetCount, limited to the price `buckets` and
+    stock state when given. Authors are cut to the top TOP_VALUES.
+    """
+    rows = stored_rows(buckets, in_stock)
+    # every book has exactly one format, so format rows sum to books per category and bucket
+    formats = rows.filter(facet="format")
+    per_category = formats.values("category_id").annotate(n=Sum("count"))
+    selected = rows.filter(category_id=category_id) if category_id else rows
+    grouped = selected.values("facet", "value").annotate(n=Sum("count"))
+    authors = grouped.filter(facet="author").order_by("-n", "value")[:TOP_VALUES]
+    prices = selected.filter(facet="format").values("price_bucket").annotate(n=Sum("count"))
+
+    counts = {facet: {} for facet in ("category", "author", "language", "format", "price")}
+    counts["category"] = {row["category_id"]: row["n"] for row in per_category}
+    counts["author"] = {row["value"]: row["n"] for row in authors}
+    for row in grouped.exclude(facet="author"):
+        counts[row["facet"]][row["value"]] = row["n"]
+    counts["price"] = {row["price_bucket"]: row["n"] for row in prices}
+    return counts
+
+
+def live_counts(queryset, unfiltered_category_queryset, authors=TOP_VALUES):
+    """Counts grouped from Book; `authors=None` keeps every author"""
+    def grouped(qs, expression, limit=None):
+        qs = qs.order_by().values(facet_value=expression).annotate(n=Count("id")).order_by("-n", "facet_value")
+        return {row["facet_value"]: row["n"] for row in (qs[:limit] if limit else qs)}
+
+    return {
+        "category": grouped(unfiltered_category_queryset, F("category_id")),
+        "author": grouped(queryset, F("author"), authors),
+        "language": grouped(queryset, F("language")),
+        "format": grouped(queryset, F("format")),
+        "price": grouped(queryset, price_bucket_expression()),
+    }
+
+
+def split_buckets(price_min, price_max):
+    """
+    The buckets a price range covers whole, and the ones it only cuts into.
+    Prices are in cents, so a bucket ending at `high` is covered by a
+    maximum of `high` - 0.01.
+    """
+    whole, partial = [], []
+    for label, low, high in price_bounds():
+        if (price_max is not None and low > price_max) or (price_min is not None and high is not None and high <= price_min):
+            continue
+        covered = (price_min is None or low >= price_min) and (
+            price_max is None or (high is not None and high - CENT <= price_max)
+        )
+        (whole if covered else partial).append((label, low, high))
+    return whole, partial
+
+
+def merged(stored, live, category_id, buckets, in_stock):
+    """Stored counts for the whole buckets plus live counts for the edge buckets"""
+    counts = {facet: dict(stored[facet]) for facet in stored}
+    for facet in ("category", "language", "format", "price"):
+        for value, count in live[facet].items():
+            counts[facet][value] = counts[facet].get(value, 0) + count
+    # the top authors are among the stored top and the authors of the edge buckets
+    candidates = set(stored["author"]) | set(live["author"])
+    rows = stored_rows(buckets, in_stock).filter(facet="author", value__in=candidates)
+    if category_id:
+        rows = rows.filter(category_id=category_id)
+    authors = {row["value"]: row["n"] for row in rows.values("value").annotate(n=Sum("count"))}
+    for value, count in live["author"].items():
+        authors[value] = authors.get(value, 0) + count
+    counts["author"] = dict(ordered(authors, TOP_VALUES))
+    return counts
+
+
+def facet_counts(filterset):
+    """
+    Counts for the selection of a bound, valid BookFilter. The category facet
+    ignores the selected category so the other categories stay visible.
+    """
+    cleaned = filterset.form.cleaned_data
+    params = filterset.data.copy()
+    params.pop("category", None)
+    unfiltered_category = type(filterset)(params, queryset=filterset.queryset).qs
+    if any(cleaned.get(name) not in (None, "") for name in LIVE_FILTERS):
+        return result(live_counts(filterset.qs, unfiltered_category))
+
+    category_id = cleaned.get("category")
+    in_stock = cleaned.get("in_stock")
+    price_min, price_max = cleaned.get("price_min"), cleaned.get("price_max")
+    whole, partial = split_buckets(price_min, price_max)
+    buckets = None if price_min is None and price_max is None else [label for label, _, _ in whole]
+    stored = stored_counts(category_id, buckets, in_stock)
+    if not partial:
+        return result(stored)
+    edges = Q()
+    for _, low, high in partial:
+        edges |= Q(price__gte=low, price__lt=high) if high is not None else Q(price__gte=low)
+    live = live_counts(filterset.qs.filter(edges), unfiltered_category.filter(edges), authors=None)
+    return result(merged(stored, live, category_id, buckets, in_stock))
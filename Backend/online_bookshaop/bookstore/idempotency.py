@@ -0,0 +1,154 @@
+# bookstore/idempotency.py
+"""
+``Idempotency-Key`` support for mutations.
+
+The first request with a key claims it in the cache, runs, and stores its
+status and body together with a fingerprint of the request (method, path,
+query and body). Retries with the same key get the stored response back
+(marked ``Idempotent-Replayed: true``) without running the view, so a retried
+checkout cannot create a second order. A retry arriving while the first
+request is still running waits for it, up to IDEMPOTENCY_WAIT seconds, and
+then gets 409. A key whose entry keeps vanishing between add() and get() is
+retried CLAIM_ATTEMPTS times with a growing sleep, then also gets 409. Reusing
+a key for a different request is a 422.
+
+Keys are scoped to the user. Server errors are not stored, so they can be
+retried; 429 neither. Requests without the header are not affected.
+"""
+import hashlib
+import time
+
+from django.conf import settings
+from django.core.cache import caches
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.response import Response
+
+HEADER = "Idempotency-Key"
+IN_FLIGHT = "in-flight"
+# how long a claim survives a worker that died before storing its response
+CLAIM_TIMEOUT = 60
+POLL_INTERVAL = 0.05
+# tries at a key whose entry disappears as soon as add() fails, e.g. under a cache evicting it
+CLAIM_ATTEMPTS = 5
+
+
+class InvalidIdempotencyKey(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = f"{HEADER} must be at most 255 characters"
+
+
+class IdempotencyKeyReused(APIException):
+    status_code = status.HTTP_422_UNPROCESSABLE_ENTITY
+    default_detail = f"{HEADER} was already used for a different request"
+
+
+class IdempotencyConflict(APIException):
+    status_code = status.HTTP_409_CONFLICT
+    default_detail = f"A request with this {HEADER} is still being processed"
+
+
+class Replay(Exception):
+    def __init__(self, response):
+        self.response = response
+
+
+def store():
+    return caches[settings.IDEMPOTENCY_CACHE_ALIAS]
+
+
+def cache_key(request, key):
+    scope = request.user.pk if request.user.is_authenticated else "anonymous"
+    digest = hashlib.sha256(f"{scope}:{key}".encode()).hexdigest()
+    return f"idempotency:{digest}"
+
+
+def fingerprint(request):
+    digest = hashlib.sha256()
+    for part in (request.method, request.path, request.META.get("QUERY_STRING", "")):
+        digest.update(part.encode() + b"\0")
+    digest.update(request.body)
+    return digest.hexdigest()
+
+
+def replay(entry):
+    response = Response(entry["data"], status=entry["status"])
+    response["Idempotent-Replayed"] = "true"
+    return response
+
+
+def claim(request, key):
+    """
+    Claim `key` for this request. Returns (cache key, fingerprint) when the
+    request should run, raises Replay with the stored response for a completed
+    duplicate.
+    """
+    if len(key) > 255:
+        raise InvalidIdempotencyKey
+    cache = store()
+    name = cache_key(request, key)
+    request_print = fingerprint(request)
+    deadline = time.monotonic() + settings.IDEMPOTENCY_WAIT
+    vanished = 0
+    while True:
+        if cache.add(name, {"state": IN_FLIGHT, "fingerprint": request_print}, CLAIM_TIMEOUT):
+            return name, request_print
+        entry = cache.get(name)
+        if entry is None:
+            # the first request failed or its claim expired, try again after a short backoff
+            vanished += 1
+            if vanished >= CLAIM_ATTEMPTS or time.monotonic() >= deadline:
+                raise IdempotencyConflict
+            time.sleep(POLL_INTERVAL * 2 ** (vanished - 1))
+            continue
+        if entry["fingerprint"] != request_print:
+            raise IdempotencyKeyReused
+        if entry["state"] != IN_FLIGHT:
+            raise Replay(replay(entry))
+        if time.monotonic() >= deadline:
+            raise IdempotencyConflict
+        time.sleep(POLL_INTERVAL)
+
+
+def complete(claimed, response):
+    name, request_print = claimed
+    cache = store()
+    if response.status_code >= 500 or response.status_code == status.HTTP_429_TOO_MANY_REQUESTS:
+        cache.delete(name)
+        return
+    cache.set(
+        name,
+        {"state": "done", "fingerprint": request_print, "status": response.status_code, "data": getattr(response, "data", None)},
+        settings.IDEMPOTENCY_TTL,
+    )
+
+
+class IdempotencyMixin:
+    """Honours ``Idempotency-Key`` on the viewset's ``idempotent_methods``"""
+
+    idempotent_methods = ("POST", "PATCH")
+
+    def initial(self, request, *args, **kwargs):
+        self.idempotency_claim = None
+        super().initial(request, *args, **kwargs)
+        key = request.headers.get(HEADER)
+        if key and request.method in self.idempotent_methods:
+            self.idempotency_claim = claim(request, key)
+
+    def handle_exception(self, exc):
+        if isinstance(exc, Replay):
+            return exc.response
+        try:
+            return super().handle_exception(exc)
+        except Exception:
+            # unhandled, finalize_response() will not run: free the key for a retry
+            if getattr(self, "idempotency_claim", None):
+                store().delete(self.idempotency_claim[0])
+                self.idempotency_claim = None
+            raise
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        if getattr(self, "idempotency_claim", None):
+            complete(self.idempotency_claim, response)
+            self.idempotency_claim = None
+        return super().finalize_response(request, response, *args, **kwargs)
@@ -0,0 +1,259 @@
+# bookstore/instrumentation.py
+"""
+Per-request performance instrumentation.
+
+``InstrumentationMiddleware`` times every request and, per view, accumulates
+latency, SQL query count and time, time spent building serializer data and
+response size. The numbers are kept in process memory and exposed in the
+Prometheus text format by ``metrics_view`` (staff only); with several worker
+processes every process reports its own counters. Serializer time is measured
+by serializers that include ``TimedSerializerMixin``. With PERF_SERVER_TIMING
+on, each response also carries the request's numbers in a Server-Timing header.
+
+A request that runs the same SQL shape (literals stripped) PERF_N_PLUS_ONE_THRESHOLD
+times or more is logged as a likely N+1 and counted. A PERF_PROFILE_SAMPLE_RATE
+fraction of requests is run under cProfile and dumped to PERF_PROFILE_DIR.
+
+Queries are counted on every database alias, replicas included. Under ASGI the
+middleware runs async; queries are then counted on the thread Django runs the
+request's ORM calls on, and requests are not profiled.
+"""
+import contextvars
+import cProfile
+import logging
+import random
+import re
+import threading
+import time
+from collections import Counter, defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connections
+from django.http import HttpResponse
+from rest_framework.decorators import api_view, permission_classes
+from rest_framework.permissions import IsAdminUser
+
+from .cache import stats as cache_stats
+
+logger = logging.getLogger(__name__)
+
+# latency histogram buckets, seconds
+BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+LITERAL_RE = re.compile(r"'(?:[^']|'')*'|\b\d+(?:\.\d+)?\b")
+IN_LIST_RE = re.compile(r"\((?:\s*\?\s*,)+\s*\?\s*\)")
+
+current = contextvars.ContextVar("request_metrics", default=None)
+
+
+def sql_shape(sql):
+    """The SQL with its literals replaced by ?, so repeated lookups compare equal"""
+    return IN_LIST_RE.sub("(?)", LITERAL_RE.sub("?", sql))
+
+
+class RequestMetrics:
+    def __init__(self):
+        self.queries = 0
+        self.query_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.shapes = Counter()
+
+    def __call__(self, execute, sql, params, many, context):
+        """connection.execute_wrapper hook"""
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.query_time += time.perf_counter() - started
+            self.queries += 1
+            self.shapes[sql_shape(sql)] += 1
+
+    def repeated_shapes(self, threshold):
+        return [(shape, count) for shape, count in self.shapes.items() if count >= threshold]
+
+
+class Registry:
+    """Thread-safe per-view aggregates"""
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.requests = Counter()  # (view, method, status) -> count
+        self.buckets = defaultdict(lambda: [0] * len(BUCKETS))  # view -> cumulative bucket counts
+        self.sums = defaultdict(lambda: defaultdict(float))  # view -> metric -> total
+        self.n_plus_one = Counter()  # view -> flagged requests
+
+    def observe(self, view, method, status, seconds, metrics, size, flagged):
+        with self.lock:
+            self.requests[(view, method, status)] += 1
+            buckets = self.buckets[view]
+            for index, bound in enumerate(BUCKETS):
+                if seconds <= bound:
+                    buckets[index] += 1
+            totals = self.sums[view]
+            totals["count"] += 1
+            totals["seconds"] += seconds
+            totals["queries"] += metrics.queries
+            totals["query_seconds"] += metrics.query_time
+            totals["serializer_seconds"] += metrics.serializer_time
+            totals["response_bytes"] += size
+            if flagged:
+                self.n_plus_one[view] += 1
+
+    def render(self):
+        """Prometheus text exposition format"""
+        lines = []
+
+        def family(name, kind, help_text):
+            lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        with self.lock:
+            family("http_requests_total", "counter", "Requests by view, method and status")
+            for (view, method, status), count in sorted(self.requests.items()):
+                lines.append(f'http_requests_total{{view="{view}",method="{method}",status="{status}"}} {count}')
+
+            family("http_request_duration_seconds", "histogram", "Request latency by view")
+            for view, buckets in sorted(self.buckets.items()):
+                for bound, count in zip(BUCKETS, buckets):
+                    lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="{bound}"}} {count}')
+                totals = self.sums[view]
+                lines.append(f'http_request_duration_seconds_bucket{{view="{view}",le="+Inf"}} {int(totals["count"])}')
+                lines.append(f'http_request_duration_seconds_sum{{view="{view}"}} {totals["seconds"]:.6f}')
+                lines.append(f'http_request_duration_seconds_count{{view="{view}"}} {int(totals["count"])}')
+
+            for metric, name, help_text in (
+                ("queries", "db_queries_total", "SQL queries run by view"),
+                ("query_seconds", "db_query_duration_seconds_total", "Time spent in SQL by view"),
+                ("serializer_seconds", "serializer_duration_seconds_total", "Time spent building serializer data by view"),
+                ("response_bytes", "http_response_size_bytes_total", "Response body bytes by view"),
+            ):
+                family(name, "counter", help_text)
+                for view, totals in sorted(self.sums.items()):
+                    value = f"{totals[metric]:.6f}" if metric.endswith("seconds") else int(totals[metric])
+                    lines.append(f'{name}{{view="{view}"}} {value}')
+
+            family("db_n_plus_one_requests_total", "counter", "Requests that repeated one SQL shape past the threshold")
+            for view, count in sorted(self.n_plus_one.items()):
+                lines.append(f'db_n_plus_one_requests_total{{view="{view}"}} {count}')
+
+        family("catalog_cache_requests_total", "counter", "Catalog response cache lookups by result")
+        for result, count in sorted(cache_stats.snapshot().items()):
+            lines.append(f'catalog_cache_requests_total{{result="{result}"}} {count}')
+        return "\n".join(lines) + "\n"
+
+
+registry = Registry()
+
+
+class TimedSerializerMixin:
+    """Time to_representation(), only the outermost call of a request is counted"""
+
+    def to_representation(self, instance):
+        metrics = current.get()
+        if metrics is None or metrics.serializer_depth:
+            return super().to_representation(instance)
+        metrics.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return super().to_representation(instance)
+        finally:
+            metrics.serializer_time += time.perf_counter() - started
+            metrics.serializer_depth -= 1
+
+
+def view_name(request):
+    match = getattr(request, "resolver_match", None)
+    if match is None:
+        return "unresolved"
+    return match.view_name or match.route
+
+
+def wrap_queries(metrics):
+    """execute_wrapper(metrics) entered on this thread's connection of every alias, close() the result to leave"""
+    stack = ExitStack()
+    for alias in connections:
+        stack.enter_context(connections[alias].execute_wrapper(metrics))
+    return stack
+
+
+class InstrumentationMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.is_async = iscoroutinefunction(get_response)
+        if self.is_async:
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if self.is_async:
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        profile = None
+        if settings.PERF_PROFILE_SAMPLE_RATE and random.random() < settings.PERF_PROFILE_SAMPLE_RATE:
+            profile = cProfile.Profile()
+        started = time.perf_counter()
+        try:
+            with wrap_queries(metrics):
+                if profile:
+                    profile.enable()
+                try:
+                    response = self.get_response(request)
+                finally:
+                    if profile:
+                        profile.disable()
+        finally:
+            current.reset(token)
+        view = self.record(request, response, metrics, time.perf_counter() - started)
+        if profile:
+            self.dump(profile, view)
+        return response
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = current.set(metrics)
+        started = time.perf_counter()
+        # the ORM's async methods run on the request's thread-sensitive thread
+        wrapper = await sync_to_async(wrap_queries)(metrics)
+        try:
+            response = await self.get_response(request)
+        finally:
+            await sync_to_async(wrapper.close)()
+            current.reset(token)
+        self.record(request, response, metrics, time.perf_counter() - started)
+        return response
+
+    def record(self, request, response, metrics, seconds):
+        view = view_name(request)
+        repeated = metrics.repeated_shapes(settings.PERF_N_PLUS_ONE_THRESHOLD)
+        for shape, count in repeated:
+            logger.warning("Possible N+1 in %s: %d x %s", view, count, shape[:300])
+        size = 0 if response.streaming else len(response.content)
+        registry.observe(view, request.method, response.status_code, seconds, metrics, size, bool(repeated))
+        if settings.PERF_SERVER_TIMING:
+            response["Server-Timing"] = (
+                f"app;dur={seconds * 1000:.1f}, db;dur={metrics.query_time * 1000:.1f};desc=\"{metrics.queries} queries\", "
+                f"serialize;dur={metrics.serializer_time * 1000:.1f}"
+            )
+        return view
+
+    def dump(self, profile, view):
+        directory = Path(settings.PERF_PROFILE_DIR)
+        directory.mkdir(parents=True, exist_ok=True)
+        safe = re.sub(r"[^\w.-]+", "_", view)
+        profile.dump_stats(directory / f"{safe}-{time.strftime('%Y%m%d-%H%M%S')}-{random.randrange(10**6):06d}.prof")
+
+
+@api_view(["GET"])
+@permission_classes([IsAdminUser])
+def metrics_view(request):
+    """Prometheus metrics of this process"""
+    return HttpResponse(registry.render(), content_type="text/plain; version=0.0.4; charset=utf-8")
@@ -0,0 +1,47 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.http import QueryDict
+
+from bookstore import facets
+from bookstore.models import Book, Category
+from bookstore.serializers import BookFilter
+from bookstore.synthetic import seed_books
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog and compare stored facet counts with a live GROUP BY"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=1_000_000)
+        parser.add_argument("--repeat", type=int, default=10)
+
+    def timed(self, label, function, repeat):
+        timings = []
+        for _ in range(repeat):
+            started = time.perf_counter()
+            function()
+            timings.append((time.perf_counter() - started) * 1000)
+        self.stdout.write(f"{label:<40} p50 {statistics.median(timings):8.1f} ms   max {max(timings):8.1f} ms")
+
+    def counts(self, query):
+        filterset = BookFilter(QueryDict(query), queryset=Book.objects.all())
+        filterset.is_valid()
+        return facets.facet_counts(filterset)
+
+    def handle(self, *args, **options):
+        seed_books(options["books"])
+        started = time.perf_counter()
+        facets.rebuild()
+        self.stdout.write(f"{Book.objects.count()} books, facet table rebuilt in {time.perf_counter() - started:.1f}s")
+
+        repeat = options["repeat"]
+        category = Category.objects.order_by("pk").first()
+        everything = Book.objects.all()
+        self.timed("stored, whole catalog", lambda: self.counts(""), repeat)
+        self.timed("stored, one category", lambda: self.counts(f"category={category.pk}"), repeat)
+        self.timed("stored, price buckets in stock", lambda: self.counts("price_min=250&price_max=999.99&in_stock=true"), repeat)
+        self.timed("edge buckets live, price range", lambda: self.counts(f"category={category.pk}&price_min=200&price_max=300"), repeat)
+        self.timed("live, author", lambda: self.counts("author=smith"), repeat)
+        self.timed("live GROUP BY, whole catalog", lambda: facets.live_counts(everything, everything), repeat)
@@ -0,0 +1,37 @@
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+
+from bookstore.models import Book
+from bookstore.search import fuzzy_search_books, search_books
+from bookstore.synthetic import seed_books
+
+QUERIES = ("shadow", "golden crown", "dragon kin", "histor", "patel", "winter garden storm")
+TYPOS = ("dragn", "kapor", "winetr")
+
+
+class Command(BaseCommand):
+    help = "Seed a synthetic catalog and report search latency for the first page of results"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--books", type=int, default=100_000)
+        parser.add_argument("--repeat", type=int, default=20)
+        parser.add_argument("--page-size", type=int, default=20)
+
+    def handle(self, *args, **options):
+        seed_books(options["books"])
+        self.stdout.write(f"{Book.objects.count()} books in catalog")
+        queryset = Book.objects.all()
+        for label, search, terms in (("full-text", search_books, QUERIES), ("trigram", fuzzy_search_books, TYPOS)):
+            for term in terms:
+                timings = []
+                for _ in range(options["repeat"]):
+                    started = time.perf_counter()
+                    list(search(queryset, term).order_by("-rank", "-id")[:options["page_size"]])
+                    timings.append((time.perf_counter() - started) * 1000)
+                timings.sort()
+                self.stdout.write(
+                    f"{label:9} {term!r:24} p50={statistics.median(timings):7.2f}ms "
+                    f"max={timings[-1]:7.2f}ms"
+                )
@@ -0,0 +1,41 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+
+from bookstore.cache import bump_catalog_version
+from bookstore.covers import build_variants
+from bookstore.models import Book
+
+
+class Command(BaseCommand):
+    help = "Generate missing thumbnail/WebP/AVIF cover variants for existing books"
+
+    def add_arguments(self, parser):
+        # Pillow releases the GIL while resizing and encoding, so threads scale
+        parser.add_argument("--workers", type=int, default=4)
+        parser.add_argument("--force", action="store_true", help="rebuild books that already have variants")
+
+    def build(self, book_id, force):
+        try:
+            return build_variants(book_id, force=force)
+        except Exception as exc:
+            self.stderr.write(f"Book {book_id}: {exc}")
+            return False
+
+    def handle(self, *args, **options):
+        books = Book.objects.exclude(cover_image="").exclude(cover_image__isnull=True)
+        book_ids = list(books.values_list("id", flat=True))
+        started = time.perf_counter()
+        built = 0
+        with ThreadPoolExecutor(max_workers=max(options["workers"], 1)) as pool:
+            # one worker builds inline, on this thread's connection
+            mapper = pool.map if options["workers"] > 1 else map
+            for done, ok in enumerate(mapper(lambda pk: self.build(pk, options["force"]), book_ids), 1):
+                built += ok
+                if done % 100 == 0:
+                    self.stdout.write(f"... {done}/{len(book_ids)}")
+        if built:
+            bump_catalog_version()
+        elapsed = time.perf_counter() - started
+        self.stdout.write(f"Built variants for {built} of {len(book_ids)} covers in {elapsed:.1f}s")
@@ -0,0 +1,38 @@
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models.functions import Now
+
+from bookstore.cache import bump_catalog_version
+from bookstore.models import Book
+from bookstore.storage import hashed_name, is_hashed
+
+
+class Command(BaseCommand):
+    help = "Rename existing covers to content-hashed names so they can be served as immutable"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--keep-old", action="store_true", help="leave the original files in place")
+
+    def handle(self, *args, **options):
+        renamed = 0
+        books = Book.objects.exclude(cover_image="").exclude(cover_image__isnull=True).only("id", "cover_image", "cover_variants")
+        for book in books.iterator(chunk_size=500):
+            old = book.cover_image.name
+            if is_hashed(old):
+                continue
+            if not default_storage.exists(old):
+                self.stderr.write(f"Book {book.pk}: {old} is missing")
+                continue
+            with default_storage.open(old, "rb") as handle:
+                new = default_storage.save(hashed_name(old, handle), handle)
+            variants = book.cover_variants
+            if variants.get("source") == old:
+                # the variants were built from these same bytes
+                variants["source"] = new
+            Book.objects.filter(pk=book.pk, cover_image=old).update(cover_image=new, cover_variants=variants, updated_at=Now())
+            if not options["keep_old"] and not Book.objects.filter(cover_image=old).exists():
+                default_storage.delete(old)
+            renamed += 1
+        if renamed:
+            bump_catalog_version()
+        self.stdout.write(f"Renamed {renamed} covers")
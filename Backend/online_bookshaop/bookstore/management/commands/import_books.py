@@ -0,0 +1,287 @@
+import csv
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date
+from functools import partial
+from decimal import ROUND_HALF_UP, Decimal, InvalidOperation
+from pathlib import Path
+
+import requests
+from django.core.exceptions import SuspiciousFileOperation, ValidationError
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.utils.text import get_valid_filename
+
+from bookstore import covers, facets, typeahead
+from bookstore.cache import bump_catalog_version
+from bookstore.models import Book, Category
+from cart.models import Cart
+
+# every column an import may overwrite on an existing ISBN
+UPDATE_FIELDS = [
+    "title", "author", "price", "description", "category", "publisher",
+    "publication_date", "language", "pages", "stock", "rating", "format", "updated_at",
+]
+FORMATS = {"Hardcover", "Paperback", "Ebook"}
+# checked against the model field limits, a value out of range skips the row
+CHECKED_FIELDS = ("price", "rating", "pages", "stock")
+
+
+def read_jsonl(handle):
+    for line in handle:
+        line = line.strip()
+        if line:
+            yield json.loads(line)
+
+
+def read_json(handle, chunk_size=1 << 16):
+    """Stream the objects of a top-level JSON array without loading the whole file"""
+    decoder = json.JSONDecoder()
+    buffer = handle.read(chunk_size).lstrip()
+    if not buffer.startswith("["):
+        raise CommandError("JSON input must be an array of books")
+    buffer = buffer[1:]
+    while True:
+        buffer = buffer.lstrip().lstrip(",").lstrip()
+        if buffer.startswith("]"):
+            return
+        try:
+            row, end = decoder.raw_decode(buffer)
+        except json.JSONDecodeError:
+            more = handle.read(chunk_size)
+            if not more:
+                raise CommandError("Truncated JSON input")
+            buffer += more
+            continue
+        yield row
+        buffer = buffer[end:]
+        if len(buffer) < chunk_size:
+            buffer += handle.read(chunk_size)
+
+
+def read_csv(handle):
+    yield from csv.DictReader(handle)
+
+
+READERS = {".jsonl": read_jsonl, ".ndjson": read_jsonl, ".json": read_json, ".csv": read_csv}
+
+
+def clean_decimal(value, default=None, places=2):
+    """Decimal rounded to `places` like PostgreSQL would, ValueError when it is not a number"""
+    if value in (None, ""):
+        return default
+    try:
+        return Decimal(str(value)).quantize(Decimal(1).scaleb(-places), rounding=ROUND_HALF_UP)
+    except InvalidOperation:
+        raise ValueError(f"{value!r} is not a number")
+
+
+def clean_int(value):
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise ValueError(f"{value!r} is not an integer")
+
+
+def clean_date(value):
+    if value in (None, ""):
+        return None
+    try:
+        if isinstance(value, int) or str(value).isdigit():
+            return date(int(value), 1, 1)
+        return date.fromisoformat(str(value)[:10])
+    except ValueError:
+        return None
+
+
+def check_limits(book):
+    """Raises ValidationError when a CHECKED_FIELDS value does not fit its column"""
+    for name in CHECKED_FIELDS:
+        Book._meta.get_field(name).clean(getattr(book, name), book)
+
+
+def cover_name(isbn):
+    """<isbn>.jpg with anything that is not safe in a file name dropped, None when nothing is left"""
+    try:
+        return f"{get_valid_filename(isbn)}.jpg"
+    except SuspiciousFileOperation:
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream books from a JSON, JSONL or CSV file into the catalog with batched upserts on ISBN. "
+        "Progress is checkpointed after every committed batch, so a rerun resumes where it stopped."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("path")
+        parser.add_argument("--batch-size", type=int, default=1000)
+        parser.add_argument("--cover-workers", type=int, default=8, help="parallel cover downloads")
+        parser.add_argument("--covers-dir", help="read covers from this directory (<isbn>.jpg, unsafe characters dropped) instead of the network")
+        parser.add_argument("--no-covers", action="store_true")
+        parser.add_argument("--restart", action="store_true", help="ignore the checkpoint and start from the first row")
+        parser.add_argument("--default-category", default="Uncategorized")
+
+    def handle(self, *args, **options):
+        path = Path(options["path"])
+        reader = READERS.get(path.suffix.lower())
+        if reader is None:
+            raise CommandError(f"Unsupported input {path.suffix}, expected one of {', '.join(READERS)}")
+        self.options = options
+        self.checkpoint = path.with_name(path.name + ".progress")
+        skip = 0 if options["restart"] else self.read_checkpoint()
+        if skip:
+            self.stdout.write(f"Resuming after row {skip}")
+
+        self.categories = dict(Category.objects.values_list("name", "pk"))
+        # isbn -> has a cover, loaded once instead of one EXISTS per row
+        self.existing = {isbn: bool(cover) for isbn, cover in Book.objects.values_list("isbn", "cover_image").iterator()}
+        self.seen = set()
+        self.invalid = 0
+        self.session = requests.Session()
+        self.pool = ThreadPoolExecutor(max_workers=options["cover_workers"])
+
+        started = time.perf_counter()
+        position = imported = 0
+        batch = []
+        try:
+            with path.open(newline="", encoding="utf-8") as handle:
+                for row in reader(handle):
+                    position += 1
+                    if position <= skip:
+                        continue
+                    book = self.build(row)
+                    if book is not None:
+                        batch.append((book, row))
+                    if len(batch) >= options["batch_size"]:
+                        imported += self.flush(batch, position)
+                        batch = []
+                        self.report(imported, started)
+                imported += self.flush(batch, position)
+        finally:
+            self.pool.shutdown()
+
+        self.checkpoint.unlink(missing_ok=True)
+        facets.rebuild()
+        bump_catalog_version()
+        self.report(imported, started, done=True)
+
+    def read_checkpoint(self):
+        try:
+            return int(self.checkpoint.read_text())
+        except (FileNotFoundError, ValueError):
+            return 0
+
+    def report(self, imported, started, done=False):
+        elapsed = time.perf_counter() - started
+        prefix = "Imported" if done else "..."
+        self.stdout.write(
+            f"{prefix} {imported} books in {elapsed:.1f}s ({imported / max(elapsed, 1e-9):.0f} rows/s), "
+            f"skipped {self.invalid} invalid rows"
+        )
+
+    def category_id(self, name):
+        name = (name or self.options["default_category"]).strip()[:100]
+        if name not in self.categories:
+            Category.objects.bulk_create([Category(name=name)], ignore_conflicts=True)
+            self.categories[name] = Category.objects.get(name=name).pk
+        return self.categories[name]
+
+    def build(self, row):
+        isbn = str(row.get("isbn") or "").strip()[:20]
+        title = str(row.get("title") or "").strip()
+        if not isbn or not title or isbn in self.seen:
+            return None
+        book_format = row.get("format") if row.get("format") in FORMATS else "Paperback"
+        try:
+            book = Book(
+                isbn=isbn,
+                title=title[:200],
+                author=str(row.get("author") or "Unknown")[:100],
+                price=clean_decimal(row.get("price"), Decimal(0)),
+                description=row.get("description") or "No description available",
+                publisher=(row.get("publisher") or None) and str(row["publisher"])[:100],
+                publication_date=clean_date(row.get("publication_date")),
+                language=str(row.get("language") or "English")[:50],
+                pages=clean_int(row.get("pages")),
+                stock=clean_int(row.get("stock")) or 0,
+                rating=clean_decimal(row.get("rating")),
+                format=book_format,
+            )
+            check_limits(book)
+        except (ValueError, ValidationError) as exc:
+            # one bad row would fail its whole batch, leave it out
+            self.invalid += 1
+            if self.options["verbosity"] > 1:
+                self.stderr.write(f"Skipping ISBN {isbn}: {exc}")
+            return None
+        self.seen.add(isbn)
+        book.category_id = self.category_id(row.get("category"))
+        return book
+
+    def fetch_cover(self, book, row):
+        """Store the cover of one book, returns the storage name or None"""
+        name = cover_name(book.isbn)
+        if name is None:
+            return None
+        if self.options["covers_dir"]:
+            source = Path(self.options["covers_dir"]) / name
+            if not source.exists():
+                return None
+            content = source.read_bytes()
+        else:
+            url = row.get("cover_url") or row.get("cover")
+            if not url:
+                return None
+            if os.path.exists(url):
+                content = Path(url).read_bytes()
+            else:
+                try:
+                    response = self.session.get(url, timeout=15)
+                    response.raise_for_status()
+                except requests.RequestException:
+                    return None
+                content = response.content
+        return default_storage.save(f"books/{name}", ContentFile(content))
+
+    def flush(self, batch, position):
+        if not batch:
+            self.checkpoint.write_text(str(position))
+            return 0
+        if not self.options["no_covers"]:
+            wanted = [(book, row) for book, row in batch if not self.existing.get(book.isbn)]
+            for (book, _), name in zip(wanted, self.pool.map(lambda pair: self.fetch_cover(*pair), wanted)):
+                book.cover_image = name
+
+        books = [book for book, _ in batch]
+        # books that already have a cover keep it, cover_image is left out of their upsert
+        keep_cover = [book for book in books if self.existing.get(book.isbn)]
+        new_cover = [book for book in books if not self.existing.get(book.isbn)]
+        updated_isbns = [book.isbn for book in books if book.isbn in self.existing]
+        with transaction.atomic():
+            for group, fields in ((new_cover, UPDATE_FIELDS + ["cover_image"]), (keep_cover, UPDATE_FIELDS)):
+                if group:
+                    Book.objects.bulk_create(group, update_conflicts=True, unique_fields=["isbn"], update_fields=fields)
+            if updated_isbns:
+                # prices may have moved under existing carts
+                Cart.recalculate(Cart.objects.filter(items__book__isbn__in=updated_isbns))
+            # bulk_create skips the save() signals, do their work once per batch
+            transaction.on_commit(partial(self.committed, books))
+        self.checkpoint.write_text(str(position))
+        for book in books:
+            self.existing[book.isbn] = self.existing.get(book.isbn) or bool(book.cover_image)
+        return len(books)
+
+    def committed(self, books):
+        """Index the batch in one update and queue variants for the covers it stored"""
+        typeahead.index.add_many(books)
+        for book in books:
+            if covers.needs_variants(book):
+                covers.worker.enqueue(book.pk)
@@ -0,0 +1,122 @@
+# bookstore/media.py
+"""
+Media (cover) serving.
+
+Content-hashed names (see bookstore.storage) never change content, so they are
+sent with a one year immutable ``Cache-Control``; other files get a short max-age
+and are revalidated with ETag/Last-Modified.
+
+With ``MEDIA_SENDFILE`` set, the body is left to the front server:
+``x-accel-redirect`` (nginx, internal location at ``MEDIA_ACCEL_PREFIX``) or
+``x-sendfile`` (Apache/lighttpd), which also take care of range requests.
+Otherwise the file is handed to the WSGI server's ``wsgi.file_wrapper``, which
+gunicorn sends with ``os.sendfile``; ranges up to the end of the file keep that
+path, other ranges are streamed in chunks.
+"""
+import mimetypes
+import os
+import re
+from urllib.parse import quote
+
+from django.conf import settings
+from django.http import FileResponse, Http404, HttpResponse, StreamingHttpResponse
+from django.utils._os import safe_join
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_safe
+
+from .storage import is_hashed
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+REVALIDATE = "public, max-age=3600"
+RANGE_RE = re.compile(r"^bytes=(\d*)-(\d*)$")
+BLOCK_SIZE = 64 * 1024
+
+
+def parse_range(header, size):
+    """(start, end) inclusive for a single satisfiable byte range, None to send the whole file"""
+    match = RANGE_RE.match(header or "")
+    if not match or match.groups() == ("", ""):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), int(last) if last else size - 1
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start >= size or start > end:
+        raise ValueError
+    return start, min(end, size - 1)
+
+
+def read_range(handle, start, length):
+    handle.seek(start)
+    try:
+        while length > 0:
+            chunk = handle.read(min(BLOCK_SIZE, length))
+            if not chunk:
+                break
+            length -= len(chunk)
+            yield chunk
+    finally:
+        handle.close()
+
+
+def file_body(full_path, byte_range, size):
+    if byte_range is None:
+        return FileResponse(open(full_path, "rb"))
+    start, end = byte_range
+    handle = open(full_path, "rb")
+    if end == size - 1:
+        # still a plain file, so the server can sendfile() from the offset
+        handle.seek(start)
+        response = FileResponse(handle, status=206)
+    else:
+        response = StreamingHttpResponse(read_range(handle, start, end - start + 1), status=206)
+    response["Content-Length"] = end - start + 1
+    response["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return response
+
+
+def offloaded(path, full_path):
+    response = HttpResponse()
+    if settings.MEDIA_SENDFILE == "x-accel-redirect":
+        response["X-Accel-Redirect"] = quote(settings.MEDIA_ACCEL_PREFIX.rstrip("/") + "/" + path)
+    else:
+        response["X-Sendfile"] = full_path
+    # the front server fills in the real type and length
+    del response["Content-Type"]
+    return response
+
+
+@require_safe
+def serve_media(request, path):
+    try:
+        full_path = safe_join(settings.MEDIA_ROOT, path)
+        stat = os.stat(full_path)
+    except (OSError, ValueError):
+        raise Http404("File not found")
+    if not os.path.isfile(full_path):
+        raise Http404("File not found")
+
+    etag = f'"{stat.st_size:x}-{int(stat.st_mtime):x}"'
+    response = get_conditional_response(request, etag=etag, last_modified=int(stat.st_mtime))
+    if response is None:
+        if settings.MEDIA_SENDFILE:
+            response = offloaded(path, full_path)
+        else:
+            try:
+                byte_range = parse_range(request.headers.get("Range"), stat.st_size)
+            except ValueError:
+                response = HttpResponse(status=416)
+                response["Content-Range"] = f"bytes */{stat.st_size}"
+                return response
+            if request.headers.get("If-Range", etag) != etag:
+                byte_range = None
+            response = file_body(full_path, byte_range, stat.st_size)
+            response["Content-Type"] = mimetypes.guess_type(full_path)[0] or "application/octet-stream"
+            response["Accept-Ranges"] = "bytes"
+
+    response["ETag"] = etag
+    response["Last-Modified"] = http_date(stat.st_mtime)
+    response["Cache-Control"] = IMMUTABLE if is_hashed(path) else REVALIDATE
+    return response
@@ -1,10 +1,14 @@
 # bookstore/models.py
-from django.db import models
+from django.db import connection, models
+from django.contrib.postgres.indexes import GinIndex, OpClass
+from django.contrib.postgres.search import SearchVector, SearchVectorField
 from django.contrib.auth import get_user_model
+from django.db.models.functions import Upper
 
 User = get_user_model()
 class Category(models.Model):
     name = models.CharField(max_length=100,unique=True)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return self.name
@@ -17,7 +21,10 @@ class Book(models.Model):
     isbn = models.CharField(max_length=20, unique=True)
     description = models.TextField()
     cover_image = models.ImageField(upload_to='books/', null=True, blank=True)
-    category = models.ForeignKey('Category',related_name='item', on_delete=models.CASCADE)
+    # resized WebP/AVIF/JPEG copies of cover_image, filled in by bookstore.covers
+    cover_variants = models.JSONField(default=dict, blank=True)
+    # book_category_price_idx leads with category_id, a separate FK index would be redundant
+    category = models.ForeignKey('Category',related_name='item', on_delete=models.CASCADE, db_index=False)
     publisher = models.CharField(max_length=100, null=True, blank=True)
     publication_date = models.DateField(null=True, blank=True)
     language = models.CharField(max_length=50, default='English')
@@ -25,5 +32,82 @@ class Book(models.Model):
     stock = models.PositiveIntegerField(default=0)  # for e-commerce
     rating = models.DecimalField(max_digits=3, decimal_places=2, null=True, blank=True)
     format = models.CharField(max_length=50, choices=[('Hardcover','Hardcover'), ('Paperback','Paperback'), ('Ebook','Ebook')], default='Paperback')
+    # bulk UPDATEs must set this too, it feeds the ETag of catalog responses
+    updated_at = models.DateTimeField(auto_now=True)
+    # Maintained by PostgreSQL on every write, queried by the search action
+    search_vector = models.GeneratedField(
+        expression=(
+            SearchVector("title", weight="A", config="english")
+            + SearchVector("author", weight="B", config="english")
+            + SearchVector("publisher", weight="C", config="english")
+            + SearchVector("description", weight="D", config="english")
+        ),
+        output_field=SearchVectorField(),
+        db_persist=True,
+    )
+
+    class Meta:
+        # bookstore.tests.QueryPlanTests checks with EXPLAIN that the catalog filters use these
+        indexes = [
+            # keyset pagination walks these (field, id) pairs
+            models.Index(fields=["price", "id"], name="book_price_id_idx"),
+            models.Index(fields=["title", "id"], name="book_title_id_idx"),
+            # ?category= with or without a price range, paged by price
+            models.Index(fields=["category", "price", "id"], name="book_category_price_idx"),
+            # DISTINCT ON (author) in author_wise_books
+            models.Index(fields=["author", "id"], name="book_author_id_idx"),
+            # ?in_stock=true paged by price, only the rows that can be sold
+            models.Index(fields=["price", "id"], condition=models.Q(stock__gt=0), name="book_in_stock_price_idx"),
+            GinIndex(fields=["search_vector"], name="book_search_vector_idx"),
+            # typo-tolerant fallback for the search action, needs pg_trgm
+            GinIndex(fields=["title"], opclasses=["gin_trgm_ops"], name="book_title_trgm_idx"),
+            GinIndex(fields=["author"], opclasses=["gin_trgm_ops"], name="book_author_trgm_idx"),
+            # ?author= is an icontains, i.e. UPPER(author) LIKE UPPER('%...%')
+            GinIndex(OpClass(Upper("author"), name="gin_trgm_ops"), name="book_author_upper_trgm_idx"),
+        ]
+
     def __str__(self):
         return self.title
+
+
+class BookFacetCountQuerySet(models.QuerySet):
+    def add(self, deltas):
+        """
+        Shift counts by `deltas` ({(category_id, price_bucket, in_stock, facet, value): delta}) with one
+        INSERT ... ON CONFLICT DO UPDATE, so concurrent writers never lose an update.
+        """
+        deltas = {key: delta for key, delta in deltas.items() if delta}
+        if not deltas:
+            return
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        rows = ", ".join(["(%s, %s, %s, %s, %s, %s)"] * len(deltas))
+        params = []
+        for key, delta in sorted(deltas.items()):
+            params += [*key, delta]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (category_id, price_bucket, in_stock, facet, value, count) VALUES {rows} "
+                f"ON CONFLICT (category_id, price_bucket, in_stock, facet, value) DO UPDATE "
+                f"SET count = {table}.count + EXCLUDED.count",
+                params,
+            )
+
+
+class BookFacetCount(models.Model):
+    """Books per (category, price bucket, in stock, facet value), maintained by bookstore.facets"""
+
+    category = models.ForeignKey(Category, related_name='facet_counts', on_delete=models.CASCADE)
+    price_bucket = models.CharField(max_length=20)
+    in_stock = models.BooleanField()
+    facet = models.CharField(max_length=20)
+    value = models.CharField(max_length=100)
+    count = models.IntegerField(default=0)
+
+    objects = BookFacetCountQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(
+                fields=["category", "price_bucket", "in_stock", "facet", "value"], name="unique_category_facet_value"
+            ),
+        ]
@@ -0,0 +1,203 @@
+# bookstore/pagination.py
+import base64
+import json
+import math
+from collections import OrderedDict
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+class KeysetPagination(BasePagination):
+    """
+    Cursor (keyset) pagination over a stable composite key ``(field, id)``.
+
+    Pages are fetched with ``WHERE (field, id) > (last_field, last_id) LIMIT n``
+    so the cost of a page does not depend on how deep the client is, and no
+    ``COUNT(*)`` or ``OFFSET`` is ever issued.
+
+    Pagination is opt-in: it only kicks in when the client sends ``cursor`` or
+    ``page_size``, so existing clients keep receiving the plain list.
+    """
+
+    page_size = 24
+    max_page_size = 100
+    page_size_query_param = "page_size"
+    cursor_query_param = "cursor"
+    ordering_query_param = "ordering"
+    # Only non-null columns can be used as a keyset, otherwise rows whose
+    # value is NULL would never be reached by the ``>`` comparison.
+    ordering_fields = ("id", "price", "title")
+    default_ordering = "id"
+    invalid_cursor_message = "Invalid cursor"
+
+    def should_paginate(self, request):
+        params = request.query_params
+        return self.cursor_query_param in params or self.page_size_query_param in params
+
+    def paginate_queryset(self, queryset, request, view=None):
+        queryset = self.page_queryset(queryset, request)
+        if queryset is None:
+            return None
+        return self.set_page(list(queryset))
+
+    def page_queryset(self, queryset, request):
+        """The unevaluated query for the requested page, None when not paginating"""
+        if not self.should_paginate(request):
+            return None
+
+        self.request = request
+        self.base_url = request.build_absolute_uri()
+        self.page_size = self.get_page_size(request)
+        self.field, self.descending = self.get_ordering(request)
+        self.model = queryset.model
+
+        cursor = self.decode_cursor(request)
+        reverse = bool(cursor and cursor["r"])
+
+        # Walking backwards is the same query with every comparison flipped.
+        descending = self.descending != reverse
+        prefix = "-" if descending else ""
+        queryset = queryset.order_by(prefix + self.field, prefix + "id")
+        if cursor:
+            queryset = queryset.filter(self.keyset_filter(cursor["v"], cursor["id"], descending))
+
+        self.cursor, self.reverse = cursor, reverse
+        return queryset[:self.page_size + 1]
+
+    def set_page(self, results):
+        """Trim the rows of page_queryset() to the page and work out the links"""
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        if self.reverse:
+            results.reverse()
+
+        self.has_next = has_more if not self.reverse else True
+        self.has_previous = bool(self.cursor) if not self.reverse else has_more
+        self.page = results
+        return results
+
+    def keyset_filter(self, value, pk, descending):
+        # ``field >= v AND (field > v OR id > pk)`` keeps a plain range
+        # condition on the leading column so the (field, id) index is used.
+        op = "lt" if descending else "gt"
+        edge = "lte" if descending else "gte"
+        if self.field == "id":
+            return Q(**{f"id__{op}": pk})
+        return Q(**{f"{self.field}__{edge}": value}) & (
+            Q(**{f"{self.field}__{op}": value}) | Q(**{f"id__{op}": pk})
+        )
+
+    def get_page_size(self, request):
+        try:
+            size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        if size <= 0:
+            return self.page_size
+        return min(size, self.max_page_size)
+
+    def get_ordering(self, request):
+        ordering = request.query_params.get(self.ordering_query_param, self.default_ordering)
+        field = ordering.lstrip("-")
+        if field not in self.ordering_fields:
+            return self.default_ordering, False
+        return field, ordering.startswith("-")
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            cursor = json.loads(base64.urlsafe_b64decode(encoded.encode("ascii")))
+            if cursor["f"] != self.field:
+                raise ValueError
+            cursor["id"] = int(cursor["id"])
+            cursor["v"] = self.cursor_value(cursor["v"])
+            cursor["r"] = bool(cursor.get("r"))
+        except (TypeError, ValueError, KeyError, UnicodeEncodeError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+        return cursor
+
+    def cursor_value(self, value):
+        """The cursor's ``v`` as a value of the ordering field, raises ValueError/ValidationError when it is not one"""
+        value = self.model._meta.get_field(self.field).to_python(value)
+        if value is None or (hasattr(value, "is_finite") and not value.is_finite()):
+            raise ValueError(value)
+        return value
+
+    def encode_cursor(self, obj, reverse):
+        value = getattr(obj, self.field)
+        cursor = {"f": self.field, "v": str(value), "id": obj.pk, "r": int(reverse)}
+        encoded = base64.urlsafe_b64encode(json.dumps(cursor).encode("ascii")).decode("ascii")
+        return replace_query_param(self.base_url, self.cursor_query_param, encoded)
+
+    def get_next_link(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_link(self):
+        if not self.has_previous:
+            return None
+        if not self.page:
+            return remove_query_param(self.base_url, self.cursor_query_param)
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_paginated_response(self, data):
+        return Response(OrderedDict([
+            ("next", self.get_next_link()),
+            ("previous", self.get_previous_link()),
+            ("results", data),
+        ]))
+
+    def get_paginated_response_schema(self, schema):
+        return {
+            "type": "object",
+            "required": ["results"],
+            "properties": {
+                "next": {"type": "string", "nullable": True, "format": "uri"},
+                "previous": {"type": "string", "nullable": True, "format": "uri"},
+                "results": schema,
+            },
+        }
+
+
+class SearchPagination(KeysetPagination):
+    """Keyset pages over ``(rank, id)``, best matches first. Always paginated."""
+
+    page_size = 20
+    ordering_fields = ("rank",)
+    default_ordering = "-rank"
+
+    def should_paginate(self, request):
+        return True
+
+    def get_ordering(self, request):
+        return "rank", True
+
+    def cursor_value(self, value):
+        # rank is an annotation, not a model field
+        value = float(value)
+        if not math.isfinite(value):
+            raise ValueError(value)
+        return value
+
+
+class RecentFirstPagination(KeysetPagination):
+    """Keyset pages over ``(created_at, id)``, newest first."""
+
+    page_size = 20
+    ordering_fields = ("created_at",)
+    default_ordering = "-created_at"
+
+
+class ArchivePagination(RecentFirstPagination):
+    """RecentFirstPagination that is always on, archives are too long for a plain list."""
+
+    def should_paginate(self, request):
+        return True
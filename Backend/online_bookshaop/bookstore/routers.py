@@ -0,0 +1,126 @@
+# bookstore/routers.py
+"""
+Read replica routing.
+
+With DATABASE_REPLICAS configured, ``ReplicaRouter`` sends reads of the
+REPLICA_APPS models (the catalog and order history) to a random replica. They
+stay on the primary:
+
+- inside a transaction on the primary,
+- outside requests (management commands, workers),
+- during requests that write (anything but GET, HEAD and OPTIONS),
+- for REPLICA_PIN_SECONDS after the user's last successful write, so replication
+  lag never hides their own cart or order from them (read-your-writes).
+  ``ReplicaPinMiddleware`` records those writes in the cache.
+
+Writes, and every other model (carts, accounts, sessions), use the primary.
+"""
+import contextvars
+import random
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.utils.decorators import sync_and_async_middleware
+from django.utils.functional import LazyObject
+
+SAFE_METHODS = ("GET", "HEAD", "OPTIONS")
+
+
+class RequestState:
+    def __init__(self, request):
+        self.request = request
+        self.pinned = None
+
+
+current = contextvars.ContextVar("replica_request", default=None)
+
+
+def pin_cache():
+    return caches[settings.REPLICA_PIN_CACHE_ALIAS]
+
+
+def pin_key(user_id):
+    return f"db:primary-pin:{user_id}"
+
+
+def request_user_id(request):
+    """The id of the user DRF authenticated, None before that or for anonymous requests"""
+    user = request.__dict__.get("user")
+    # AuthenticationMiddleware's lazy session user, not evaluated from in here
+    if user is None or isinstance(user, LazyObject) or not user.is_authenticated:
+        return None
+    return user.pk
+
+
+def primary_pinned():
+    state = current.get()
+    if state is None or state.request.method not in SAFE_METHODS:
+        return True
+    if state.pinned is None:
+        user_id = request_user_id(state.request)
+        if user_id is None:
+            return False
+        state.pinned = bool(pin_cache().get(pin_key(user_id)))
+    return state.pinned
+
+
+def pin_after(request, response):
+    """The user id to pin to the primary after this response, if any"""
+    if not settings.DATABASE_REPLICAS or request.method in SAFE_METHODS or response.status_code >= 400:
+        return None
+    return request_user_id(request)
+
+
+@sync_and_async_middleware
+def ReplicaPinMiddleware(get_response):
+    if iscoroutinefunction(get_response):
+        async def middleware(request):
+            token = current.set(RequestState(request))
+            try:
+                response = await get_response(request)
+            finally:
+                current.reset(token)
+            user_id = pin_after(request, response)
+            if user_id is not None:
+                await pin_cache().aset(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+            return response
+    else:
+        def middleware(request):
+            token = current.set(RequestState(request))
+            try:
+                response = get_response(request)
+            finally:
+                current.reset(token)
+            user_id = pin_after(request, response)
+            if user_id is not None:
+                pin_cache().set(pin_key(user_id), 1, settings.REPLICA_PIN_SECONDS)
+            return response
+
+    return middleware
+
+
+class ReplicaRouter:
+    def db_for_read(self, model, **hints):
+        if not settings.DATABASE_REPLICAS or model._meta.app_label not in settings.REPLICA_APPS:
+            return None
+        if connections[DEFAULT_DB_ALIAS].in_atomic_block or primary_pinned():
+            return DEFAULT_DB_ALIAS
+        return random.choice(settings.DATABASE_REPLICAS)
+
+    def db_for_write(self, model, **hints):
+        # otherwise an instance read from a replica would be saved back there
+        return DEFAULT_DB_ALIAS if settings.DATABASE_REPLICAS else None
+
+    def allow_relation(self, obj1, obj2, **hints):
+        cluster = {DEFAULT_DB_ALIAS, *settings.DATABASE_REPLICAS}
+        if obj1._state.db in cluster and obj2._state.db in cluster:
+            return True
+        return None
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        # replicas get the schema through replication
+        if db in settings.DATABASE_REPLICAS:
+            return False
+        return None
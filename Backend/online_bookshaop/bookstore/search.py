@@ -0,0 +1,49 @@
+# bookstore/search.py
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, TrigramWordSimilarity
+from django.db.models import F, FloatField, Q
+from django.db.models.functions import Cast, Greatest
+
+WORD_RE = re.compile(r"\w+")
+
+
+def as_double(rank):
+    # ranks are ``real``; a double survives the round trip through the
+    # pagination cursor exactly, so (rank, id) keyset comparisons stay stable
+    return Cast(rank, FloatField())
+
+
+def parse_query(term):
+    """
+    Build a tsquery that ANDs the words of `term` and treats the last one as a
+    prefix, so "harry pot" already matches "Harry Potter" while typing.
+    Returns None when `term` has no searchable words.
+    """
+    words = WORD_RE.findall(term.lower())
+    if not words:
+        return None
+    words[-1] += ":*"
+    return SearchQuery(" & ".join(words), search_type="raw", config="english")
+
+
+def search_books(queryset, term):
+    """Full-text matches of `term`, annotated with their ``rank``"""
+    query = parse_query(term)
+    if query is None:
+        return queryset.none()
+    return queryset.filter(search_vector=query).annotate(rank=as_double(SearchRank(F("search_vector"), query)))
+
+
+def fuzzy_search_books(queryset, term):
+    """
+    Trigram matches on title/author for misspelt terms, annotated with their
+    ``rank``. The ``%>`` operator uses the trigram GIN indexes, its cut-off is
+    ``pg_trgm.word_similarity_threshold`` (set in the DATABASES options).
+    """
+    term = term.strip()
+    return queryset.filter(
+        Q(title__trigram_word_similar=term) | Q(author__trigram_word_similar=term)
+    ).annotate(
+        rank=as_double(Greatest(TrigramWordSimilarity(term, "title"), TrigramWordSimilarity(term, "author")))
+    )
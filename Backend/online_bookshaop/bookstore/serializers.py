@@ -1,27 +1,70 @@
 # bookstore/serializers.py
 from rest_framework import serializers
 from .models import Book, Category
+from . import covers
+from .instrumentation import TimedSerializerMixin
 import django_filters
-class CategorySerializer(serializers.ModelSerializer):
+class CategorySerializer(TimedSerializerMixin, serializers.ModelSerializer):
     class Meta:
         model = Category
         fields = '__all__'
 
-class BookSerializer(serializers.ModelSerializer):
+class BookSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     category = serializers.PrimaryKeyRelatedField(queryset=Category.objects.all())
     category_name = serializers.CharField(source='category.name', read_only=True)
+    cover_thumb = serializers.SerializerMethodField()
+    cover_srcset = serializers.SerializerMethodField()
 
     class Meta:
         model = Book
-        fields = '__all__'
-        
+        exclude = ['search_vector', 'cover_variants']
+
+    def absolute(self, url):
+        request = self.context.get("request")
+        return request.build_absolute_uri(url) if request else url
+
+    def get_cover_thumb(self, obj):
+        """Small WebP for list pages, null until the variants are built (use cover_image)"""
+        return covers.thumb_url(obj.cover_variants.get("variants", {}), self.absolute)
+
+    def get_cover_srcset(self, obj):
+        """{format: srcset} to put in <picture><source> elements"""
+        return covers.srcsets(obj.cover_variants.get("variants", {}), self.absolute)
+
+    @staticmethod
+    def setup_eager_loading(queryset, prefix=""):
+        """Load everything the serializer reads, `prefix` is the path to the book when nested"""
+        return queryset.select_related(prefix + "category").defer(prefix + "search_vector")
+
+
+class CategoryBulkSerializer(CategorySerializer):
+    """Row validation for bulk writes, name uniqueness is checked for the whole payload"""
+
+    class Meta(CategorySerializer.Meta):
+        extra_kwargs = {"name": {"validators": []}}
+
+
+class BookBulkSerializer(BookSerializer):
+    """Row validation for bulk writes, categories and ISBNs are checked for the whole payload"""
+
+    category = serializers.IntegerField(source="category_id")
+
+    class Meta(BookSerializer.Meta):
+        # covers cannot travel in a JSON payload, an upsert keeps the stored one
+        exclude = BookSerializer.Meta.exclude + ['cover_image']
+        extra_kwargs = {"isbn": {"validators": []}}
+
 
 class BookFilter(django_filters.FilterSet):
     price_min = django_filters.NumberFilter(field_name="price", lookup_expr="gte")
     price_max = django_filters.NumberFilter(field_name="price", lookup_expr="lte")
     category = django_filters.NumberFilter(field_name="category__id")
     author = django_filters.CharFilter(field_name="author", lookup_expr="icontains")
+    in_stock = django_filters.BooleanFilter(method="filter_in_stock")
 
     class Meta:
         model = Book
-        fields = ["category", "author", "price_min", "price_max"]
\ No newline at end of file
+        fields = ["category", "author", "price_min", "price_max", "in_stock"]
+
+    def filter_in_stock(self, queryset, name, value):
+        return queryset.filter(stock__gt=0) if value else queryset.filter(stock=0)
\ No newline at end of file
@@ -0,0 +1,55 @@
+from functools import partial
+
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Book, Category
+from . import covers, facets, typeahead
+from .cache import bump_catalog_version
+
+
+@receiver(post_save, sender=Book)
+def index_book(sender, instance, **kwargs):
+    transaction.on_commit(partial(typeahead.index.add, instance))
+
+
+@receiver(post_save, sender=Book)
+def queue_cover_variants(sender, instance, **kwargs):
+    if covers.needs_variants(instance):
+        transaction.on_commit(partial(covers.worker.enqueue, instance.pk))
+
+
+@receiver(pre_save, sender=Book)
+def remember_facets(sender, instance, **kwargs):
+    if not instance._state.adding:
+        old = Book.objects.filter(pk=instance.pk).values_list(*facets.FACET_COLUMNS).first()
+        instance._old_facet_keys = facets.facet_keys(*old) if old else None
+
+
+@receiver(post_save, sender=Book)
+def count_facets(sender, instance, created, **kwargs):
+    old = set(getattr(instance, "_old_facet_keys", None) or [])
+    new = set(facets.book_keys(instance))
+    if old - new:
+        facets.remove_keys(old - new)
+    facets.add_keys(new - old)
+
+
+@receiver(post_delete, sender=Book)
+def uncount_facets(sender, instance, **kwargs):
+    # an UPDATE only, the rows are already gone when the whole category is deleted
+    facets.remove_keys(facets.book_keys(instance))
+
+
+@receiver(post_delete, sender=Book)
+def unindex_book(sender, instance, **kwargs):
+    transaction.on_commit(partial(typeahead.index.discard, instance.pk))
+
+
+@receiver(post_save, sender=Book)
+@receiver(post_delete, sender=Book)
+@receiver(post_save, sender=Category)
+@receiver(post_delete, sender=Category)
+def invalidate_catalog_cache(sender, **kwargs):
+    transaction.on_commit(bump_catalog_version)
@@ -0,0 +1,47 @@
+# bookstore/storage.py
+import hashlib
+import os
+import re
+
+from django.core.files.storage import FileSystemStorage
+
+# books/cover.<16 hex>.jpg, or covers/ab/<64 hex>.webp as written by bookstore.covers
+HASHED_NAME_RE = re.compile(r"(\.[0-9a-f]{16}|/[0-9a-f]{64})\.\w+$")
+
+
+def is_hashed(name):
+    return bool(HASHED_NAME_RE.search(name))
+
+
+def content_hash(content):
+    digest = hashlib.sha256()
+    if hasattr(content, "seek"):
+        content.seek(0)
+    for chunk in content.chunks() if hasattr(content, "chunks") else iter(lambda: content.read(65536), b""):
+        digest.update(chunk)
+    if hasattr(content, "seek"):
+        content.seek(0)
+    return digest.hexdigest()
+
+
+def hashed_name(name, content):
+    if is_hashed(name):
+        return name
+    root, ext = os.path.splitext(name)
+    return f"{root}.{content_hash(content)[:16]}{ext}"
+
+
+class HashedFileSystemStorage(FileSystemStorage):
+    """
+    Stores uploads under a name carrying a hash of their bytes, so a name
+    never changes content and can be cached forever. Identical uploads to the
+    same name share one file.
+    """
+
+    def save(self, name, content, max_length=None):
+        if name is None:
+            name = content.name
+        name = hashed_name(name, content)
+        if self.exists(name):
+            return name
+        return super().save(name, content, max_length=max_length)
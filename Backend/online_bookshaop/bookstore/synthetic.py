@@ -0,0 +1,60 @@
+# bookstore/synthetic.py
+"""Synthetic catalog data for benchmarks, never used by the API itself."""
+import random
+from datetime import date
+from decimal import Decimal
+
+from .models import Book, Category
+
+WORDS = (
+    "shadow river crown winter garden empire silent secret broken golden night "
+    "storm glass iron paper city ocean forest dragon letter memory island house "
+    "war peace love death summer moon star fire stone light dark last first lost "
+    "king queen daughter son mountain road journey tale history science mind"
+).split()
+FIRST_NAMES = "Ada Alan Emma Jane Leo Mary Omar Priya Ravi Sara Tom Yuki Zoe Ivan Lena".split()
+LAST_NAMES = "Austen Brown Chen Dickens Evans Garcia Hughes Iyer Kapoor Lee Morris Novak Patel Rossi Smith".split()
+PUBLISHERS = ("Penguin", "HarperCollins", "Vintage", "Macmillan", "Orbit", "Tor")
+LANGUAGES = ("English", "English", "English", "Hindi", "French", "German", "Spanish")
+FORMATS = ("Hardcover", "Paperback", "Ebook")
+CATEGORIES = ("Fiction", "Non-Fiction", "Academic", "Science", "History", "Fantasy", "Biography", "Mystery")
+
+
+def seed_categories():
+    Category.objects.bulk_create([Category(name=name) for name in CATEGORIES], ignore_conflicts=True)
+    return list(Category.objects.filter(name__in=CATEGORIES))
+
+
+def seed_books(count, prefix="synthetic", batch_size=5000, seed=0):
+    """
+    Insert `count` random books with ISBNs ``<prefix>-<n>`` in batches.
+    Books from an earlier run with the same prefix are kept, so it only tops up.
+    """
+    rng = random.Random(seed)
+    categories = seed_categories()
+    existing = Book.objects.filter(isbn__startswith=prefix + "-").count()
+    for start in range(existing, count, batch_size):
+        Book.objects.bulk_create(
+            [random_book(rng, f"{prefix}-{n}", categories) for n in range(start, min(start + batch_size, count))],
+            ignore_conflicts=True,
+        )
+    return Book.objects.filter(isbn__startswith=prefix + "-")
+
+
+def random_book(rng, isbn, categories):
+    title = " ".join(rng.choice(WORDS) for _ in range(rng.randint(2, 5))).title()
+    return Book(
+        title=title,
+        author=f"{rng.choice(FIRST_NAMES)} {rng.choice(LAST_NAMES)}",
+        price=Decimal(rng.randint(100, 2000)) / 2,
+        isbn=isbn[:20],
+        description=" ".join(rng.choice(WORDS) for _ in range(rng.randint(10, 40))),
+        category=rng.choice(categories),
+        publisher=rng.choice(PUBLISHERS),
+        publication_date=date(rng.randint(1950, 2025), rng.randint(1, 12), 1),
+        language=rng.choice(LANGUAGES),
+        pages=rng.randint(80, 900),
+        stock=rng.choice((0, rng.randint(1, 50))),
+        rating=Decimal(rng.randint(100, 500)) / 100,
+        format=rng.choice(FORMATS),
+    )
@@ -1,3 +1,940 @@
-from django.test import TestCase
+import base64
+import io
+import json
+import tempfile
+import threading
+from decimal import Decimal
+from io import StringIO
+from pathlib import Path
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import async_to_sync, iscoroutinefunction
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.management import call_command
+from django.db import connection, connections
+from django.db.models import Q
+from django.contrib.auth import get_user_model
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, TestCase, override_settings
+from PIL import Image
+from rest_framework.test import APIClient
+
+from cart.models import Cart
+from orders.models import Order
+
+from . import covers, facets, instrumentation, routers, typeahead
+from .cache import stats
+from .models import Book, Category
+from .search import search_books
+from .serializers import BookFilter
+from .synthetic import seed_books
+
+User = get_user_model()
+
+
+def make_books(count, category=None):
+    category = category or Category.objects.create(name="Fiction")
+    return Book.objects.bulk_create(
+        Book(
+            title=f"Book {i}",
+            author=f"Author {i % 3}",
+            price=Decimal(100 + i),
+            isbn=f"isbn-{category.pk}-{i}",
+            description="",
+            category=category,
+        )
+        for i in range(count)
+    )
+
+
+class BookQueryBudgetTests(TestCase):
+    """Listing books must not issue a query per book/category."""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        for name in ("Fiction", "History", "Science"):
+            make_books(5, Category.objects.create(name=name))
+
+    def test_list_books(self):
+        # ETag aggregate + books with categories
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/books-store/books/")
+        self.assertEqual(len(response.json()), 15)
+
+    def test_list_books_paginated(self):
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/books-store/books/?page_size=10")
+        self.assertEqual(len(response.json()["results"]), 10)
+
+    def test_author_wise_books(self):
+        with self.assertNumQueries(1):
+            self.client.get("/api/books-store/books/author_wise_books/")
+
+
+def trigram_available():
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT 1 FROM pg_opclass WHERE opcname = 'gin_trgm_ops'")
+        return cursor.fetchone() is not None
+
+
+def cursor_param(**payload):
+    return base64.urlsafe_b64encode(json.dumps(payload).encode()).decode()
+
+
+class KeysetPaginationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        books = make_books(7)
+        # ties on price across a page boundary, the id breaks them
+        Book.objects.filter(pk__in=[book.pk for book in books[:4]]).update(price=Decimal("50"))
+
+    def walk(self, url):
+        pages = []
+        while url:
+            pages.append(self.client.get(url).json())
+            url = pages[-1]["next"]
+        return pages
+
+    def test_every_ordering(self):
+        for ordering in ("id", "-id", "price", "-price", "title", "-title"):
+            with self.subTest(ordering):
+                pages = self.walk(f"/api/books-store/books/?page_size=3&ordering={ordering}")
+                prefix = "-" if ordering.startswith("-") else ""
+                expected = Book.objects.order_by(ordering, prefix + "id").values_list("id", flat=True)
+                self.assertEqual([book["id"] for page in pages for book in page["results"]], list(expected))
+                self.assertEqual([len(page["results"]) for page in pages], [3, 3, 1])
+                self.assertIsNone(pages[0]["previous"])
+
+    def test_walk_back(self):
+        pages = self.walk("/api/books-store/books/?page_size=3&ordering=price")
+        middle = self.client.get(pages[2]["previous"]).json()
+        self.assertEqual(middle["results"], pages[1]["results"])
+        self.assertIsNotNone(middle["next"])
+        first = self.client.get(middle["previous"]).json()
+        self.assertEqual(first["results"], pages[0]["results"])
+        self.assertIsNone(first["previous"])
+
+    def test_invalid_cursor(self):
+        cursors = [
+            cursor_param(f="price", v="abc", id=1),
+            cursor_param(f="price", v=[1], id=1),
+            cursor_param(f="price", v="NaN", id=1),
+            cursor_param(f="price", v=None, id=1),
+            cursor_param(f="title", v="Book 1", id=1),
+            cursor_param(f="price", v="10", id="x"),
+            cursor_param(f="price", v="10"),
+            "not a cursor",
+        ]
+        for cursor in cursors:
+            with self.subTest(cursor):
+                response = self.client.get(f"/api/books-store/books/?ordering=price&cursor={cursor}")
+                self.assertEqual(response.status_code, 404)
+        response = self.client.get(f"/api/books-store/books/search/?q=book&cursor={cursor_param(f='rank', v=[1], id=1)}")
+        self.assertEqual(response.status_code, 404)
+
+
+class CatalogCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.book = make_books(3)[0]
+
+    def test_list_is_served_from_cache(self):
+        self.client.get("/api/books-store/books/?author=Author 1")
+        hits = stats.snapshot()["hit"]
+        with self.assertNumQueries(0):
+            response = self.client.get("/api/books-store/books/?author=Author+1")
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(len(response.json()), 1)
+        self.assertEqual(stats.snapshot()["hit"], hits + 1)
+
+    def test_write_invalidates(self):
+        self.client.get(f"/api/books-store/books/{self.book.pk}/")
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book.title = "Renamed"
+            self.book.save()
+        response = self.client.get(f"/api/books-store/books/{self.book.pk}/")
+        self.assertEqual(response["X-Cache"], "MISS")
+        self.assertEqual(response.json()["title"], "Renamed")
+
+
+class ConditionalGetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.book = make_books(3)[0]
+
+    def test_etag_round_trip(self):
+        for url in ("/api/books-store/books/", f"/api/books-store/books/{self.book.pk}/", "/api/books-store/books/?page_size=2"):
+            cache.clear()
+            etag = self.client.get(url)["ETag"]
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+            # served from the catalog cache this time
+            with self.assertNumQueries(0):
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304, url)
+
+    def test_changed_row_changes_etag(self):
+        url = f"/api/books-store/books/{self.book.pk}/"
+        etag = self.client.get(url)["ETag"]
+        Book.objects.filter(pk=self.book.pk).update(price=1)  # bypasses the cache version
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.book.save()
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_lists_are_not_validated_by_date(self):
+        url = "/api/books-store/books/"
+        response = self.client.get(url)
+        self.assertFalse(response.has_header("Last-Modified"))
+        self.assertTrue(self.client.get(f"/api/books-store/books/{self.book.pk}/").has_header("Last-Modified"))
+        # deleting a row leaves MAX(updated_at) where it was
+        Book.objects.filter(pk=self.book.pk).delete()
+        cache.clear()
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE="Fri, 01 Jan 2100 00:00:00 GMT")
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()), 2)
+
+
+class ImportBooksTests(TestCase):
+    def setUp(self):
+        self.dir = tempfile.TemporaryDirectory()
+        self.addCleanup(self.dir.cleanup)
+
+    def write(self, name, content):
+        path = Path(self.dir.name) / name
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    def run_import(self, path, **options):
+        call_command("import_books", path, no_covers=True, stdout=StringIO(), **options)
+
+    def test_jsonl_upserts_on_isbn(self):
+        Book.objects.create(
+            title="Old", author="A", price=1, isbn="111", description="", category=Category.objects.create(name="Old"),
+        )
+        rows = [
+            {"isbn": "111", "title": "New title", "price": "9.50", "category": "Fiction"},
+            {"isbn": "222", "title": "Second", "publication_date": 1999, "category": "Fiction"},
+            {"isbn": "222", "title": "Duplicate", "category": "Fiction"},
+        ]
+        self.run_import(self.write("books.jsonl", "\n".join(json.dumps(row) for row in rows)))
+        self.assertEqual(Book.objects.count(), 2)
+        self.assertEqual(Book.objects.get(isbn="111").title, "New title")
+        self.assertEqual(Book.objects.get(isbn="222").title, "Second")
+        self.assertEqual(Book.objects.get(isbn="222").category.name, "Fiction")
+
+    def test_json_array_and_csv(self):
+        rows = [{"isbn": f"j{i}", "title": f"Json {i}", "description": "x" * 1000} for i in range(50)]
+        self.run_import(self.write("books.json", json.dumps(rows)), batch_size=7)
+        self.run_import(self.write("books.csv", "isbn,title,author,price\nc1,Csv book,Someone,12.00\n"))
+        self.assertEqual(Book.objects.filter(isbn__startswith="j").count(), 50)
+        self.assertEqual(Book.objects.get(isbn="c1").price, Decimal("12.00"))
+
+    def test_resumes_after_checkpoint(self):
+        path = self.write("books.jsonl", "\n".join(json.dumps({"isbn": str(i), "title": f"T{i}"}) for i in range(10)))
+        Path(path + ".progress").write_text("6")
+        self.run_import(path)
+        self.assertEqual(sorted(Book.objects.values_list("isbn", flat=True)), ["6", "7", "8", "9"])
+        self.assertFalse(Path(path + ".progress").exists())
+
+    def test_rows_out_of_range_are_skipped(self):
+        rows = [
+            {"isbn": "ok", "title": "Fine", "price": "9.505", "rating": "4.5"},
+            {"isbn": "r", "title": "Rating", "rating": "10"},
+            {"isbn": "s", "title": "Stock", "stock": "-1"},
+            {"isbn": "p", "title": "Pages", "pages": "-3"},
+            {"isbn": "big", "title": "Price", "price": "1000000"},
+            {"isbn": "nan", "title": "NaN", "price": "NaN"},
+            {"isbn": "inf", "title": "Infinity", "price": "Infinity"},
+            {"isbn": "word", "title": "Word", "stock": "many"},
+            {"isbn": "r", "title": "Rating fixed", "rating": "5"},
+        ]
+        out = StringIO()
+        call_command("import_books", self.write("books.jsonl", "\n".join(json.dumps(row) for row in rows)),
+                     no_covers=True, stdout=out)
+        self.assertIn("skipped 7 invalid rows", out.getvalue())
+        self.assertEqual(sorted(Book.objects.values_list("isbn", flat=True)), ["ok", "r"])
+        self.assertEqual(Book.objects.get(isbn="ok").price, Decimal("9.51"))
+
+    def test_cover_names_are_safe(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        cover = self.write("cover.jpg", "jpeg bytes")
+        rows = [{"isbn": isbn, "title": isbn, "cover_url": cover} for isbn in ("../../etc", "a/b", "..")]
+        with override_settings(MEDIA_ROOT=media.name):
+            call_command("import_books", self.write("books.jsonl", "\n".join(json.dumps(row) for row in rows)), stdout=StringIO())
+        names = dict(Book.objects.values_list("isbn", "cover_image"))
+        self.assertEqual(len(names), 3)
+        self.assertFalse(names[".."])
+        for isbn in ("../../etc", "a/b"):
+            self.assertRegex(names[isbn], r"^books/[^/]+$")
+            self.assertTrue((Path(media.name) / names[isbn]).is_file())
+
+    def test_batches_are_indexed_and_queue_cover_variants(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        cover = self.write("cover.jpg", "jpeg bytes")
+        rows = [{"isbn": str(i), "title": f"T{i}", "cover_url": cover if i % 2 else ""} for i in range(5)]
+        path = self.write("books.jsonl", "\n".join(json.dumps(row) for row in rows))
+        with override_settings(MEDIA_ROOT=media.name), mock.patch.object(typeahead.index, "add_many") as add_many, \
+                mock.patch.object(covers.worker, "enqueue") as enqueue, self.captureOnCommitCallbacks(execute=True):
+            call_command("import_books", path, batch_size=2, stdout=StringIO())
+        # one index update per committed batch
+        self.assertEqual([[book.isbn for book in call.args[0]] for call in add_many.call_args_list], [["0", "1"], ["2", "3"], ["4"]])
+        with_cover = Book.objects.filter(isbn__in=["1", "3"]).values_list("pk", flat=True)
+        self.assertEqual(sorted(call.args[0] for call in enqueue.call_args_list), sorted(with_cover))
+
+
+class BulkCreateTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.category = Category.objects.create(name="Fiction")
+
+    def row(self, i, **extra):
+        return {
+            "title": f"Bulk {i}", "author": "A", "price": "10.00", "isbn": f"bulk-{i}",
+            "description": "d", "category": self.category.pk, **extra,
+        }
+
+    def test_bulk_create_is_a_fixed_number_of_queries(self):
+        rows = [self.row(i) for i in range(500)]
+        # categories + existing isbns + savepoint/insert/facet counts/release
+        with self.assertNumQueries(6), self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.post("/api/books-store/books/", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        # the catalog version and a single typeahead update
+        self.assertEqual(len(callbacks), 2)
+        self.assertEqual(response.json()["created"], 500)
+        self.assertEqual(Book.objects.count(), 500)
+
+    def test_bad_rows_are_reported_per_row(self):
+        make_books(1, self.category)
+        rows = [
+            self.row(0),
+            self.row(1, category=9999),
+            self.row(2, price="not a number"),
+            self.row(0, title="duplicate in payload"),
+            self.row(3, isbn=f"isbn-{self.category.pk}-0"),
+        ]
+        response = self.client.post("/api/books-store/books/", rows, format="json")
+        self.assertEqual(response.status_code, 207)
+        body = response.json()
+        self.assertEqual((body["created"], body["error"]), (1, 4))
+        self.assertEqual([result["status"] for result in body["results"]], ["created"] + ["error"] * 4)
+        self.assertIn("category", body["results"][1]["errors"])
+        self.assertIn("price", body["results"][2]["errors"])
+        self.assertIn("isbn", body["results"][3]["errors"])
+        self.assertIn("isbn", body["results"][4]["errors"])
+
+    def test_upsert_updates_existing_isbns(self):
+        book = make_books(1, self.category)[0]
+        rows = [self.row(0, isbn=book.isbn, title="Renamed"), self.row(1)]
+        response = self.client.post("/api/books-store/books/?upsert=true", rows, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual([result["status"] for result in response.json()["results"]], ["updated", "created"])
+        self.assertEqual(response.json()["results"][0]["id"], book.pk)
+        book.refresh_from_db()
+        self.assertEqual(book.title, "Renamed")
+
+    def test_upsert_keeps_fields_the_row_left_out(self):
+        book = make_books(1, self.category)[0]
+        Book.objects.filter(pk=book.pk).update(stock=7, rating=Decimal("4.50"), publisher="P", cover_image="books/c.jpg")
+        other = make_books(1, Category.objects.create(name="History"))[0]
+        facets.rebuild()
+        rows = [
+            self.row(0, isbn=book.isbn, price="700.00"),
+            self.row(1, isbn=other.isbn, stock=3, language="French"),
+            self.row(2),
+        ]
+        response = self.client.post("/api/books-store/books/?upsert=true", rows, format="json")
+        self.assertEqual([result["status"] for result in response.json()["results"]], ["updated", "updated", "created"])
+        book.refresh_from_db()
+        self.assertEqual((book.price, book.stock, book.rating, book.publisher), (Decimal("700.00"), 7, Decimal("4.50"), "P"))
+        self.assertEqual(book.cover_image.name, "books/c.jpg")
+        other.refresh_from_db()
+        self.assertEqual((other.stock, other.language, other.category_id), (3, "French", self.category.pk))
+        # the counts were shifted, not rebuilt, and agree with a live GROUP BY
+        stored = self.client.get("/api/books-store/books/facets/").json()
+        live = self.client.get("/api/books-store/books/facets/?price_min=0").json()
+        for facet in ("category", "author", "language", "format", "price"):
+            self.assertEqual(stored[facet], live[facet], facet)
+
+    def test_bulk_categories(self):
+        response = self.client.post("/api/books-store/categories/", [{"name": "Fiction"}, {"name": "History"}], format="json")
+        self.assertEqual(response.status_code, 207)
+        self.assertEqual([result["status"] for result in response.json()["results"]], ["error", "created"])
+
+
+def cover_file(size=(800, 1200), color="red"):
+    buffer = io.BytesIO()
+    Image.new("RGB", size, color).save(buffer, "PNG")
+    return ContentFile(buffer.getvalue(), name="cover.png")
+
+
+class CoverVariantTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, COVER_VARIANTS_ASYNC=False)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.category = Category.objects.create(name="Fiction")
+
+    def create_book(self, isbn):
+        with self.captureOnCommitCallbacks(execute=True):
+            book = Book.objects.create(
+                title="T", author="A", price=1, isbn=isbn, description="d",
+                category=self.category, cover_image=cover_file(),
+            )
+        book.refresh_from_db()
+        return book
+
+    def test_variants_are_built_and_shared(self):
+        first, second = self.create_book("1"), self.create_book("2")
+        variants = first.cover_variants["variants"]
+        self.assertEqual([width for width, _ in variants["webp"]], [160, 320, 640])
+        self.assertIn("jpeg", variants)
+        # same pixels, same content-addressed files
+        self.assertEqual(variants, second.cover_variants["variants"])
+        self.assertEqual(first.cover_image.name, second.cover_image.name)
+
+    def test_serializer_exposes_thumb_and_srcset(self):
+        book = self.create_book("1")
+        body = APIClient().get(f"/api/books-store/books/{book.pk}/").json()
+        self.assertTrue(body["cover_thumb"].endswith(".webp"))
+        self.assertEqual(body["cover_srcset"]["webp"].count("w,"), 2)
+        self.assertNotIn("cover_variants", body)
+
+    def test_backfill_command(self):
+        book = self.create_book("1")
+        Book.objects.filter(pk=book.pk).update(cover_variants={})
+        call_command("build_cover_variants", workers=1, stdout=StringIO())
+        book.refresh_from_db()
+        self.assertEqual(book.cover_variants["source"], book.cover_image.name)
+
+
+class MediaServingTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory()
+        self.addCleanup(media.cleanup)
+        override = override_settings(MEDIA_ROOT=media.name, MEDIA_SENDFILE="")
+        override.enable()
+        self.addCleanup(override.disable)
+        self.name = default_storage.save("books/cover.jpg", ContentFile(b"0123456789" * 10))
+        self.url = f"/media/{self.name}"
+
+    def test_uploads_get_content_hashed_names(self):
+        self.assertRegex(self.name, r"^books/cover\.[0-9a-f]{16}\.jpg$")
+        # same bytes, same file
+        self.assertEqual(default_storage.save("books/cover.jpg", ContentFile(b"0123456789" * 10)), self.name)
+
+    def test_hashed_names_are_immutable(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789" * 10)
+        self.assertIn("immutable", response["Cache-Control"])
+        revalidated = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(revalidated.status_code, 304)
+
+    def test_range_requests(self):
+        response = self.client.get(self.url, HTTP_RANGE="bytes=10-19")
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response["Content-Range"], "bytes 10-19/100")
+        self.assertEqual(b"".join(response.streaming_content), b"0123456789")
+        tail = self.client.get(self.url, HTTP_RANGE="bytes=-5")
+        self.assertEqual(b"".join(tail.streaming_content), b"56789")
+        self.assertEqual(self.client.get(self.url, HTTP_RANGE="bytes=500-").status_code, 416)
+
+    def test_offload_to_front_server(self):
+        with override_settings(MEDIA_SENDFILE="x-accel-redirect"):
+            response = self.client.get(self.url)
+        self.assertEqual(response["X-Accel-Redirect"], f"/protected-media/{self.name}")
+        self.assertEqual(response.content, b"")
+        self.assertEqual(self.client.get("/media/books/missing.jpg").status_code, 404)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        category = Category.objects.create(name="Fiction")
+
+        def book(title, description="", author="Someone"):
+            return Book.objects.create(
+                title=title, author=author, description=description, price=1, isbn=title[:20], category=category,
+            )
+
+        self.potter = book("Harry Potter", author="J. K. Rowling")
+        self.titled = book("River of Shadows")
+        self.described = book("Quiet Waters", description="A long walk along the river")
+        self.unrelated = book("Gardening Basics")
+
+    def search(self, query):
+        return self.client.get(f"/api/books-store/books/search/?{query}")
+
+    def ids(self, response):
+        return [row["id"] for row in response.json()["results"]]
+
+    def test_ranking(self):
+        # title words weigh more than description words
+        self.assertEqual(self.ids(self.search("q=river")), [self.titled.pk, self.described.pk])
+
+    def test_last_word_is_a_prefix(self):
+        self.assertEqual(self.ids(self.search("q=harry+pot")), [self.potter.pk])
+        self.assertEqual(self.ids(self.search("q=Harry+Potter")), [self.potter.pk])
+        self.assertEqual(self.ids(self.search("q=shad")), [self.titled.pk])
+
+    def test_typo_fallback(self):
+        if not trigram_available():
+            self.skipTest("pg_trgm operator classes are not installed")
+        response = self.search("q=hary+poter")
+        self.assertEqual(self.ids(response), [self.potter.pk])
+
+    def test_blank_query(self):
+        for query in ("", "q=", "q=+++"):
+            with self.subTest(query):
+                self.assertEqual(self.search(query).status_code, 400)
+
+    def test_pagination(self):
+        books = [
+            Book.objects.create(title=f"Mystery {i}", author="A", description="mystery " * i, price=1, isbn=f"m{i}",
+                                category=self.potter.category)
+            for i in range(1, 6)
+        ]
+        pages, url = [], "/api/books-store/books/search/?q=mystery&page_size=2"
+        while url:
+            body = self.client.get(url).json()
+            pages.append([row["id"] for row in body["results"]])
+            url = body["next"]
+        self.assertEqual([len(page) for page in pages], [2, 2, 1])
+        found = [book_id for page in pages for book_id in page]
+        self.assertEqual(sorted(found), sorted(book.pk for book in books))
+        expected = search_books(Book.objects.all(), "mystery").order_by("-rank", "-id").values_list("id", flat=True)
+        self.assertEqual(found, list(expected))
+
+
+class TypeaheadTests(TestCase):
+    def setUp(self):
+        category = Category.objects.create(name="Fiction")
+        self.hobbit, self.potter, self.emile = Book.objects.bulk_create(
+            Book(title=title, author=author, rating=rating, price=1, isbn=title, description="", category=category)
+            for title, author, rating in (
+                ("The Hobbit", "J. R. R. Tolkien", Decimal("4.8")),
+                ("Harry Potter", "J. K. Rowling", Decimal("4.5")),
+                ("Émile", "Rousseau", None),
+            )
+        )
+        self.index = typeahead.PrefixIndex(max_bytes=10 ** 6, max_age=60, background=False)
+
+    def ids(self, prefix, limit=10):
+        return [row[0] for row in self.index.lookup(prefix, limit)]
+
+    def test_prefix_matching(self):
+        self.assertEqual(self.ids("hob"), [self.hobbit.pk])
+        self.assertEqual(self.ids("TOLK"), [self.hobbit.pk])
+        self.assertEqual(self.ids("emi"), [self.emile.pk])
+        self.assertEqual(self.ids("harry pot"), [self.potter.pk])
+        # word starts only
+        self.assertEqual(self.ids("otter"), [])
+        self.assertEqual(self.ids("  "), [])
+
+    def test_ranking(self):
+        # matching keys in order ("j k rowling" before "j r r tolkien"), every book once
+        self.assertEqual(self.ids("j"), [self.potter.pk, self.hobbit.pk])
+        self.assertEqual(self.ids("j", limit=1), [self.potter.pk])
+        self.assertEqual(self.ids("h"), [self.potter.pk, self.hobbit.pk])
+
+    def test_memory_ceiling_keeps_the_best_rated(self):
+        cost = self.index.entry_size(typeahead.keys_for("The Hobbit", "J. R. R. Tolkien"), ("The Hobbit", "J. R. R. Tolkien", ""))
+        self.index.max_bytes = cost
+        self.assertEqual(self.ids("h"), [self.hobbit.pk])
+        self.assertEqual(self.index.size, cost)
+        # a book that does not fit is not added either
+        self.index.add(self.potter)
+        self.assertEqual(self.ids("harry"), [])
+
+    def test_add_and_discard(self):
+        self.index.build()
+        self.hobbit.title = "There and Back Again"
+        self.index.add(self.hobbit)
+        self.assertEqual(self.ids("hob"), [])
+        self.assertEqual(self.ids("back"), [self.hobbit.pk])
+        entries = self.index.entries
+        self.index.discard(self.hobbit.pk)
+        self.assertEqual(self.ids("back"), [])
+        self.assertEqual(self.ids("tolk"), [])
+        # updated in place, not copied
+        self.assertIs(self.index.entries, entries)
+        self.index.discard(self.hobbit.pk)
+        self.assertEqual(len(self.index.books), 2)
+
+    def test_add_many(self):
+        self.index.build()
+        size = self.index.size
+        books = [Book(pk=10 ** 6 + i, title=f"Volume {i:03}", author="Series Writer") for i in range(typeahead.INSORT_LIMIT + 1)]
+        self.potter.title = "Harry Potter and the Goblet of Fire"
+        self.index.add_many(books + [self.potter])
+        self.assertEqual(self.index.entries, sorted(self.index.entries))
+        self.assertEqual(self.ids("volume 00"), [book.pk for book in books[:10]])
+        self.assertEqual(self.ids("goblet"), [self.potter.pk])
+        self.index.add_many(books[:2])
+        self.assertEqual(len(self.index.books), 3 + len(books))
+        # sizes follow the records, refreshing a book does not count it twice
+        self.index.change_many([(book.pk, None) for book in books])
+        self.potter.title = "Harry Potter"
+        self.index.add(self.potter)
+        self.assertEqual(self.index.size, size)
+
+    def test_changes_during_a_build_are_kept(self):
+        extra = Book(pk=10 ** 6, title="Dune", author="Frank Herbert")
+        keys_for = typeahead.keys_for
+
+        def keys_and_write(title, author):
+            if title == "The Hobbit":
+                # another thread commits a book and deletes one mid-build
+                self.index.add(extra)
+                self.index.discard(self.emile.pk)
+            return keys_for(title, author)
+
+        with mock.patch.object(typeahead, "keys_for", side_effect=keys_and_write):
+            self.index.build()
+        self.assertEqual(self.ids("dune"), [extra.pk])
+        self.assertEqual(self.ids("emi"), [])
+
+    def test_stale_index_is_rebuilt_once_in_the_background(self):
+        self.index.build()
+        self.index.max_age, self.index.background = 0, True
+        release = threading.Event()
+        with mock.patch.object(self.index, "build", side_effect=release.wait) as build:
+            lookups = [threading.Thread(target=self.ids, args=("hob",)) for _ in range(8)]
+            for thread in lookups:
+                thread.start()
+            for thread in lookups:
+                thread.join()
+            # the old index answers meanwhile
+            self.assertEqual(self.ids("hob"), [self.hobbit.pk])
+            release.set()
+        self.assertEqual(build.call_count, 1)
+
+
+class FacetTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.fiction = Category.objects.create(name="Fiction")
+        self.history = Category.objects.create(name="History")
+        make_books(6, self.fiction)
+        make_books(3, self.history)
+        # make_books bulk inserts, so the table starts from a rebuild
+        facets.rebuild()
+
+    def get(self, query=""):
+        return APIClient().get(f"/api/books-store/books/facets/?{query}").json()
+
+    def counts(self, body, facet):
+        return {entry["value"]: entry["count"] for entry in body[facet]}
+
+    def test_stored_counts(self):
+        body = self.get()
+        self.assertEqual(body["total"], 9)
+        self.assertEqual(self.counts(body, "category"), {self.fiction.pk: 6, self.history.pk: 3})
+        self.assertEqual(self.counts(body, "author"), {"Author 0": 3, "Author 1": 3, "Author 2": 3})
+        self.assertEqual(self.counts(body, "price"), {"100-250": 9})
+
+        body = self.get(f"category={self.history.pk}")
+        self.assertEqual(body["total"], 3)
+        # the category facet keeps showing every category
+        self.assertEqual(self.counts(body, "category"), {self.fiction.pk: 6, self.history.pk: 3})
+
+    def test_saves_and_deletes_keep_counts_in_step(self):
+        book = Book.objects.filter(category=self.fiction).first()
+        book.category = self.history
+        book.price = Decimal("600")
+        book.stock = 4
+        book.save()
+        Book.objects.filter(category=self.fiction).last().delete()
+        stored = self.get()
+        # an author filter always groups live
+        live = self.get("author=Author")
+        self.assertEqual(self.counts(stored, "category"), {self.fiction.pk: 4, self.history.pk: 4})
+        for facet in ("category", "author", "language", "format", "price"):
+            self.assertEqual(self.counts(stored, facet), self.counts(live, facet), facet)
+        self.assertEqual(self.get("in_stock=true")["total"], 1)
+
+    def test_price_and_stock_selections_come_from_the_table(self):
+        Book.objects.filter(price__lt=103).update(stock=1)
+        Book.objects.filter(category=self.history).update(price=Decimal("300"))
+        facets.rebuild()
+        for query in ("price_min=250", "price_max=249.99&in_stock=true", f"category={self.fiction.pk}&in_stock=false"):
+            with self.assertNumQueries(5):
+                body = self.get(query)
+            self.assertEqual(body, self.get(f"{query}&author=Author"), query)
+
+    def test_price_bounds_inside_a_bucket(self):
+        Book.objects.filter(category=self.history).update(price=Decimal("300"))
+        facets.rebuild()
+        body = self.get(f"category={self.fiction.pk}&price_max=102")
+        self.assertEqual(body["total"], 3)
+        self.assertEqual(self.counts(body, "category"), {self.fiction.pk: 3})
+        for query in ("price_min=102&price_max=300", "price_min=101.5", "price_max=250"):
+            self.assertEqual(self.get(query), self.get(f"{query}&author=Author"), query)
+        self.assertEqual(APIClient().get("/api/books-store/books/facets/?price_min=abc").status_code, 400)
+
+
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN the queries the catalog endpoints issue against a synthetic
+    catalog, so a model change that drops or bypasses an index fails here
+    instead of turning into a sequential scan in production.
+    """
+
+    BOOKS = 30000
+    PAGE = 25
+
+    @classmethod
+    def setUpTestData(cls):
+        seed_books(cls.BOOKS)
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE bookstore_book")
+        cls.category = Category.objects.get(name="Fiction")
+
+    def filtered(self, **params):
+        return BookFilter(params, queryset=Book.objects.all()).qs
+
+    def page(self, queryset, field="price"):
+        return queryset.order_by(field, "id")[:self.PAGE + 1]
+
+    def assertUsesIndex(self, queryset, index):
+        plan = queryset.explain()
+        self.assertIn(index, plan, plan)
+        self.assertNotIn("Seq Scan on bookstore_book", plan, plan)
+
+    def requireTrigram(self):
+        # only a missing pg_trgm skips, a dropped or renamed index must fail in assertUsesIndex()
+        if not trigram_available():
+            self.skipTest("pg_trgm operator classes are not installed")
+
+    def test_category(self):
+        self.assertUsesIndex(self.page(self.filtered(category=self.category.pk)), "book_category_price_idx")
+
+    def test_category_and_price_range(self):
+        queryset = self.filtered(category=self.category.pk, price_min=200, price_max=300)
+        self.assertUsesIndex(self.page(queryset), "book_category_price_idx")
+
+    def test_price_range(self):
+        self.assertUsesIndex(self.page(self.filtered(price_min=200, price_max=300)), "book_price_id_idx")
+
+    def test_keyset_next_page(self):
+        queryset = Book.objects.filter(Q(price__gte=500) & (Q(price__gt=500) | Q(id__gt=1000)))
+        self.assertUsesIndex(self.page(queryset), "book_price_id_idx")
+
+    def test_title_ordering(self):
+        self.assertUsesIndex(self.page(Book.objects.all(), "title"), "book_title_id_idx")
+
+    def test_in_stock(self):
+        self.assertUsesIndex(self.page(self.filtered(in_stock="true")), "book_in_stock_price_idx")
+
+    def test_author_wise_books(self):
+        self.assertUsesIndex(Book.objects.order_by("author", "id").distinct("author"), "book_author_id_idx")
+
+    def test_author(self):
+        self.requireTrigram()
+        self.assertUsesIndex(self.filtered(author="Kapoor"), "book_author_upper_trgm_idx")
+
+    def test_full_text_search(self):
+        queryset = search_books(Book.objects.all(), "shadow river").order_by("-rank", "-id")[:self.PAGE]
+        self.assertUsesIndex(queryset, "book_search_vector_idx")
+
+
+class InstrumentationTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        instrumentation.registry.reset()
+        self.client = APIClient()
+        make_books(3)
+
+    def test_metrics_endpoint(self):
+        response = self.client.get("/api/books-store/books/")
+        # the timings stay in /metrics/ unless PERF_SERVER_TIMING is on
+        self.assertNotIn("Server-Timing", response)
+        self.assertEqual(self.client.get("/metrics/").status_code, 401)
+
+        staff = User.objects.create_user(email="ops@example.com", password="secret", is_staff=True)
+        self.client.force_authenticate(staff)
+        body = self.client.get("/metrics/").content.decode()
+        self.assertIn('http_requests_total{view="products-list",method="GET",status="200"} 1', body)
+        self.assertIn('db_queries_total{view="products-list"} 2', body)
+        self.assertIn('http_request_duration_seconds_count{view="products-list"} 1', body)
+        self.assertIn('catalog_cache_requests_total{result="miss"}', body)
+        self.assertRegex(body, r'serializer_duration_seconds_total\{view="products-list"\} 0\.\d+')
+
+    def test_repeated_sql_shapes_are_flagged(self):
+        def view(request):
+            for book in Book.objects.all():
+                Category.objects.get(pk=book.category_id)
+            return HttpResponse("ok")
+
+        middleware = instrumentation.InstrumentationMiddleware(view)
+        with override_settings(PERF_N_PLUS_ONE_THRESHOLD=3), self.assertLogs("bookstore.instrumentation", "WARNING") as logs:
+            middleware(RequestFactory().get("/"))
+        self.assertIn("Possible N+1", logs.output[0])
+        self.assertEqual(instrumentation.registry.n_plus_one["unresolved"], 1)
+
+    def test_queries_on_every_alias_are_counted(self):
+        # a second connection to the test database stands in for a replica
+        replica = connections.create_connection("default")
+        self.addCleanup(replica.close)
+
+        def view(request):
+            list(Book.objects.all())
+            with replica.cursor() as cursor:
+                cursor.execute("SELECT 1")
+            return HttpResponse("ok")
+
+        with mock.patch.object(instrumentation, "connections", {"default": connection, "replica_1": replica}), \
+                override_settings(PERF_SERVER_TIMING=True):
+            response = instrumentation.InstrumentationMiddleware(view)(RequestFactory().get("/"))
+        self.assertIn('desc="2 queries"', response["Server-Timing"])
+
+    def test_profile_sampling(self):
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(PERF_PROFILE_SAMPLE_RATE=1.0, PERF_PROFILE_DIR=directory):
+                self.client.get("/api/books-store/books/")
+            self.assertEqual(len(list(Path(directory).glob("products-list-*.prof"))), 1)
+
+
+class AsyncRouteTests(TestCase):
+    """The ASGI routes answer like the sync views"""
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        fiction = Category.objects.create(name="Fiction")
+        self.book = make_books(5, fiction)[0]
+        make_books(3, Category.objects.create(name="History"))
+        self.category = fiction
+
+    def get(self, url, **headers):
+        return async_to_sync(self.async_client.get)(url, headers=headers)
+
+    @override_settings(CATALOG_CACHE_TIMEOUT=0)
+    def test_same_bodies_as_sync(self):
+        for url in (
+            "/api/books-store/books/",
+            "/api/books-store/books/?page_size=3",
+            f"/api/books-store/books/?category={self.category.pk}&ordering=-price&page_size=2",
+            f"/api/books-store/books/{self.book.pk}/",
+            "/api/books-store/categories/",
+        ):
+            expected = self.client.get(url)
+            response = self.get(url)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertTrue(iscoroutinefunction(response.resolver_match.func), url)
+            self.assertEqual(response.json(), expected.json(), url)
+            self.assertEqual(response["ETag"], expected["ETag"], url)
+
+        next_page = self.get("/api/books-store/books/?page_size=3").json()["next"]
+        self.assertEqual(self.get(next_page).json(), self.client.get(next_page).json())
+
+    def test_errors(self):
+        for url, status in (
+            ("/api/books-store/books/999999/", 404),
+            ("/api/books-store/books/abc/", 404),
+            ("/api/books-store/books/?price_min=cheap", 400),
+        ):
+            self.assertEqual(self.get(url).status_code, status, url)
+        response = self.get("/api/books-store/books/", authorization="Bearer not-a-token")
+        self.assertEqual(response.status_code, 401)
+        self.assertIn("Bearer", response["WWW-Authenticate"])
+
+    def test_conditional_get_and_shared_cache(self):
+        url = f"/api/books-store/books/{self.book.pk}/"
+        etag = self.client.get(url)["ETag"]
+        with override_settings(PERF_SERVER_TIMING=True):
+            response = self.get(url)
+        self.assertEqual(response["X-Cache"], "HIT")
+        self.assertEqual(self.get(url, if_none_match=etag).status_code, 304)
+        self.assertIn("db;dur=", response["Server-Timing"])
+
+    def test_other_methods_use_the_sync_views(self):
+        response = async_to_sync(self.async_client.post)(
+            "/api/books-store/categories/", {"name": "Poetry"}, content_type="application/json"
+        )
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(Category.objects.filter(name="Poetry").exists())
+        # the browsable API stays on the sync view too
+        response = self.get("/api/books-store/categories/", accept="text/html")
+        self.assertEqual(response["Content-Type"], "text/html; charset=utf-8")
+
+    def test_verify_token_and_cart_summary(self):
+        from accounts.authentication import ClaimsRefreshToken
+
+        user = User.objects.create_user(email="reader@example.com", password="secret", first_name="Ann")
+        auth = {"authorization": f"Bearer {ClaimsRefreshToken.for_user(user).access_token}"}
+        response = self.get("/api/accounts/users/verify_token/", **auth)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json(), self.client.get("/api/accounts/users/verify_token/", headers=auth).json())
+        self.assertEqual(response.json()["user"]["first_name"], "Ann")
+
+        self.assertEqual(self.get("/api/cart/cart/summary/", **auth).json(), {"id": None, "item_count": 0, "total_price": "0.00"})
+        self.assertEqual(self.get("/api/cart/cart/summary/").status_code, 401)
+
+        user.set_password("changed")
+        user.save()
+        self.assertEqual(self.get("/api/accounts/users/verify_token/", **auth).status_code, 401)
+
+
+@override_settings(DATABASE_REPLICAS=["replica_1"], REPLICA_PIN_SECONDS=5)
+class ReplicaRoutingTests(SimpleTestCase):
+    def setUp(self):
+        cache.clear()
+        self.router = routers.ReplicaRouter()
+        self.reader = User(pk=1, email="reader@example.com")
+
+    def route(self, method, user=None, model=Book, status=200):
+        """The alias a read of `model` goes to during a request, with the user DRF authenticated"""
+        seen = []
+
+        def view(request):
+            if user is not None:
+                request.user = user
+            seen.append(self.router.db_for_read(model))
+            return HttpResponse(status=status)
+
+        routers.ReplicaPinMiddleware(view)(RequestFactory().generic(method, "/"))
+        return seen[0]
+
+    def test_reads(self):
+        self.assertEqual(self.route("GET"), "replica_1")
+        self.assertEqual(self.route("GET", model=Order), "replica_1")
+        self.assertIsNone(self.route("GET", model=Cart))
+        self.assertEqual(self.route("POST"), "default")
+        # management commands and workers
+        self.assertEqual(self.router.db_for_read(Book), "default")
+        self.assertEqual(self.router.db_for_write(Book), "default")
+        self.assertFalse(self.router.allow_migrate("replica_1", "bookstore"))
+
+    def test_reads_follow_own_writes(self):
+        self.assertEqual(self.route("GET", self.reader, Order), "replica_1")
+        self.route("POST", self.reader, status=400)
+        self.assertEqual(self.route("GET", self.reader, Order), "replica_1")
+
+        self.route("POST", self.reader, status=201)
+        self.assertEqual(self.route("GET", self.reader, Order), "default")
+        self.assertEqual(self.route("GET", User(pk=2, email="other@example.com"), Order), "replica_1")
+        cache.delete(routers.pin_key(self.reader.pk))  # the pin expired
+        self.assertEqual(self.route("GET", self.reader, Order), "replica_1")
+
+    @override_settings(DATABASE_REPLICAS=[])
+    def test_no_replicas(self):
+        self.assertIsNone(self.route("GET"))
+        self.route("POST", self.reader, status=201)
+        self.assertIsNone(cache.get(routers.pin_key(self.reader.pk)))
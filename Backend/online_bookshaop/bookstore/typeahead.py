@@ -0,0 +1,225 @@
+# bookstore/typeahead.py
+"""
+In-process prefix index over book titles and authors for autocomplete.
+
+Every word start of a title or author becomes a key in one sorted list of
+``(key, book_id)`` tuples, so a lookup is a bisect plus a short forward scan
+and never touches the database. The index is built lazily, kept current in
+this process by the Book signals, and rebuilt after TYPEAHEAD_MAX_AGE seconds
+to pick up writes made by other processes.
+
+Writers update the sorted list in place and lookups scan it, both under one
+lock; a change is an insort per key, a batch (``add_many()``) one merge sort. A
+stale index is rebuilt once, on a background thread, and keeps serving until
+the new one is swapped in; changes made while a build runs are replayed onto
+its result.
+"""
+import bisect
+import re
+import sys
+import threading
+import time
+import unicodedata
+
+from django.conf import settings
+from django.db import close_old_connections
+
+WORD_RE = re.compile(r"\w+")
+# longer keys do not help matching what a user types
+MAX_KEY_LENGTH = 40
+# rough per-entry overhead of the tuple and list slot on top of the key itself
+ENTRY_OVERHEAD = 72
+# past this many changes at once, one filter and sort beats an insort per key
+INSORT_LIMIT = 64
+
+
+def normalize(text):
+    """Lowercase, strip accents and collapse punctuation to single spaces"""
+    text = unicodedata.normalize("NFKD", text or "")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(WORD_RE.findall(text.lower()))
+
+
+def keys_for(title, author):
+    keys = set()
+    for text in (title, author):
+        text = normalize(text)
+        for match in re.finditer(r"\b\w", text):
+            keys.add(text[match.start():][:MAX_KEY_LENGTH])
+    return keys
+
+
+class PrefixIndex:
+    def __init__(self, max_bytes=None, max_age=None, background=None):
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.background = background
+        # guards entries/books/size, held by writers and by lookups while they scan
+        self.lock = threading.Lock()
+        # one build at a time
+        self.build_lock = threading.Lock()
+        self.entries = None  # sorted [(key, book_id)], None until first use
+        self.books = {}  # book_id -> (title, author, cover_image name)
+        self.size = 0
+        self.built_at = 0
+        self.pending = None  # changes made while a build runs, replayed onto its result
+        self.rebuilding = False
+
+    def get_max_bytes(self):
+        return self.max_bytes or settings.TYPEAHEAD_MAX_BYTES
+
+    def get_max_age(self):
+        return self.max_age if self.max_age is not None else settings.TYPEAHEAD_MAX_AGE
+
+    def get_background(self):
+        return self.background if self.background is not None else settings.TYPEAHEAD_REBUILD_ASYNC
+
+    def entry_size(self, keys, record):
+        size = sum(sys.getsizeof(key) + ENTRY_OVERHEAD for key in keys)
+        return size + sum(sys.getsizeof(value) for value in record) + ENTRY_OVERHEAD
+
+    def build(self):
+        """(Re)build from the database, best rated books first until the memory ceiling"""
+        with self.build_lock:
+            self.build_locked()
+
+    def build_locked(self):
+        from django.db.models import F
+
+        from .models import Book
+
+        with self.lock:
+            self.pending = []
+        try:
+            entries, books, size = [], {}, 0
+            max_bytes = self.get_max_bytes()
+            rows = Book.objects.order_by(F("rating").desc(nulls_last=True), "id").values_list("id", "title", "author", "cover_image")
+            for book_id, title, author, cover in rows.iterator(chunk_size=2000):
+                keys = keys_for(title, author)
+                record = (title, author, cover or "")
+                cost = self.entry_size(keys, record)
+                if size + cost > max_bytes:
+                    break
+                entries.extend((key, book_id) for key in keys)
+                books[book_id] = record
+                size += cost
+            entries.sort()
+            with self.lock:
+                self.entries, self.books, self.size = entries, books, size
+                self.apply_locked(self.pending)
+                self.built_at = time.monotonic()
+        finally:
+            with self.lock:
+                self.pending = None
+
+    def rebuild_in_background(self):
+        def run():
+            try:
+                self.build()
+            finally:
+                self.rebuilding = False
+                close_old_connections()
+
+        with self.lock:
+            if self.rebuilding:
+                return
+            self.rebuilding = True
+        threading.Thread(target=run, name="typeahead-rebuild", daemon=True).start()
+
+    def ensure_built(self):
+        if self.entries is None:
+            # nothing to serve yet, concurrent first lookups wait for a single build
+            with self.build_lock:
+                if self.entries is None:
+                    self.build_locked()
+        elif time.monotonic() - self.built_at > self.get_max_age():
+            if self.get_background():
+                self.rebuild_in_background()
+            elif self.build_lock.acquire(blocking=False):
+                # another request is already rebuilding, the current index serves meanwhile
+                try:
+                    self.build_locked()
+                finally:
+                    self.build_lock.release()
+
+    def unset_locked(self, book_id):
+        old = self.books.pop(book_id, None)
+        if old is not None:
+            self.size -= self.entry_size(keys_for(old[0], old[1]), old)
+        return old
+
+    def keys_if_fits_locked(self, book_id, record):
+        """Record `book_id` in books and return its keys, None when it would pass the memory ceiling"""
+        keys = keys_for(record[0], record[1])
+        cost = self.entry_size(keys, record)
+        if self.size + cost > self.get_max_bytes():
+            return None
+        self.books[book_id] = record
+        self.size += cost
+        return keys
+
+    def apply_locked(self, changes):
+        """Apply [(book_id, record or None to remove)] to the lists in place"""
+        if len(changes) <= INSORT_LIMIT:
+            for book_id, record in changes:
+                old = self.unset_locked(book_id)
+                if old is not None:
+                    for key in keys_for(old[0], old[1]):
+                        position = bisect.bisect_left(self.entries, (key, book_id))
+                        if position < len(self.entries) and self.entries[position] == (key, book_id):
+                            del self.entries[position]
+                if record is not None:
+                    for key in self.keys_if_fits_locked(book_id, record) or ():
+                        bisect.insort(self.entries, (key, book_id))
+            return
+        latest = dict(changes)
+        for book_id in latest:
+            self.unset_locked(book_id)
+        self.entries[:] = [entry for entry in self.entries if entry[1] not in latest]
+        for book_id, record in latest.items():
+            if record is not None:
+                self.entries.extend((key, book_id) for key in self.keys_if_fits_locked(book_id, record) or ())
+        # the list is two sorted runs, which the sort merges in linear time
+        self.entries.sort()
+
+    def change_many(self, changes):
+        with self.lock:
+            if self.pending is not None:
+                self.pending.extend(changes)
+            if self.entries is not None:
+                self.apply_locked(changes)
+
+    def add(self, book):
+        """Insert or refresh one book"""
+        self.add_many([book])
+
+    def add_many(self, books):
+        """Insert or refresh several books with one update of the index"""
+        self.change_many([(book.pk, (book.title, book.author, book.cover_image.name if book.cover_image else "")) for book in books])
+
+    def discard(self, book_id):
+        self.change_many([(book_id, None)])
+
+    def lookup(self, prefix, limit=10):
+        """Up to `limit` (book_id, title, author, cover_image) whose title or author has a word starting with `prefix`"""
+        prefix = normalize(prefix)[:MAX_KEY_LENGTH]
+        if not prefix:
+            return []
+        self.ensure_built()
+        results, seen = [], set()
+        with self.lock:
+            entries, books = self.entries, self.books
+            position = bisect.bisect_left(entries, (prefix,))
+            while position < len(entries) and len(results) < limit:
+                key, book_id = entries[position]
+                if not key.startswith(prefix):
+                    break
+                record = books.get(book_id)
+                if record is not None and book_id not in seen:
+                    seen.add(book_id)
+                    results.append((book_id,) + record)
+                position += 1
+        return results
+
+
+index = PrefixIndex()
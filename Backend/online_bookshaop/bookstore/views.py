@@ -1,7 +1,19 @@
 # bookstore/views.py
+from functools import partial
+
 from rest_framework import viewsets,status
 from .models import Book, Category
-from .serializers import BookSerializer, CategorySerializer,BookFilter
+from .serializers import BookSerializer, CategorySerializer,BookFilter, BookBulkSerializer, CategoryBulkSerializer
+from .pagination import KeysetPagination, SearchPagination
+from .search import search_books, fuzzy_search_books
+from . import facets, typeahead
+from .cache import cached_response
+from .conditional import ConditionalGetMixin, latest
+from .bulk import BulkCreateMixin
+from cart.models import Cart
+from django.db import transaction
+from django.db.models import Count, Max
+from django.conf import settings
 from rest_framework.permissions import IsAdminUser
 from rest_framework import viewsets
 from rest_framework.response import Response
@@ -10,40 +22,149 @@ from django.db.models import Sum
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
 from rest_framework.renderers import JSONRenderer, BrowsableAPIRenderer
+from rest_framework.utils.urls import replace_query_param
 
-class BookViewSet(viewsets.ModelViewSet):
-    queryset = Book.objects.all()
+class BookViewSet(BulkCreateMixin, ConditionalGetMixin, viewsets.ModelViewSet):
+    queryset = BookSerializer.setup_eager_loading(Book.objects.all())
     serializer_class = BookSerializer
     # permission_classes = [IsAdminUser]  
     filter_backends = [DjangoFilterBackend]
     filterset_class = BookFilter
+    pagination_class = KeysetPagination
     renderer_classes = [JSONRenderer]
+    bulk_serializer_class = BookBulkSerializer
+    bulk_unique_field = "isbn"
+
+    def object_validators(self, obj):
+        # category_name is part of the body
+        updated = latest(obj.updated_at, obj.category.updated_at)
+        return (obj.pk, obj.updated_at, obj.category.updated_at), updated
+
+    def rows_validators(self, rows):
+        updated = latest(*(row.updated_at for row in rows), *(row.category.updated_at for row in rows))
+        return [(row.pk, row.updated_at, row.category.updated_at) for row in rows], updated
+
+    def validator_aggregates(self):
+        return {"count": Count("pk"), "updated": Max("updated_at"), "category": Max("category__updated_at")}
+
+    def aggregate_validators(self, aggregate):
+        return tuple(aggregate.values()), latest(aggregate["updated"], aggregate["category"])
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
+    @cached_response
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+    @cached_response
+    async def aretrieve(self, request, *args, **kwargs):
+        return await super().aretrieve(request, *args, **kwargs)
+
+    def bulk_check(self, valid):
+        category_ids = {attrs["category_id"] for _, attrs in valid}
+        found = set(Category.objects.filter(pk__in=category_ids).values_list("pk", flat=True))
+        return {
+            index: {"category": [f'Invalid pk "{attrs["category_id"]}" - object does not exist.']}
+            for index, attrs in valid
+            if attrs["category_id"] not in found
+        }
 
+    def bulk_writing(self, books, existing):
+        updated = [book.isbn for book in books if book.isbn in existing]
+        # the facet values an upsert replaces, locked so the delta stays exact
+        replaced = Book.objects.filter(isbn__in=updated).order_by("pk").select_for_update()
+        self.replaced_facet_keys = facets.stored_keys(replaced) if updated else []
+
+    def bulk_written(self, books, existing):
+        super().bulk_written(books, existing)
+        updated = [book.pk for book in books if book.isbn in existing]
+        added = [key for book in books if book.isbn not in existing for key in facets.book_keys(book)]
+        if updated:
+            # prices may have moved under existing carts
+            Cart.recalculate(Cart.objects.filter(items__book__in=updated))
+            # fields a row left out kept their stored value, read back what was written
+            added += facets.stored_keys(Book.objects.filter(pk__in=updated))
+        facets.replace_keys(self.replaced_facet_keys, added)
+        # one index update for the whole payload
+        transaction.on_commit(partial(typeahead.index.add_many, books))
 
-    def create(self, request, *args, **kwargs):
-        many = isinstance(request.data, list)
-        serializer = self.get_serializer(data=request.data, many=many)
-        
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
-    
     @action(detail=False,methods=["get"],permission_classes = [AllowAny])
+    @cached_response
     def author_wise_books(self,request,*args,**kwargs):
-        books = Book.objects.distinct('author')
+        # first book of each author, read in book_author_id_idx order
+        books = BookSerializer.setup_eager_loading(Book.objects.order_by('author', 'id').distinct('author'))
         serializer = self.get_serializer(books,many= True)
         return Response(serializer.data)
 
-class CategoryViewSet(viewsets.ModelViewSet):
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    @cached_response
+    def search(self, request):
+        """Ranked full-text search over title, author, publisher and description (`?q=`)"""
+        term = request.query_params.get("q", "")
+        if not term.strip():
+            return Response({"detail": "q is required"}, status=status.HTTP_400_BAD_REQUEST)
+
+        queryset = self.filter_queryset(self.get_queryset())
+        fuzzy = request.query_params.get("fuzzy") in ("1", "true")
+        paginator = SearchPagination()
+        matches = fuzzy_search_books(queryset, term) if fuzzy else search_books(queryset, term)
+        page = paginator.paginate_queryset(matches, request, view=self)
+        if not page and not fuzzy and paginator.cursor_query_param not in request.query_params:
+            # nothing matched the words as typed, retry typo tolerant
+            page = paginator.paginate_queryset(fuzzy_search_books(queryset, term), request, view=self)
+            paginator.base_url = replace_query_param(paginator.base_url, "fuzzy", "true")
+
+        serializer = self.get_serializer(page, many=True)
+        return paginator.get_paginated_response(serializer.data)
+
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny], url_path="facets")
+    @cached_response
+    def facet_counts(self, request):
+        """Counts per category, author, language, format and price bucket for the current filters"""
+        filterset = BookFilter(request.query_params, queryset=Book.objects.all(), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        return Response(facets.facet_counts(filterset))
+
+    @action(detail=False, methods=["get"], permission_classes=[AllowAny])
+    def autocomplete(self, request):
+        """Title/author suggestions for `?q=` served from the in-process prefix index"""
+        try:
+            limit = min(int(request.query_params.get("limit", 8)), 20)
+        except ValueError:
+            limit = 8
+        suggestions = [
+            {
+                "id": book_id,
+                "title": title,
+                "author": author,
+                "thumbnail": request.build_absolute_uri(settings.MEDIA_URL + cover) if cover else None,
+            }
+            for book_id, title, author, cover in typeahead.index.lookup(request.query_params.get("q", ""), limit)
+        ]
+        return Response(suggestions)
+
+class CategoryViewSet(BulkCreateMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     queryset = Category.objects.all()
     serializer_class = CategorySerializer
-    
-
-    def create(self,request,*args,**kwargs):
-        serializer = self.get_serializer(data = request.data,many = isinstance(request.data,list))
-        if serializer.is_valid():
-            serializer.save()
-            return Response(serializer.data, status=status.HTTP_201_CREATED)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+    bulk_serializer_class = CategoryBulkSerializer
+    bulk_unique_field = "name"
+
+    @cached_response
+    def list(self, request, *args, **kwargs):
+        return super().list(request, *args, **kwargs)
+
+    @cached_response
+    async def alist(self, request, *args, **kwargs):
+        return await super().alist(request, *args, **kwargs)
+
+    @cached_response
+    def retrieve(self, request, *args, **kwargs):
+        return super().retrieve(request, *args, **kwargs)
+
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from cart.models import Cart
+
+
+class Command(BaseCommand):
+    help = "Rebuild the stored item_count/total_price of every cart from its items"
+
+    def handle(self, *args, **options):
+        updated = Cart.recalculate(Cart.objects.all())
+        self.stdout.write(f"Recalculated {updated} carts")
@@ -0,0 +1,22 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from cart.reservations import sweep_expired
+
+
+class Command(BaseCommand):
+    help = "Delete expired stock reservations in batches (run from cron, or with --every)"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--every", type=float, default=0, help="keep running, sweeping every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            started = time.perf_counter()
+            deleted = sweep_expired(batch_size=options["batch_size"])
+            self.stdout.write(f"Swept {deleted} expired reservations in {time.perf_counter() - started:.1f}s")
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
@@ -1,4 +1,6 @@
-from django.db import models
+from django.db import connection, models
+from django.db.models import F, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce, Now
 from django.contrib.auth import get_user_model
 from bookstore.models import Book  # Import your Book model
 
@@ -6,13 +8,61 @@ User = get_user_model()
 
 class Cart(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE,null=True,blank=True)
+    # Kept in step with the items so the cart badge is a single row read
+    item_count = models.PositiveIntegerField(default=0)
+    total_price = models.DecimalField(max_digits=10, decimal_places=2, default=0)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def __str__(self):
         return f"Cart of {self.user.username}"
 
-    @property
-    def total_price(self):
-        return sum(item.subtotal for item in self.items.all())
+    def add_to_totals(self, item_count, total_price):
+        """Atomically shift the stored totals by the given deltas"""
+        Cart.objects.filter(pk=self.pk).update(
+            item_count=F("item_count") + item_count,
+            total_price=F("total_price") + total_price,
+            updated_at=Now(),
+        )
+
+    @staticmethod
+    def recalculate(carts):
+        """Rebuild the stored totals of `carts` (a queryset) from their items in one UPDATE"""
+        items = CartItem.objects.filter(cart=OuterRef("pk")).order_by().values("cart")
+        count = items.annotate(count=Sum("quantity")).values("count")
+        total = items.annotate(total=Sum(F("quantity") * F("book__price"))).values("total")
+        return carts.update(
+            item_count=Coalesce(Subquery(count), Value(0)),
+            total_price=Coalesce(Subquery(total), Value(0), output_field=models.DecimalField()),
+            updated_at=Now(),
+        )
+
+
+class CartItemQuerySet(models.QuerySet):
+    def add_books(self, cart, quantities):
+        """
+        Add `quantities` ({book_id: quantity}) to the cart with a single
+        INSERT ... ON CONFLICT DO UPDATE, so repeated or concurrent adds of
+        the same book sum up instead of overwriting each other. Rows go in
+        book_id order, like checkout and reservations.hold() lock them, so two
+        overlapping adds cannot deadlock on (cart, book).
+        """
+        if not quantities:
+            return []
+        table = connection.ops.quote_name(self.model._meta.db_table)
+        rows = ", ".join(["(%s, %s, %s)"] * len(quantities))
+        params = []
+        for book_id, quantity in sorted(quantities.items()):
+            params += [cart.pk, book_id, quantity]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f"INSERT INTO {table} (cart_id, book_id, quantity) VALUES {rows} "
+                f"ON CONFLICT (cart_id, book_id) DO UPDATE "
+                f"SET quantity = {table}.quantity + EXCLUDED.quantity "
+                f"RETURNING id, book_id, quantity",
+                params,
+            )
+            return [self.model(pk=pk, cart=cart, book_id=book_id, quantity=quantity)
+                    for pk, book_id, quantity in cursor.fetchall()]
 
 
 class CartItem(models.Model):
@@ -20,9 +70,38 @@ class CartItem(models.Model):
     book = models.ForeignKey(Book, on_delete=models.CASCADE)
     quantity = models.PositiveIntegerField(default=1)
 
+    objects = CartItemQuerySet.as_manager()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "book"], name="unique_cart_book"),
+        ]
+
     def __str__(self):
         return f"{self.quantity} x {self.book.title}"
 
     @property
     def subtotal(self):
         return self.book.price * self.quantity
+
+
+class StockReservation(models.Model):
+    """Stock held for one cart line until expires_at, see cart/reservations.py"""
+    # both foreign keys lead an index below
+    cart = models.ForeignKey(Cart, related_name="reservations", on_delete=models.CASCADE, db_index=False)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, db_index=False)
+    quantity = models.PositiveIntegerField()
+    expires_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["cart", "book"], name="unique_reservation_cart_book"),
+        ]
+        indexes = [
+            # SUM(quantity) of a book's live holds is an index-only scan
+            models.Index(fields=["book", "expires_at"], include=["quantity"], name="reservation_book_live_idx"),
+            models.Index(fields=["expires_at"], name="reservation_expires_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.quantity} x book {self.book_id} until {self.expires_at}"
@@ -0,0 +1,104 @@
+# cart/reservations.py
+"""
+Stock held for carts while their owners check out.
+
+Adding a book to a cart holds the cart's whole quantity of it for
+STOCK_RESERVATION_TTL seconds in ``StockReservation``; every later change to
+that line renews the hold. A book's available stock is its stock minus the
+live holds of other carts, summed from the (book, expires_at) index, and a
+hold is only granted under the book's row lock, so concurrent buyers of the
+last copies cannot all get them. Checkout consumes the cart's holds.
+
+Expired holds simply stop counting; ``sweep_expired()`` (the
+``sweep_reservations`` command) deletes them in batches to keep the table small.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Sum
+from django.utils import timezone
+
+from bookstore.models import Book
+from .models import StockReservation
+
+
+class InsufficientStock(Exception):
+    def __init__(self, available):
+        # {book: copies still available to this cart}
+        self.available = available
+        super().__init__("Not enough stock for: " + ", ".join(book.title for book in available))
+
+    def detail(self):
+        return {"detail": str(self), "available": {book.pk: count for book, count in self.available.items()}}
+
+
+def held_by_others(book_ids, cart, now=None):
+    """{book_id: copies held by live reservations of other carts}"""
+    rows = (
+        StockReservation.objects.filter(book_id__in=book_ids, expires_at__gt=now or timezone.now())
+        .exclude(cart=cart)
+        .order_by()
+        .values("book_id")
+        .annotate(held=Sum("quantity"))
+    )
+    return {row["book_id"]: row["held"] for row in rows}
+
+
+def shortages(books, quantities, cart):
+    """{book: available} for the books that cannot supply the cart's quantity"""
+    held = held_by_others(list(quantities), cart)
+    short = {}
+    for book in books:
+        available = max(book.stock - held.get(book.pk, 0), 0)
+        if available < quantities[book.pk]:
+            short[book] = available
+    return short
+
+
+def hold(cart, quantities, ttl=None):
+    """
+    Hold `quantities` ({book_id: the cart's total quantity}) for `ttl` seconds,
+    replacing the cart's earlier holds on those books. Raises InsufficientStock
+    and holds nothing when any book is short.
+    """
+    if not quantities:
+        return None
+    expires_at = timezone.now() + timedelta(seconds=ttl or settings.STOCK_RESERVATION_TTL)
+    with transaction.atomic():
+        # ordered like checkout's locks
+        books = list(Book.objects.select_for_update().only("id", "title", "stock").filter(pk__in=quantities).order_by("pk"))
+        short = shortages(books, quantities, cart)
+        if short:
+            raise InsufficientStock(short)
+        StockReservation.objects.bulk_create(
+            [StockReservation(cart=cart, book_id=pk, quantity=quantity, expires_at=expires_at) for pk, quantity in quantities.items()],
+            update_conflicts=True,
+            unique_fields=["cart", "book"],
+            update_fields=["quantity", "expires_at"],
+        )
+    return expires_at
+
+
+def release(cart, book_ids=None):
+    holds = StockReservation.objects.filter(cart=cart)
+    if book_ids is not None:
+        holds = holds.filter(book_id__in=book_ids)
+    holds.delete()
+
+
+def available(book_ids):
+    """{book_id: stock minus all live holds}"""
+    held = held_by_others(book_ids, cart=None)
+    return {pk: max(stock - held.get(pk, 0), 0) for pk, stock in Book.objects.filter(pk__in=book_ids).values_list("pk", "stock")}
+
+
+def sweep_expired(batch_size=5000):
+    """Delete expired holds, returns how many went"""
+    deleted = 0
+    while True:
+        ids = list(StockReservation.objects.filter(expires_at__lte=timezone.now()).values_list("pk", flat=True)[:batch_size])
+        if not ids:
+            return deleted
+        StockReservation.objects.filter(pk__in=ids).delete()
+        deleted += len(ids)
@@ -1,9 +1,11 @@
+from django.db.models import Prefetch
 from rest_framework import serializers
 from .models import Cart, CartItem
 from bookstore.models import Book
+from bookstore.instrumentation import TimedSerializerMixin
 from bookstore.serializers import BookSerializer
 
-class CartItemSerializer(serializers.ModelSerializer):
+class CartItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     book = BookSerializer(read_only=True)
     book_id = serializers.PrimaryKeyRelatedField(
         queryset=Book.objects.all(), source='book', write_only=True
@@ -17,14 +19,38 @@ class CartItemSerializer(serializers.ModelSerializer):
     def get_subtotal(self, obj):
         return obj.book.price * obj.quantity
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return BookSerializer.setup_eager_loading(queryset, prefix="book__")
 
-class CartSerializer(serializers.ModelSerializer):
+
+class CartItemBatchSerializer(serializers.Serializer):
+    """One row of a bulk add, books are resolved together by the view"""
+    book_id = serializers.IntegerField()
+    quantity = serializers.IntegerField(min_value=1, default=1)
+
+
+class CartSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = CartItemSerializer(many=True, read_only=True)
-    total_price = serializers.SerializerMethodField()
 
     class Meta:
         model = Cart
-        fields = ['id', 'user', 'items', 'total_price']
+        fields = ['id', 'user', 'items', 'item_count', 'total_price']
+        read_only_fields = ['item_count', 'total_price']
+
+    @staticmethod
+    def items_prefetch():
+        return Prefetch("items", queryset=CartItemSerializer.setup_eager_loading(CartItem.objects.order_by("id")))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(CartSerializer.items_prefetch())
 
-    def get_total_price(self, obj):
-        return sum([item.book.price * item.quantity for item in obj.items.all()])
+
+class CartSummarySerializer(TimedSerializerMixin, serializers.ModelSerializer):
+    """Header badge / mini-cart view, served from the stored totals only"""
+
+    class Meta:
+        model = Cart
+        fields = ['id', 'item_count', 'total_price']
+        read_only_fields = fields
@@ -0,0 +1,24 @@
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from bookstore.models import Book
+from .models import Cart
+
+
+@receiver(post_save, sender=Book)
+def refresh_totals_on_book_change(sender, instance, created, **kwargs):
+    # a price change moves the total of every cart holding the book
+    if not created:
+        Cart.recalculate(Cart.objects.filter(items__book=instance))
+
+
+@receiver(pre_delete, sender=Book)
+def remember_carts_holding_book(sender, instance, **kwargs):
+    instance._cart_ids = list(Cart.objects.filter(items__book=instance).values_list("pk", flat=True))
+
+
+@receiver(post_delete, sender=Book)
+def refresh_totals_on_book_delete(sender, instance, **kwargs):
+    cart_ids = getattr(instance, "_cart_ids", None)
+    if cart_ids:
+        Cart.recalculate(Cart.objects.filter(pk__in=cart_ids))
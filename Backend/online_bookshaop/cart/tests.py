@@ -1,3 +1,207 @@
+from datetime import timedelta
+
 from django.test import TestCase
+from django.utils import timezone
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from bookstore.models import Book
+from bookstore.tests import make_books
+from .models import Cart, CartItem, StockReservation
+from .reservations import available, sweep_expired
+
+
+class CartQueryBudgetTests(TestCase):
+    """Cart responses must run a constant number of queries whatever the cart size."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = make_books(10)
+        self.cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create(CartItem(cart=self.cart, book=book, quantity=2) for book in self.books[:8])
+        Cart.recalculate(Cart.objects.all())
+
+    def test_list_cart(self):
+        # cart + items with books and categories
+        with self.assertNumQueries(2):
+            response = self.client.get("/api/cart/cart/")
+        self.assertEqual(len(response.json()["items"]), 8)
+
+    def test_remove_item(self):
+        item = self.cart.items.first()
+        # cart, savepoint, item, delete, reservation, totals, release, refresh totals, items
+        with self.assertNumQueries(9):
+            response = self.client.delete(f"/api/cart/cart/{item.pk}/remove_item/")
+        self.assertEqual(len(response.json()["items"]), 7)
+
+
+class CartTotalsTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.first, self.second = make_books(2)  # priced 100 and 101
+        Book.objects.update(stock=10)
+
+    def summary(self):
+        return self.client.get("/api/cart/cart/summary/").json()
+
+    def test_totals_follow_mutations(self):
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.first.pk, "quantity": 2})
+        response = self.client.post("/api/cart/cart/add_item/?summary=true", {"book_id": self.second.pk})
+        self.assertEqual(response.json()["item_count"], 3)
+        self.assertEqual(response.json()["total_price"], "301.00")
+
+        item = CartItem.objects.get(book=self.first)
+        self.client.patch(f"/api/cart/cart/{item.pk}/update_item/", {"quantity": 5})
+        self.assertEqual(self.summary()["total_price"], "601.00")
+
+        self.client.delete(f"/api/cart/cart/{item.pk}/remove_item/")
+        self.assertEqual(self.summary(), {"id": Cart.objects.get().pk, "item_count": 1, "total_price": "101.00"})
+
+    def test_summary_is_one_query(self):
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.first.pk})
+        with self.assertNumQueries(1):
+            self.summary()
+
+    def test_price_change_and_book_delete(self):
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.first.pk, "quantity": 2})
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.second.pk})
+        self.first.price = 50
+        self.first.save()
+        self.assertEqual(self.summary()["total_price"], "201.00")
+        self.second.delete()
+        self.assertEqual(self.summary()["item_count"], 2)
+        self.assertEqual(self.summary()["total_price"], "100.00")
+
+    def test_checkout_resets_totals(self):
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.first.pk})
+        self.client.post("/api/orders/orders/place_order/")
+        self.assertEqual(self.summary()["item_count"], 0)
+
+
+class AddItemUpsertTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = make_books(3)
+        Book.objects.update(stock=10)
+
+    def test_repeated_adds_sum_up(self):
+        for _ in range(3):
+            self.client.post("/api/cart/cart/add_item/", {"book_id": self.books[0].pk, "quantity": 2})
+        self.assertEqual(CartItem.objects.get().quantity, 6)
+
+    def test_add_items_batch(self):
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.books[0].pk})
+        payload = [
+            {"book_id": self.books[0].pk, "quantity": 2},
+            {"book_id": self.books[1].pk},
+            {"book_id": self.books[1].pk, "quantity": 3},
+        ]
+        response = self.client.post("/api/cart/cart/add_items/?summary=true", payload, format="json")
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["item_count"], 7)
+        self.assertEqual(response.json()["total_price"], "704.00")
+        self.assertEqual(
+            dict(CartItem.objects.values_list("book_id", "quantity")),
+            {self.books[0].pk: 3, self.books[1].pk: 4},
+        )
+
+    def test_rows_are_written_in_book_order(self):
+        cart = Cart.objects.create(user=self.user)
+        ids = sorted(book.pk for book in self.books)
+        # RETURNING follows the VALUES order, which is the order the unique index is locked in
+        items = CartItem.objects.add_books(cart, {ids[2]: 1, ids[0]: 1, ids[1]: 1})
+        self.assertEqual([item.book_id for item in items], ids)
+
+    def test_add_items_unknown_book(self):
+        response = self.client.post("/api/cart/cart/add_items/", [{"book_id": 0}], format="json")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(CartItem.objects.exists())
+
+
+class CartConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = make_books(1)[0]
+        Book.objects.update(stock=10)
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.book.pk})
+
+    def test_etag_follows_cart_changes(self):
+        etag = self.client.get("/api/cart/cart/")["ETag"]
+        self.assertEqual(self.client.get("/api/cart/cart/", HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.book.pk})
+        self.assertEqual(self.client.get("/api/cart/cart/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class ReservationTests(TestCase):
+    def setUp(self):
+        self.book = make_books(1)[0]
+        Book.objects.update(stock=3)
+        self.clients = []
+        for i in range(2):
+            client = APIClient()
+            client.force_authenticate(CustomUser.objects.create_user(email=f"buyer{i}@example.com", password="secret"))
+            self.clients.append(client)
+
+    def add(self, client, quantity):
+        return client.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": quantity})
+
+    def test_holds_limit_what_others_can_add(self):
+        first, second = self.clients
+        self.assertEqual(self.add(first, 2).status_code, 201)
+        self.assertEqual(available([self.book.pk]), {self.book.pk: 1})
+
+        response = self.add(second, 2)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json()["available"], {str(self.book.pk): 1})
+        self.assertFalse(CartItem.objects.filter(cart__user__email="buyer1@example.com").exists())
+        self.assertEqual(self.add(second, 1).status_code, 201)
+        # a cart's own hold does not count against it
+        self.assertEqual(self.add(second, 1).status_code, 400)
+
+    def test_expired_holds_stop_counting(self):
+        first, second = self.clients
+        self.add(first, 3)
+        self.assertEqual(self.add(second, 1).status_code, 400)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.add(second, 1).status_code, 201)
+        # the first cart's copies were sold to someone else meanwhile
+        self.assertEqual(first.post("/api/orders/orders/place_order/").status_code, 400)
+        self.assertEqual(second.post("/api/orders/orders/place_order/").status_code, 201)
+        self.assertEqual(Book.objects.get().stock, 2)
+        # checkout consumed the second cart's hold, the first one's waits for the sweep
+        self.assertEqual(StockReservation.objects.get().cart.user.email, "buyer0@example.com")
+
+    def test_update_and_remove_move_the_hold(self):
+        first, _ = self.clients
+        self.add(first, 1)
+        item = CartItem.objects.get()
+        self.assertEqual(first.patch(f"/api/cart/cart/{item.pk}/update_item/", {"quantity": 4}).status_code, 400)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+        first.patch(f"/api/cart/cart/{item.pk}/update_item/", {"quantity": 3})
+        self.assertEqual(StockReservation.objects.get().quantity, 3)
+        first.delete(f"/api/cart/cart/{item.pk}/remove_item/")
+        self.assertFalse(StockReservation.objects.exists())
+
+    def test_reserve_renews_every_hold(self):
+        first, _ = self.clients
+        self.add(first, 1)
+        StockReservation.objects.update(expires_at=timezone.now() - timedelta(seconds=1))
+        response = first.post("/api/cart/cart/reserve/")
+        self.assertEqual(response.json()["books"], 1)
+        self.assertGreater(StockReservation.objects.get().expires_at, timezone.now())
 
-# Create your tests here.
+    def test_sweep_expired(self):
+        first, second = self.clients
+        self.add(first, 1)
+        self.add(second, 1)
+        StockReservation.objects.filter(cart__user__email="buyer0@example.com").update(expires_at=timezone.now())
+        self.assertEqual(sweep_expired(batch_size=1), 1)
+        self.assertEqual(StockReservation.objects.get().cart.user.email, "buyer1@example.com")
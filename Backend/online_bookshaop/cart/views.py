@@ -2,23 +2,61 @@ from rest_framework import viewsets, status
 from rest_framework.decorators import action
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
+from django.db import transaction
+from django.db.models import prefetch_related_objects
+from bookstore.conditional import latest, not_modified, request_etag, set_validators
+from bookstore.idempotency import IdempotencyMixin
 from .models import Cart, CartItem
+from . import reservations
 from bookstore.models import Book
-from .serializers import CartSerializer, CartItemSerializer
+from .serializers import CartSerializer, CartItemSerializer, CartItemBatchSerializer, CartSummarySerializer
 
-class CartViewSet(viewsets.ModelViewSet):
+class CartViewSet(IdempotencyMixin, viewsets.ModelViewSet):
     queryset = Cart.objects.all()
     serializer_class = CartSerializer
     permission_classes = [IsAuthenticated]
 
     def get_queryset(self):
         # Each user can only see their own cart
-        return Cart.objects.filter(user=self.request.user)
+        return CartSerializer.setup_eager_loading(Cart.objects.filter(user=self.request.user))
+
+    def cart_data(self, cart):
+        """Serialize the cart with its items, books and categories in one extra query"""
+        prefetch_related_objects([cart], CartSerializer.items_prefetch())
+        return CartSerializer(cart).data
+
+    def cart_response(self, request, cart, status_code=status.HTTP_200_OK):
+        """Respond to a cart mutation, with only the totals when `?summary=true` is passed"""
+        cart.refresh_from_db(fields=["item_count", "total_price"])
+        if request.query_params.get("summary") in ("1", "true"):
+            return Response(CartSummarySerializer(cart).data, status=status_code)
+        return Response(self.cart_data(cart), status=status_code)
 
     def list(self, request, *args, **kwargs):
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        serializer = self.get_serializer(cart)
-        return Response(serializer.data)
+        prefetch_related_objects([cart], CartSerializer.items_prefetch())
+        books = [item.book for item in cart.items.all()]
+        updated = latest(cart.updated_at, *(book.updated_at for book in books), *(book.category.updated_at for book in books))
+        etag = request_etag(request, (cart.pk, [(item.pk, item.quantity) for item in cart.items.all()], updated))
+        response = not_modified(request, etag, updated)
+        if response is not None:
+            return response
+        return set_validators(Response(CartSerializer(cart).data), etag, updated)
+
+    @action(detail=False, methods=['get'])
+    def summary(self, request):
+        """Item count and total of the cart, read from the cart row alone"""
+        cart = Cart.objects.filter(user=request.user).only("id", "item_count", "total_price").first()
+        if cart is None:
+            return Response({"id": None, "item_count": 0, "total_price": "0.00"})
+        return Response(CartSummarySerializer(cart).data)
+
+    async def asummary(self, request):
+        """summary() for the ASGI route"""
+        cart = await Cart.objects.filter(user=request.user).only("id", "item_count", "total_price").afirst()
+        if cart is None:
+            return Response({"id": None, "item_count": 0, "total_price": "0.00"})
+        return Response(CartSummarySerializer(cart).data)
 
     @action(detail=False, methods=['post'])
     def add_item(self, request):
@@ -28,38 +66,98 @@ class CartViewSet(viewsets.ModelViewSet):
         if serializer.is_valid():
             book = serializer.validated_data['book']
             quantity = serializer.validated_data.get('quantity', 1)
-            cart_item, created = CartItem.objects.get_or_create(cart=cart, book=book)
-            if not created:
-                cart_item.quantity += quantity
-            else:
-                cart_item.quantity = quantity
-            cart_item.save()
-            return Response(CartSerializer(cart).data, status=status.HTTP_201_CREATED)
+            try:
+                with transaction.atomic():
+                    items = CartItem.objects.add_books(cart, {book.pk: quantity})
+                    reservations.hold(cart, {item.book_id: item.quantity for item in items})
+                    cart.add_to_totals(quantity, book.price * quantity)
+            except reservations.InsufficientStock as exc:
+                return Response(exc.detail(), status=status.HTTP_400_BAD_REQUEST)
+            return self.cart_response(request, cart, status_code=status.HTTP_201_CREATED)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    @action(detail=False, methods=['post'])
+    def add_items(self, request):
+        """Add a list of {book_id, quantity} to the cart in one statement"""
+        serializer = CartItemBatchSerializer(data=request.data, many=True)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+        quantities = {}
+        for row in serializer.validated_data:
+            quantities[row["book_id"]] = quantities.get(row["book_id"], 0) + row["quantity"]
+        books = Book.objects.only("id", "price").in_bulk(list(quantities))
+        missing = [pk for pk in quantities if pk not in books]
+        if missing:
+            return Response({"book_id": [f"Invalid book ids: {missing}"]}, status=status.HTTP_400_BAD_REQUEST)
+
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            with transaction.atomic():
+                items = CartItem.objects.add_books(cart, quantities)
+                reservations.hold(cart, {item.book_id: item.quantity for item in items})
+                cart.add_to_totals(
+                    sum(quantities.values()),
+                    sum(books[pk].price * quantity for pk, quantity in quantities.items()),
+                )
+        except reservations.InsufficientStock as exc:
+            return Response(exc.detail(), status=status.HTTP_400_BAD_REQUEST)
+        return self.cart_response(request, cart, status_code=status.HTTP_201_CREATED)
+
     @action(detail=True, methods=['patch'])
     def update_item(self, request, pk=None):
         """Update quantity of a cart item"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
         try:
-            cart_item = CartItem.objects.get(pk=pk, cart=cart)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
+            with transaction.atomic():
+                try:
+                    cart_item = CartItem.objects.select_related("book").select_for_update().get(pk=pk, cart=cart)
+                except CartItem.DoesNotExist:
+                    return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
 
-        serializer = CartItemSerializer(cart_item, data=request.data, partial=True)
-        if serializer.is_valid():
-            serializer.save()
-            return Response(CartSerializer(cart).data)
-        return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                old_quantity, old_price, old_book_id = cart_item.quantity, cart_item.book.price, cart_item.book_id
+                serializer = CartItemSerializer(cart_item, data=request.data, partial=True)
+                if not serializer.is_valid():
+                    return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+                book = serializer.validated_data.get("book", cart_item.book)
+                if book.pk != cart_item.book_id and CartItem.objects.filter(cart=cart, book=book).exists():
+                    return Response({"detail": "Book is already in the cart"}, status=status.HTTP_400_BAD_REQUEST)
+                cart_item = serializer.save()
+                if cart_item.book_id != old_book_id:
+                    reservations.release(cart, [old_book_id])
+                reservations.hold(cart, {cart_item.book_id: cart_item.quantity})
+                cart.add_to_totals(
+                    cart_item.quantity - old_quantity,
+                    cart_item.book.price * cart_item.quantity - old_price * old_quantity,
+                )
+        except reservations.InsufficientStock as exc:
+            return Response(exc.detail(), status=status.HTTP_400_BAD_REQUEST)
+        return self.cart_response(request, cart)
 
     @action(detail=True, methods=['delete'])
     def remove_item(self, request, pk=None):
         """Remove a book from the cart"""
         cart, _ = Cart.objects.get_or_create(user=request.user)
-        try:
-            cart_item = CartItem.objects.get(pk=pk, cart=cart)
-        except CartItem.DoesNotExist:
-            return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
+        with transaction.atomic():
+            try:
+                cart_item = CartItem.objects.select_related("book").select_for_update().get(pk=pk, cart=cart)
+            except CartItem.DoesNotExist:
+                return Response({"detail": "Item not found in cart"}, status=status.HTTP_404_NOT_FOUND)
 
-        cart_item.delete()
-        return Response(CartSerializer(cart).data)
+            cart_item.delete()
+            reservations.release(cart, [cart_item.book_id])
+            cart.add_to_totals(-cart_item.quantity, -cart_item.book.price * cart_item.quantity)
+        return self.cart_response(request, cart)
+
+    @action(detail=False, methods=['post'])
+    def reserve(self, request):
+        """Hold stock for everything in the cart, e.g. when the checkout page opens"""
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        quantities = dict(cart.items.values_list("book_id", "quantity"))
+        if not quantities:
+            return Response({"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            expires_at = reservations.hold(cart, quantities)
+        except reservations.InsufficientStock as exc:
+            return Response(exc.detail(), status=status.HTTP_400_BAD_REQUEST)
+        return Response({"expires_at": expires_at, "books": len(quantities)})
@@ -0,0 +1,25 @@
+"""
+URLconf for requests served over ASGI (bookstore/asyncapi.py).
+
+The hot read endpoints are routed to async views first, with the names of
+their sync counterparts; everything else falls through to online_bookshaop.urls.
+"""
+from django.urls import re_path
+
+from accounts.views import UserViewSet
+from bookstore.asyncapi import async_route
+from bookstore.views import BookViewSet, CategoryViewSet
+from cart.views import CartViewSet
+
+from .urls import urlpatterns as sync_urlpatterns
+
+urlpatterns = [
+    re_path(r"^api/books-store/books/$", async_route(BookViewSet, "list", basename="products", detail=False), name="products-list"),
+    re_path(r"^api/books-store/books/(?P<pk>[^/.]+)/$", async_route(BookViewSet, "retrieve", basename="products", detail=True),
+            name="products-detail"),
+    re_path(r"^api/books-store/categories/$", async_route(CategoryViewSet, "list", basename="categories", detail=False),
+            name="categories-list"),
+    re_path(r"^api/accounts/users/verify_token/$", async_route(UserViewSet, "verify_token", basename="user", detail=False),
+            name="user-verify-token"),
+    re_path(r"^api/cart/cart/summary/$", async_route(CartViewSet, "summary", basename="cart", detail=False), name="cart-summary"),
+] + sync_urlpatterns
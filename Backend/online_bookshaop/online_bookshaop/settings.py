@@ -10,8 +10,9 @@ For the full list of settings and their values, see
 https://docs.djangoproject.com/en/5.2/ref/settings/
 """
 
+import os
 from pathlib import Path
-from decouple import config
+from decouple import Csv, config
 from datetime import timedelta
 
 # Build paths inside the project like this: BASE_DIR / 'subdir'.
@@ -39,6 +40,7 @@ INSTALLED_APPS = [
     'django.contrib.sessions',
     'django.contrib.messages',
     'django.contrib.staticfiles',
+    'django.contrib.postgres',
     'django_filters',
     'bookstore',
     'accounts',
@@ -51,6 +53,8 @@ INSTALLED_APPS = [
 INSTALLED_APPS += ["rest_framework_simplejwt.token_blacklist"]
 
 MIDDLEWARE = [
+    'bookstore.instrumentation.InstrumentationMiddleware',
+    'bookstore.routers.ReplicaPinMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -59,14 +63,17 @@ MIDDLEWARE = [
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
     "corsheaders.middleware.CorsMiddleware",
+    'bookstore.asyncapi.AsgiRoutesMiddleware',
 ]
 
 ROOT_URLCONF = 'online_bookshaop.urls'
+# Used instead of ROOT_URLCONF for requests served over ASGI, routes the hot reads to async views
+ASGI_URLCONF = 'online_bookshaop.asgi_urls'
 AUTH_USER_MODEL = "accounts.CustomUser"
 
 REST_FRAMEWORK = {
     "DEFAULT_AUTHENTICATION_CLASSES": (
-        "rest_framework_simplejwt.authentication.JWTAuthentication",
+        "accounts.authentication.ClaimsJWTAuthentication",
     ),
    
 }
@@ -79,6 +86,13 @@ SIMPLE_JWT = {
     "SIGNING_KEY": SECRET_KEY,
     "AUTH_HEADER_TYPES": ("Bearer",),
 }
+# How long a user's token_version is cached by accounts.authentication.ClaimsJWTAuthentication
+JWT_CLAIMS_CACHE_ALIAS = "default"
+JWT_CLAIMS_CACHE_TIMEOUT = config("JWT_CLAIMS_CACHE_TIMEOUT", default=60, cast=int)
+# Refresh-token revocations (accounts/blacklist.py): Bloom filter sizing and the cache sharing its generation
+TOKEN_BLACKLIST_CACHE_ALIAS = "default"
+TOKEN_BLACKLIST_BLOOM_CAPACITY = config("TOKEN_BLACKLIST_BLOOM_CAPACITY", default=10000, cast=int)
+TOKEN_BLACKLIST_BLOOM_ERROR_RATE = config("TOKEN_BLACKLIST_BLOOM_ERROR_RATE", default=0.001, cast=float)
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -104,16 +118,82 @@ CORS_ALLOW_CREDENTIALS = True
 # Database
 # https://docs.djangoproject.com/en/5.2/ref/settings/#databases
 
-DATABASES = {
-    "default": {
+# Connections persist DB_CONN_MAX_AGE seconds and are checked before being reused.
+# DB_POOL=True keeps a psycopg pool per process instead (psycopg 3 and psycopg-pool; use it
+# under ASGI, where persistent connections are not reused), checked as they leave the pool
+DB_CONN_MAX_AGE = config("DB_CONN_MAX_AGE", default=60, cast=int)
+DB_POOL = config("DB_POOL", default=False, cast=bool)
+DB_POOL_MIN_SIZE = config("DB_POOL_MIN_SIZE", default=2, cast=int)
+DB_POOL_MAX_SIZE = config("DB_POOL_MAX_SIZE", default=20, cast=int)
+# seconds a request waits for a pooled connection before failing
+DB_POOL_TIMEOUT = config("DB_POOL_TIMEOUT", default=10, cast=float)
+
+
+def database(host, port):
+    options = {
+        # typo tolerance of the book search fallback (pg_trgm's default is 0.6)
+        "options": "-c pg_trgm.word_similarity_threshold=0.3",
+    }
+    if DB_POOL:
+        options["pool"] = {"min_size": DB_POOL_MIN_SIZE, "max_size": DB_POOL_MAX_SIZE, "timeout": DB_POOL_TIMEOUT}
+    return {
         "ENGINE": "django.db.backends.postgresql",
         "NAME": config("DB_NAME"),
         "USER": config("DB_USER"),
         "PASSWORD": config("DB_PASSWORD"),
-        "HOST": config("DB_HOST", default="localhost"),
-        "PORT": config("DB_PORT", default="5432"),
+        "HOST": host,
+        "PORT": port,
+        # the pool manages its own connections
+        "CONN_MAX_AGE": 0 if DB_POOL else DB_CONN_MAX_AGE,
+        "CONN_HEALTH_CHECKS": True,
+        "OPTIONS": options,
     }
+
+
+DATABASES = {
+    "default": database(config("DB_HOST", default="localhost"), config("DB_PORT", default="5432")),
 }
+# Read replicas as "host:port,host:port", reached with the primary's name and credentials.
+# Reads of the REPLICA_APPS models go there (bookstore/routers.py), except that a user's reads
+# stay on the primary for REPLICA_PIN_SECONDS after their own writes. Under test they mirror the primary.
+DATABASE_REPLICAS = []
+for number, replica in enumerate(config("DB_REPLICAS", default="", cast=Csv()), 1):
+    host, _, port = replica.partition(":")
+    DATABASES[f"replica_{number}"] = {**database(host, port or "5432"), "TEST": {"MIRROR": "default"}}
+    DATABASE_REPLICAS.append(f"replica_{number}")
+DATABASE_ROUTERS = ["bookstore.routers.ReplicaRouter"]
+REPLICA_APPS = ("bookstore", "orders")
+REPLICA_PIN_SECONDS = config("REPLICA_PIN_SECONDS", default=5, cast=int)
+REPLICA_PIN_CACHE_ALIAS = "default"
+
+# Cache
+# Shared Redis when REDIS_URL is set, per-process memory otherwise (dev and tests)
+REDIS_URL = config("REDIS_URL", default="")
+if REDIS_URL:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": REDIS_URL,
+        }
+    }
+else:
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        }
+    }
+# Catalog response cache (bookstore/cache.py), 0 disables it
+CATALOG_CACHE_ALIAS = "default"
+CATALOG_CACHE_TIMEOUT = config("CATALOG_CACHE_TIMEOUT", default=600, cast=int)
+# Idempotency-Key responses (bookstore/idempotency.py): kept IDEMPOTENCY_TTL seconds,
+# duplicates of a running request wait up to IDEMPOTENCY_WAIT seconds for it
+IDEMPOTENCY_CACHE_ALIAS = "default"
+IDEMPOTENCY_TTL = config("IDEMPOTENCY_TTL", default=86400, cast=int)
+IDEMPOTENCY_WAIT = config("IDEMPOTENCY_WAIT", default=10, cast=float)
+# Seconds a cart holds the stock of its books (cart/reservations.py)
+STOCK_RESERVATION_TTL = config("STOCK_RESERVATION_TTL", default=900, cast=int)
+# Whole months of orders kept in the live tables, archive_orders moves older ones (orders/archive.py)
+ORDER_ARCHIVE_MONTHS = config("ORDER_ARCHIVE_MONTHS", default=12, cast=int)
 
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
@@ -132,7 +212,40 @@ AUTH_PASSWORD_VALIDATORS = [
         'NAME': 'django.contrib.auth.password_validation.NumericPasswordValidator',
     },
 ]
-from decouple import config
+
+# Password hashing (accounts/hashers.py). New hashes use the first hasher; logins
+# rehash passwords stored with another hasher or older parameters.
+try:
+    import argon2  # noqa: F401
+    HAS_ARGON2 = True
+except ImportError:
+    HAS_ARGON2 = False
+PASSWORD_HASHERS = [
+    "accounts.hashers.TunedPBKDF2PasswordHasher",
+    "django.contrib.auth.hashers.PBKDF2SHA1PasswordHasher",
+]
+if HAS_ARGON2 and config("PASSWORD_HASHER", default="argon2") == "argon2":
+    PASSWORD_HASHERS.insert(0, "accounts.hashers.TunedArgon2PasswordHasher")
+elif HAS_ARGON2:
+    PASSWORD_HASHERS.append("accounts.hashers.TunedArgon2PasswordHasher")
+PASSWORD_ARGON2_TIME_COST = config("PASSWORD_ARGON2_TIME_COST", default=2, cast=int)
+PASSWORD_ARGON2_MEMORY_COST = config("PASSWORD_ARGON2_MEMORY_COST", default=19456, cast=int)  # KiB
+PASSWORD_ARGON2_PARALLELISM = config("PASSWORD_ARGON2_PARALLELISM", default=1, cast=int)
+PASSWORD_PBKDF2_ITERATIONS = config("PASSWORD_PBKDF2_ITERATIONS", default=1_000_000, cast=int)
+# Hashes run on this many threads, requests waiting longer than PASSWORD_HASH_WAIT seconds get a 503
+PASSWORD_HASH_WORKERS = config("PASSWORD_HASH_WORKERS", default=os.cpu_count() or 1, cast=int)
+PASSWORD_HASH_WAIT = config("PASSWORD_HASH_WAIT", default=5, cast=float)
+# ModelBackend with its password checks on that pool (accounts/hashing.py)
+AUTHENTICATION_BACKENDS = ["accounts.hashing.PooledModelBackend"]
+# Login attempts per email and per client IP in a sliding LOGIN_RATE_WINDOW (seconds), 0 disables
+LOGIN_RATE_WINDOW = config("LOGIN_RATE_WINDOW", default=60, cast=int)
+LOGIN_RATE_PER_EMAIL = config("LOGIN_RATE_PER_EMAIL", default=10, cast=int)
+LOGIN_RATE_PER_IP = config("LOGIN_RATE_PER_IP", default=100, cast=int)
+# Addresses/networks of the reverse proxies in front of the app (e.g. nginx), their
+# X-Forwarded-For is trusted for the client IP; empty means REMOTE_ADDR is the client
+LOGIN_RATE_TRUSTED_PROXIES = config("LOGIN_RATE_TRUSTED_PROXIES", default="", cast=Csv())
+LOGIN_RATE_CACHE_ALIAS = "default"
+from decouple import Csv, config
 EMAIL_BACKEND = 'django.core.mail.backends.smtp.EmailBackend'
 EMAIL_HOST = 'smtp.gmail.com'
 EMAIL_PORT = 587
@@ -158,6 +271,36 @@ import os
 STATIC_URL = 'static/'
 MEDIA_URL = '/media/'  # URL path for media files
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
+
+# Uploads are renamed to a hash of their content so they can be cached forever
+STORAGES = {
+    "default": {"BACKEND": "bookstore.storage.HashedFileSystemStorage"},
+    "staticfiles": {"BACKEND": "django.contrib.staticfiles.storage.StaticFilesStorage"},
+}
+# Hand media bodies to the front server: "" (serve from Django), "x-accel-redirect"
+# (nginx, internal location MEDIA_ACCEL_PREFIX aliased to MEDIA_ROOT) or "x-sendfile"
+MEDIA_SENDFILE = config("MEDIA_SENDFILE", default="")
+MEDIA_ACCEL_PREFIX = config("MEDIA_ACCEL_PREFIX", default="/protected-media/")
+
+# Book autocomplete: memory ceiling of the per-process prefix index, how often
+# (seconds) it is rebuilt to pick up writes from other processes, and whether
+# that rebuild runs on a background thread while the old index keeps serving
+TYPEAHEAD_MAX_BYTES = config("TYPEAHEAD_MAX_BYTES", default=64 * 1024 * 1024, cast=int)
+TYPEAHEAD_MAX_AGE = config("TYPEAHEAD_MAX_AGE", default=300, cast=int)
+TYPEAHEAD_REBUILD_ASYNC = config("TYPEAHEAD_REBUILD_ASYNC", default=True, cast=bool)
+
+# Request instrumentation (bookstore.instrumentation): log a request that runs one
+# SQL shape this many times, and cProfile this fraction of requests into PERF_PROFILE_DIR
+PERF_N_PLUS_ONE_THRESHOLD = config("PERF_N_PLUS_ONE_THRESHOLD", default=5, cast=int)
+PERF_PROFILE_SAMPLE_RATE = config("PERF_PROFILE_SAMPLE_RATE", default=0.0, cast=float)
+PERF_PROFILE_DIR = config("PERF_PROFILE_DIR", default=os.path.join(BASE_DIR, "profiles"))
+# Add a Server-Timing header (app, SQL and serializer time) to every response; it
+# exposes backend internals to any client, so only turn it on for debugging
+PERF_SERVER_TIMING = config("PERF_SERVER_TIMING", default=False, cast=bool)
+
+# Build cover thumbnails on a background thread, False builds them inline on save
+COVER_VARIANTS_ASYNC = config("COVER_VARIANTS_ASYNC", default=True, cast=bool)
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
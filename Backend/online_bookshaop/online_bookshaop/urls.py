@@ -1,10 +1,11 @@
 from django.contrib import admin
-from django.urls import path, include
+from django.urls import path, include, re_path
 from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 from django.conf import settings
-from django.conf.urls.static import static
+from bookstore.media import serve_media
+from bookstore.instrumentation import metrics_view
 
 schema_view = get_schema_view(
    openapi.Info(
@@ -25,11 +26,13 @@ urlpatterns = [
     path("api/books-store/", include("bookstore.urls")),
     path("api/cart/", include("cart.urls")),      # Add cart app
     path("api/orders/", include("orders.urls")),  # Add orders app
+    path("metrics/", metrics_view, name="metrics"),  # Prometheus, staff only
 
     # Swagger UI
     path('swagger/', schema_view.with_ui('swagger', cache_timeout=0), name='schema-swagger-ui'),
     # Redoc UI
     path('redoc/', schema_view.with_ui('redoc', cache_timeout=0), name='schema-redoc'),
 ]
-if settings.DEBUG:
-    urlpatterns += static(settings.MEDIA_URL, document_root=settings.MEDIA_ROOT)
\ No newline at end of file
+urlpatterns += [
+    re_path(r"^%s(?P<path>.+)$" % settings.MEDIA_URL.lstrip("/"), serve_media),
+]
\ No newline at end of file
@@ -0,0 +1,97 @@
+# orders/archive.py
+"""
+Monthly rollover of the order history.
+
+Orders older than ORDER_ARCHIVE_MONTHS whole months move, with their items, to
+ArchivedOrder/ArchivedOrderItem, keeping their ids. The live tables then only
+hold the recent months that checkout, the cart badge and the default order
+listings touch, so their indexes stay small whatever the age of the shop.
+The archive is read by the ``history`` listing. Pending orders are never
+archived.
+
+Every batch is one statement: the orders and their items are deleted and
+inserted into the archive together (the foreign keys are deferred to commit).
+"""
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+
+# what can be archived, a pending order stays live however old it is
+ARCHIVED_STATUSES = [value for value, _ in Order.STATUS_CHOICES if value != "Pending"]
+
+
+def month_start(moment):
+    return moment.replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+
+
+def add_months(moment, months):
+    month = moment.month - 1 + months
+    return moment.replace(year=moment.year + month // 12, month=month % 12 + 1)
+
+
+def cutoff(now=None, months=None):
+    """Start of the oldest month kept live"""
+    months = settings.ORDER_ARCHIVE_MONTHS if months is None else months
+    return add_months(month_start(timezone.localtime(now or timezone.now())), -months)
+
+
+def move_batch(start, end, batch_size):
+    """Archive up to batch_size non-pending orders created in [start, end), returns (orders, items)"""
+    quote = connection.ops.quote_name
+    orders, items = quote(Order._meta.db_table), quote(OrderItem._meta.db_table)
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            f"""
+            WITH doomed AS (
+                SELECT id FROM {orders}
+                WHERE status = ANY(%s) AND created_at >= %s AND created_at < %s
+                LIMIT %s FOR UPDATE SKIP LOCKED
+            ), gone_items AS (
+                DELETE FROM {items} i USING doomed d WHERE i.order_id = d.id
+                RETURNING i.id, i.order_id, i.book_id, i.quantity, i.price
+            ), gone_orders AS (
+                DELETE FROM {orders} o USING doomed d WHERE o.id = d.id
+                RETURNING o.id, o.user_id, o.created_at, o.updated_at, o.total_price, o.status
+            ), kept_orders AS (
+                INSERT INTO {quote(ArchivedOrder._meta.db_table)} (id, user_id, created_at, updated_at, total_price, status)
+                SELECT * FROM gone_orders RETURNING 1
+            ), kept_items AS (
+                INSERT INTO {quote(ArchivedOrderItem._meta.db_table)} (id, order_id, book_id, quantity, price)
+                SELECT * FROM gone_items RETURNING 1
+            )
+            SELECT (SELECT count(*) FROM kept_orders), (SELECT count(*) FROM kept_items)
+            """,
+            [ARCHIVED_STATUSES, start, end, batch_size],
+        )
+        return cursor.fetchone()
+
+
+def archive_month(start, batch_size=5000):
+    """Move the month starting at `start`, returns (orders, items) moved"""
+    end = add_months(start, 1)
+    moved_orders = moved_items = 0
+    while True:
+        orders, items = move_batch(start, end, batch_size)
+        moved_orders += orders
+        moved_items += items
+        if orders < batch_size:
+            return moved_orders, moved_items
+
+
+def archive_before(before, batch_size=5000):
+    """Archive every whole month before `before`, oldest first. Yields (month start, orders, items)."""
+    # one index probe per status, status <> 'Pending' could not use order_status_created_idx
+    oldest = [
+        Order.objects.filter(status=value, created_at__lt=before).order_by("created_at").values_list("created_at", flat=True).first()
+        for value in ARCHIVED_STATUSES
+    ]
+    oldest = [moment for moment in oldest if moment is not None]
+    if not oldest:
+        return
+    start = month_start(timezone.localtime(min(oldest)))
+    while start < before:
+        orders, items = archive_month(start, batch_size)
+        yield start, orders, items
+        start = add_months(start, 1)
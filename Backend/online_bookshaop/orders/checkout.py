@@ -0,0 +1,78 @@
+# orders/checkout.py
+from django.db import transaction
+from django.db.models import Case, F, Sum, Value, When
+from django.db.models.functions import Now
+
+from bookstore import facets
+from bookstore.models import Book
+from cart import reservations
+from cart.models import Cart, CartItem, StockReservation
+from .models import Order, OrderItem
+
+
+class CheckoutError(Exception):
+    pass
+
+
+class EmptyCartError(CheckoutError):
+    pass
+
+
+class OutOfStockError(CheckoutError):
+    def __init__(self, books):
+        self.books = books
+        super().__init__("Not enough stock for: " + ", ".join(book.title for book in books))
+
+
+def place_order(cart, user):
+    """
+    Turn the cart into an order in a single transaction.
+
+    The cart items and their books are read and locked in one query, ordered
+    by book id so concurrent checkouts always take the row locks in the same
+    order and cannot deadlock. Copies held by other carts' live reservations
+    are not for sale; this cart's own holds are consumed. Stock is decremented
+    with one conditional UPDATE, so an order can never take a book below zero.
+    """
+    with transaction.atomic():
+        items = list(
+            CartItem.objects.filter(cart=cart)
+            .select_related("book")
+            .select_for_update(of=("self", "book"))
+            .order_by("book_id")
+        )
+        if not items:
+            raise EmptyCartError("Cart is empty")
+
+        books = {item.book_id: item.book for item in items}
+        quantities = {}
+        for item in items:
+            quantities[item.book_id] = quantities.get(item.book_id, 0) + item.quantity
+
+        short = reservations.shortages(books.values(), quantities, cart)
+        if short:
+            raise OutOfStockError(list(short))
+
+        total_price = CartItem.objects.filter(cart=cart).aggregate(
+            total=Sum(F("quantity") * F("book__price"))
+        )["total"]
+        order = Order.objects.create(user=user, total_price=total_price)
+        OrderItem.objects.bulk_create(
+            OrderItem(order=order, book=item.book, quantity=item.quantity, price=item.book.price)
+            for item in items
+        )
+
+        quantity = Case(*[When(pk=pk, then=Value(count)) for pk, count in quantities.items()])
+        updated = Book.objects.filter(pk__in=quantities, stock__gte=quantity).update(
+            stock=F("stock") - quantity, updated_at=Now()
+        )
+        if updated != len(quantities):
+            # rows are locked so this only happens if stock moved under us
+            raise OutOfStockError(list(books.values()))
+        # the UPDATE skips the signals, so move sold out books in the facet counts here
+        facets.sold_out(books, quantities)
+
+        StockReservation.objects.filter(cart=cart).delete()
+        CartItem.objects.filter(cart=cart).delete()
+        Cart.objects.filter(pk=cart.pk).update(item_count=0, total_price=0, updated_at=Now())
+    return order
@@ -0,0 +1,261 @@
+# orders/loadtest.py
+"""
+Replay a weighted mix of storefront requests with concurrent virtual shoppers.
+
+Every worker thread is one shopper: it logs in, then picks scenarios from the
+mix by weight until the run ends. Requests go through Django's in-process test
+client, which also counts the SQL queries of each request, or over HTTP to a
+running server. Results can be saved as a JSON baseline and compared later.
+"""
+import itertools
+import json
+import random
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack
+from pathlib import Path
+
+import requests
+from django.db import connections
+from django.test import Client
+from django.test.utils import CaptureQueriesContext
+
+from bookstore.synthetic import WORDS
+from .synthetic import PASSWORD
+
+# scenario -> weight
+MIX = {
+    "browse": 30,
+    "filter": 15,
+    "search": 10,
+    "detail": 15,
+    "verify_token": 5,
+    "add_item": 12,
+    "update_item": 6,
+    "place_order": 4,
+    "login": 3,
+}
+ORDERINGS = ("id", "price", "-price", "title")
+# one client address per in-process shopper, so the per-IP login limit applies per shopper
+shoppers = itertools.count(1)
+
+
+class InProcessTransport:
+    counts_queries = True
+
+    def __init__(self):
+        # localhost passes ALLOWED_HOSTS when DEBUG is on
+        n = next(shoppers)
+        self.client = Client(HTTP_HOST="localhost", REMOTE_ADDR=f"10.{n // 65536 % 256}.{n // 256 % 256}.{n % 256}")
+
+    def request(self, method, path, token=None, data=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        with ExitStack() as stack:
+            # replicas included, reads go there once DB_REPLICAS is set
+            captured = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            response = self.client.generic(
+                method, path, json.dumps(data) if data is not None else "",
+                content_type="application/json", headers=headers,
+            )
+        return response.status_code, decode(response.content), sum(len(queries) for queries in captured)
+
+    def close(self):
+        connections.close_all()
+
+
+class HttpTransport:
+    counts_queries = False
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.session = requests.Session()
+
+    def request(self, method, path, token=None, data=None):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        response = self.session.request(method, self.base_url + path, json=data, headers=headers, timeout=60)
+        return response.status_code, decode(response.content), None
+
+    def close(self):
+        self.session.close()
+
+
+def decode(content):
+    try:
+        return json.loads(content)
+    except ValueError:
+        return None
+
+
+class Shopper:
+    def __init__(self, transport, email, emails, book_ids, category_ids, rng, record):
+        self.transport = transport
+        self.email = email
+        self.emails = emails
+        self.book_ids = book_ids
+        self.category_ids = category_ids
+        self.rng = rng
+        self.record = record
+        self.token = None
+        self.item_ids = []
+
+    def call(self, scenario, method, path, data=None, auth=True):
+        started = time.perf_counter()
+        try:
+            status, body, queries = self.transport.request(method, path, self.token if auth else None, data)
+        except requests.RequestException:
+            status, body, queries = 599, None, None
+        self.record(scenario, time.perf_counter() - started, status, queries)
+        return status, body
+
+    def remember_items(self, body):
+        if isinstance(body, dict) and "items" in body:
+            self.item_ids = [item["id"] for item in body["items"]]
+
+    def login(self, email=None):
+        # repeat logins go to random users, one user logging in every few seconds would be rate limited
+        email = email or self.rng.choice(self.emails)
+        status, body = self.call("login", "POST", "/api/accounts/users/login/",
+                                 {"email": email, "password": PASSWORD}, auth=False)
+        if status == 200:
+            self.token = body["tokens"]["access"]
+            if email != self.email:
+                self.email, self.item_ids = email, []
+
+    def verify_token(self):
+        self.call("verify_token", "GET", "/api/accounts/users/verify_token/")
+
+    def browse(self):
+        ordering = self.rng.choice(ORDERINGS)
+        self.call("browse", "GET", f"/api/books-store/books/?page_size=24&ordering={ordering}", auth=False)
+
+    def filter(self):
+        low = self.rng.randrange(50, 900, 50)
+        category = self.rng.choice(self.category_ids)
+        path = f"/api/books-store/books/?category={category}&price_min={low}&price_max={low + 100}&page_size=24"
+        self.call("filter", "GET", path, auth=False)
+
+    def search(self):
+        self.call("search", "GET", f"/api/books-store/books/search/?q={self.rng.choice(WORDS)}", auth=False)
+
+    def detail(self):
+        self.call("detail", "GET", f"/api/books-store/books/{self.rng.choice(self.book_ids)}/", auth=False)
+
+    def add_item(self):
+        data = {"book_id": self.rng.choice(self.book_ids), "quantity": 1}
+        status, body = self.call("add_item", "POST", "/api/cart/cart/add_item/", data)
+        self.remember_items(body)
+
+    def update_item(self):
+        if not self.item_ids:
+            return self.add_item()
+        item_id = self.rng.choice(self.item_ids)
+        status, body = self.call("update_item", "PATCH", f"/api/cart/cart/{item_id}/update_item/",
+                                 {"quantity": self.rng.randint(1, 3)})
+        self.remember_items(body)
+
+    def place_order(self):
+        status, body = self.call("place_order", "POST", "/api/orders/orders/place_order/")
+        if status == 201:
+            self.item_ids = []
+
+
+class Recorder:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.samples = defaultdict(list)  # scenario -> [(seconds, status, queries)]
+        self.total = 0
+
+    def __call__(self, scenario, seconds, status, queries):
+        with self.lock:
+            self.samples[scenario].append((seconds, status, queries))
+            self.total += 1
+
+
+def run(transport_factory, emails, book_ids, category_ids, workers=8, duration=30, max_requests=0, mix=None, seed=0):
+    """Drive `workers` shoppers for `duration` seconds (or `max_requests`), returns a summary"""
+    mix = mix or MIX
+    scenarios, weights = zip(*mix.items())
+    recorder = Recorder()
+    deadline = time.perf_counter() + duration
+
+    def shop(worker):
+        rng = random.Random(seed + worker)
+        transport = transport_factory()
+        shopper = Shopper(transport, emails[worker % len(emails)], emails, book_ids, category_ids, rng, recorder)
+        try:
+            shopper.login(shopper.email)
+            while time.perf_counter() < deadline and not (max_requests and recorder.total >= max_requests):
+                getattr(shopper, rng.choices(scenarios, weights)[0])()
+        finally:
+            transport.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=shop, args=(worker,)) for worker in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return summarize(recorder.samples, time.perf_counter() - started)
+
+
+def percentile(ordered, fraction):
+    """Nearest-rank percentile of a sorted list"""
+    index = max(0, min(len(ordered) - 1, round(fraction * len(ordered)) - 1))
+    return ordered[index]
+
+
+def summarize(samples, wall):
+    endpoints = {}
+    for scenario, rows in sorted(samples.items()):
+        latencies = sorted(seconds * 1000 for seconds, _, _ in rows)
+        queries = [count for _, _, count in rows if count is not None]
+        endpoints[scenario] = {
+            "count": len(rows),
+            "rps": len(rows) / wall,
+            "client_errors": sum(1 for _, status, _ in rows if 400 <= status < 500),
+            "server_errors": sum(1 for _, status, _ in rows if status >= 500),
+            "p50": percentile(latencies, 0.50),
+            "p95": percentile(latencies, 0.95),
+            "p99": percentile(latencies, 0.99),
+            "queries": sum(queries) / len(queries) if queries else None,
+        }
+    total = sum(endpoint["count"] for endpoint in endpoints.values())
+    return {"wall": wall, "requests": total, "rps": total / wall, "endpoints": endpoints}
+
+
+def format_summary(summary, baseline=None):
+    lines = [
+        f"{summary['requests']} requests in {summary['wall']:.1f}s ({summary['rps']:.1f}/s)",
+        f"{'endpoint':<14}{'count':>7}{'rps':>8}{'4xx':>6}{'5xx':>6}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}",
+    ]
+    for name, row in summary["endpoints"].items():
+        queries = f"{row['queries']:.1f}" if row["queries"] is not None else "-"
+        lines.append(
+            f"{name:<14}{row['count']:>7}{row['rps']:>8.1f}{row['client_errors']:>6}{row['server_errors']:>6}"
+            f"{row['p50']:>9.1f}{row['p95']:>9.1f}{row['p99']:>9.1f}{queries:>9}"
+        )
+        before = (baseline or {}).get("endpoints", {}).get(name)
+        if before:
+            lines.append("  vs baseline  " + "  ".join(
+                f"{key} {change(before[key], row[key])}" for key in ("rps", "p50", "p95", "p99", "queries")
+            ))
+    if baseline:
+        lines.append(f"overall rps {change(baseline['rps'], summary['rps'])}")
+    return "\n".join(lines)
+
+
+def change(before, after):
+    if before in (None, 0) or after is None:
+        return "n/a"
+    return f"{(after - before) / before * 100:+.1f}%"
+
+
+def save_baseline(summary, path, **meta):
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(json.dumps({**summary, "meta": meta}, indent=2))
+
+
+def load_baseline(path):
+    return json.loads(Path(path).read_text())
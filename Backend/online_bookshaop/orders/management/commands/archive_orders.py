@@ -0,0 +1,30 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from orders.archive import archive_before, cutoff
+
+
+class Command(BaseCommand):
+    help = (
+        "Move completed and cancelled orders older than ORDER_ARCHIVE_MONTHS whole months to the archive tables, "
+        "a month at a time (run monthly from cron, or with --every)"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--months", type=int, help="months to keep live (default: ORDER_ARCHIVE_MONTHS)")
+        parser.add_argument("--batch-size", type=int, default=5000)
+        parser.add_argument("--every", type=float, default=0, help="keep running, archiving every this many seconds")
+
+    def handle(self, *args, **options):
+        while True:
+            before = cutoff(months=options["months"])
+            started = time.perf_counter()
+            total = 0
+            for month, orders, items in archive_before(before, batch_size=options["batch_size"]):
+                total += orders
+                self.stdout.write(f"{month:%Y-%m}: archived {orders} orders, {items} items")
+            self.stdout.write(f"Archived {total} orders created before {before:%Y-%m-%d} in {time.perf_counter() - started:.1f}s")
+            if not options["every"]:
+                return
+            time.sleep(options["every"])
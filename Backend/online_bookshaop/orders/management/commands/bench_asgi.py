@@ -0,0 +1,166 @@
+import asyncio
+import io
+import random
+import threading
+import time
+
+from django.core.asgi import get_asgi_application
+from django.core.management.base import BaseCommand
+from django.core.wsgi import get_wsgi_application
+from django.test import override_settings
+
+from accounts.authentication import ClaimsRefreshToken
+from bookstore.models import Category
+from orders.loadtest import percentile
+from orders.synthetic import seed_dataset
+
+ORDERINGS = ("id", "price", "-price", "title")
+
+
+class Requests:
+    """A random stream of the endpoints that have async routes"""
+
+    def __init__(self, book_ids, category_ids, tokens, seed):
+        self.book_ids, self.category_ids, self.tokens = book_ids, category_ids, tokens
+        self.random = random.Random(seed)
+
+    def next(self):
+        pick = self.random.random()
+        token = self.random.choice(self.tokens)
+        if pick < 0.35:
+            path = f"/api/books-store/books/?page_size=24&ordering={self.random.choice(ORDERINGS)}"
+            if self.random.random() < 0.5:
+                path += f"&category={self.random.choice(self.category_ids)}"
+            return path, None
+        if pick < 0.65:
+            return f"/api/books-store/books/{self.random.choice(self.book_ids)}/", None
+        if pick < 0.75:
+            return "/api/books-store/categories/", None
+        if pick < 0.85:
+            return "/api/accounts/users/verify_token/", token
+        return "/api/cart/cart/summary/", token
+
+
+def wsgi_get(application, path, token):
+    path, _, query = path.partition("?")
+    environ = {
+        "REQUEST_METHOD": "GET", "PATH_INFO": path, "QUERY_STRING": query, "SCRIPT_NAME": "",
+        "SERVER_NAME": "localhost", "SERVER_PORT": "80", "SERVER_PROTOCOL": "HTTP/1.1", "REMOTE_ADDR": "127.0.0.1",
+        "HTTP_HOST": "localhost", "wsgi.input": io.BytesIO(), "wsgi.errors": io.StringIO(), "wsgi.url_scheme": "http",
+        "wsgi.version": (1, 0), "wsgi.multithread": True, "wsgi.multiprocess": False, "wsgi.run_once": False,
+    }
+    if token:
+        environ["HTTP_AUTHORIZATION"] = f"Bearer {token}"
+    started = []
+    body = application(environ, lambda status, headers, exc_info=None: started.append(status))
+    try:
+        b"".join(body)
+    finally:
+        body.close()
+    return int(started[0].split()[0])
+
+
+async def asgi_get(application, path, token):
+    path, _, query = path.partition("?")
+    headers = [(b"host", b"localhost")]
+    if token:
+        headers.append((b"authorization", f"Bearer {token}".encode()))
+    scope = {
+        "type": "http", "asgi": {"version": "3.0"}, "http_version": "1.1", "method": "GET", "scheme": "http",
+        "path": path, "raw_path": path.encode(), "query_string": query.encode(), "root_path": "",
+        "headers": headers, "client": ("127.0.0.1", 0), "server": ("localhost", 80),
+    }
+    sent = asyncio.Event()
+    status = []
+
+    async def receive():
+        if not sent.is_set():
+            sent.set()
+            return {"type": "http.request", "body": b"", "more_body": False}
+        # Django listens for the disconnect until the response is done
+        await asyncio.Event().wait()
+
+    async def send(message):
+        if message["type"] == "http.response.start":
+            status.append(message["status"])
+
+    await application(scope, receive, send)
+    return status[0]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the hot read endpoints served over WSGI (N threads) and ASGI (N concurrent tasks on one "
+        "event loop), in process through Django's handlers, and report requests/s and latency per concurrency"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=200)
+        parser.add_argument("--books", type=int, default=5000)
+        parser.add_argument("--concurrency", default="1,8,32", help="comma separated")
+        parser.add_argument("--seconds", type=float, default=5)
+        parser.add_argument("--no-cache", action="store_true", help="disable the catalog response cache")
+        parser.add_argument("--seed", type=int, default=0)
+
+    def run_wsgi(self, stream, concurrency, seconds):
+        application = get_wsgi_application()
+        rows = []
+        lock = threading.Lock()
+        deadline = time.perf_counter() + seconds
+
+        def worker():
+            while time.perf_counter() < deadline:
+                with lock:
+                    path, token = stream.next()
+                started = time.perf_counter()
+                status = wsgi_get(application, path, token)
+                with lock:
+                    rows.append((time.perf_counter() - started, status))
+
+        started = time.perf_counter()
+        threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        return rows, time.perf_counter() - started
+
+    def run_asgi(self, stream, concurrency, seconds):
+        application = get_asgi_application()
+        rows = []
+
+        async def worker(deadline):
+            while time.perf_counter() < deadline:
+                path, token = stream.next()
+                started = time.perf_counter()
+                status = await asgi_get(application, path, token)
+                rows.append((time.perf_counter() - started, status))
+
+        async def main():
+            deadline = time.perf_counter() + seconds
+            await asyncio.gather(*(worker(deadline) for _ in range(concurrency)))
+
+        started = time.perf_counter()
+        asyncio.run(main())
+        return rows, time.perf_counter() - started
+
+    def handle(self, *args, **options):
+        users, books = seed_dataset(users=options["users"], books=options["books"])
+        book_ids = list(books.values_list("id", flat=True))
+        category_ids = list(Category.objects.values_list("id", flat=True))
+        tokens = [str(ClaimsRefreshToken.for_user(user).access_token) for user in users[:options["users"]]]
+        self.stdout.write(f"dataset: {len(tokens)} users, {len(book_ids)} books, cache {'off' if options['no_cache'] else 'on'}")
+        self.stdout.write(f"{'server':<8}{'concurrency':>12}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'errors':>8}")
+
+        timeout = {"CATALOG_CACHE_TIMEOUT": 0} if options["no_cache"] else {}
+        with override_settings(**timeout):
+            for concurrency in [int(value) for value in options["concurrency"].split(",")]:
+                for server, run in (("wsgi", self.run_wsgi), ("asgi", self.run_asgi)):
+                    stream = Requests(book_ids, category_ids, tokens, options["seed"])
+                    rows, wall = run(stream, concurrency, options["seconds"])
+                    latencies = sorted(seconds * 1000 for seconds, _ in rows) or [0]
+                    errors = sum(1 for _, status in rows if status >= 400)
+                    self.stdout.write(
+                        f"{server:<8}{concurrency:>12}{len(rows) / wall:>10.1f}"
+                        f"{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}{errors:>8}"
+                    )
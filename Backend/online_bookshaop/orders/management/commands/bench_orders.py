@@ -0,0 +1,108 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test import Client
+from django.utils import timezone
+
+from accounts.authentication import ClaimsRefreshToken
+from accounts.models import CustomUser
+from bookstore.synthetic import seed_books
+from orders.archive import archive_before, cutoff
+from orders.loadtest import percentile
+from orders.models import ArchivedOrder, Order
+from orders.synthetic import seed_order_history, seed_users
+
+PREFIX = "bench-orders"
+
+
+class Command(BaseCommand):
+    help = (
+        "Generate a long order history, time the order listings, archive everything past ORDER_ARCHIVE_MONTHS "
+        "with the monthly rollover and time the listings again"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--orders", type=int, default=10_000_000, help="orders to have in the history")
+        parser.add_argument("--users", type=int, default=100_000)
+        parser.add_argument("--months", type=int, default=36, help="period the history covers")
+        parser.add_argument("--keep", type=int, help="months kept live (default: ORDER_ARCHIVE_MONTHS)")
+        parser.add_argument("--repeat", type=int, default=30)
+        parser.add_argument("--seed", type=int, default=0)
+
+    def seed(self, options):
+        users = seed_users(options["users"], prefix=PREFIX)
+        books = seed_books(1000, prefix=PREFIX)
+        have = Order.objects.filter(user__email__startswith=PREFIX + "-").count()
+        have += ArchivedOrder.objects.filter(user__email__startswith=PREFIX + "-").count()
+        if have < options["orders"]:
+            started = time.perf_counter()
+            seed_order_history(users, books, options["orders"] - have, months=options["months"])
+            self.stdout.write(f"generated {options['orders'] - have} orders in {time.perf_counter() - started:.0f}s")
+        with connection.cursor() as cursor:
+            cursor.execute(f"ANALYZE {Order._meta.db_table}, {ArchivedOrder._meta.db_table}")
+        return users
+
+    def scenarios(self, users, rng):
+        """name -> function returning (client, url, next pages to follow) for one listing"""
+        user_ids = list(users.values_list("id", flat=True))
+        staff = CustomUser.objects.filter(email=f"{PREFIX}-staff@example.com").first()
+        if staff is None:
+            staff = CustomUser.objects.create_user(email=f"{PREFIX}-staff@example.com", password=None, is_staff=True)
+        clients = {}
+
+        def client_for(user_id):
+            if user_id not in clients:
+                user = staff if user_id == staff.pk else CustomUser.objects.get(pk=user_id)
+                token = ClaimsRefreshToken.for_user(user).access_token
+                clients[user_id] = Client(HTTP_HOST="localhost", HTTP_AUTHORIZATION=f"Bearer {token}")
+            return clients[user_id]
+
+        last_month = (timezone.now() - timedelta(days=30)).isoformat()
+        return {
+            "own orders": lambda: (client_for(rng.choice(user_ids)), "/api/orders/orders/?page_size=20", 0),
+            "own history": lambda: (client_for(rng.choice(user_ids)), "/api/orders/orders/history/", 0),
+            "staff, pending": lambda: (client_for(staff.pk), "/api/orders/orders/?status=Pending&page_size=20", 0),
+            "staff, last 30 days": lambda: (
+                client_for(staff.pk), f"/api/orders/orders/?created_after={last_month.replace('+', '%2B')}&page_size=20", 0
+            ),
+            "staff, pages 1-5": lambda: (client_for(staff.pk), "/api/orders/orders/?page_size=20", 4),
+        }
+
+    def measure(self, scenarios, repeat):
+        self.stdout.write(f"{'listing':<22}{'p50 ms':>9}{'p95 ms':>9}")
+        for name, pick in scenarios.items():
+            latencies = []
+            for _ in range(repeat):
+                client, url, pages = pick()
+                started = time.perf_counter()
+                response = client.get(url)
+                for _ in range(pages):
+                    response = client.get(response.json()["next"])
+                latencies.append((time.perf_counter() - started) * 1000)
+                assert response.status_code == 200, (url, response.status_code)
+            latencies.sort()
+            self.stdout.write(f"{name:<22}{percentile(latencies, 0.5):>9.1f}{percentile(latencies, 0.95):>9.1f}")
+
+    def sizes(self):
+        self.stdout.write(f"live orders: {Order.objects.count()}, archived: {ArchivedOrder.objects.count()}")
+
+    def handle(self, *args, **options):
+        rng = random.Random(options["seed"])
+        users = self.seed(options)
+        scenarios = self.scenarios(users, rng)
+        self.sizes()
+        self.measure(scenarios, options["repeat"])
+
+        before = cutoff(months=options["keep"])
+        started = time.perf_counter()
+        moved = sum(orders for _, orders, _ in archive_before(before))
+        seconds = time.perf_counter() - started
+        self.stdout.write(f"archived {moved} orders before {before:%Y-%m} in {seconds:.1f}s ({moved / max(seconds, 1e-9):.0f} orders/s)")
+        with connection.cursor() as cursor:
+            cursor.execute(f"VACUUM ANALYZE {Order._meta.db_table}")
+            cursor.execute(f"ANALYZE {ArchivedOrder._meta.db_table}")
+        self.sizes()
+        self.measure(scenarios, options["repeat"])
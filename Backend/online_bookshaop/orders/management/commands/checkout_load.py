@@ -0,0 +1,78 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from accounts.models import CustomUser
+from bookstore.models import Book, Category
+from cart.models import Cart, CartItem
+from orders import checkout
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Run concurrent checkouts against a few hot books and report latency"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=200)
+        parser.add_argument("--workers", type=int, default=16)
+        parser.add_argument("--books", type=int, default=3, help="distinct books in every cart")
+        parser.add_argument("--stock", type=int, default=100, help="stock per book")
+
+    def handle(self, *args, **options):
+        category, _ = Category.objects.get_or_create(name="Load test")
+        books = Book.objects.bulk_create(
+            Book(title=f"Load test {i}", author="Load test", price=100, isbn=f"load-test-{i}",
+                 description="", category=category, stock=options["stock"])
+            for i in range(options["books"])
+        )
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f"load-test-{i}@example.com") for i in range(options["buyers"])
+        )
+        carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+        CartItem.objects.bulk_create(
+            CartItem(cart=cart, book=book, quantity=1) for cart in carts for book in books
+        )
+
+        latencies = []
+        failures = []
+        lock = threading.Lock()
+
+        def buy(cart):
+            started = time.perf_counter()
+            try:
+                checkout.place_order(cart, cart.user)
+            except checkout.CheckoutError:
+                with lock:
+                    failures.append(cart.pk)
+            finally:
+                elapsed = time.perf_counter() - started
+                with lock:
+                    latencies.append(elapsed)
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                list(pool.map(buy, carts))
+            wall = time.perf_counter() - started
+
+            latencies.sort()
+            quantiles = statistics.quantiles(latencies, n=100)
+            self.stdout.write(
+                f"{len(carts)} checkouts with {options['workers']} workers in {wall:.2f}s "
+                f"({len(carts) / wall:.1f}/s), {len(failures)} out of stock"
+            )
+            self.stdout.write(
+                f"latency ms p50={quantiles[49] * 1000:.1f} p95={quantiles[94] * 1000:.1f} "
+                f"p99={quantiles[98] * 1000:.1f} max={latencies[-1] * 1000:.1f}"
+            )
+            sold = options["books"] * options["stock"] - sum(Book.objects.filter(pk__in=[b.pk for b in books]).values_list("stock", flat=True))
+            self.stdout.write(f"sold {sold} copies, {Order.objects.filter(user__in=users).count()} orders")
+        finally:
+            Order.objects.filter(user__in=users).delete()
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+            Book.objects.filter(pk__in=[book.pk for book in books]).delete()
@@ -0,0 +1,71 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from bookstore.models import Category
+from orders import loadtest
+from orders.synthetic import seed_dataset
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed users, books, carts and orders, replay a storefront request mix with concurrent "
+        "shoppers and report throughput, latency percentiles and queries per endpoint"
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=500)
+        parser.add_argument("--books", type=int, default=20000)
+        parser.add_argument("--workers", type=int, default=8, help="concurrent shoppers")
+        parser.add_argument("--duration", type=float, default=30, help="seconds")
+        parser.add_argument("--requests", type=int, default=0, help="stop after this many requests")
+        parser.add_argument("--url", help="load a running server instead of the in-process client")
+        parser.add_argument("--mix", help="weights, e.g. browse=50,add_item=10 (default: the built-in mix)")
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--baseline-dir", default=str(Path(settings.BASE_DIR) / "benchmarks"))
+        parser.add_argument("--save-baseline", metavar="NAME")
+        parser.add_argument("--compare", metavar="NAME", help="show changes against a saved baseline")
+
+    def parse_mix(self, value):
+        if not value:
+            return loadtest.MIX
+        mix = {}
+        for part in value.split(","):
+            name, _, weight = part.partition("=")
+            if name not in loadtest.MIX or not weight.isdigit():
+                raise CommandError(f"Bad mix entry {part!r}, scenarios are {', '.join(loadtest.MIX)}")
+            mix[name] = int(weight)
+        return mix
+
+    def handle(self, *args, **options):
+        mix = self.parse_mix(options["mix"])
+        baseline_dir = Path(options["baseline_dir"])
+        baseline = None
+        if options["compare"]:
+            baseline = loadtest.load_baseline(baseline_dir / f"{options['compare']}.json")
+
+        users, books = seed_dataset(users=options["users"], books=options["books"])
+        emails = list(users.values_list("email", flat=True)[:options["users"]])
+        book_ids = list(books.values_list("id", flat=True))
+        category_ids = list(Category.objects.values_list("id", flat=True))
+        self.stdout.write(f"dataset: {len(emails)} users, {len(book_ids)} books")
+
+        if options["url"]:
+            factory = lambda: loadtest.HttpTransport(options["url"])
+        else:
+            factory = loadtest.InProcessTransport
+        summary = loadtest.run(
+            factory, emails, book_ids, category_ids,
+            workers=options["workers"], duration=options["duration"],
+            max_requests=options["requests"], mix=mix, seed=options["seed"],
+        )
+        self.stdout.write(loadtest.format_summary(summary, baseline))
+
+        if options["save_baseline"]:
+            path = baseline_dir / f"{options['save_baseline']}.json"
+            loadtest.save_baseline(
+                summary, path, users=len(emails), books=len(book_ids), workers=options["workers"],
+                target=options["url"] or "in-process", mix=mix,
+            )
+            self.stdout.write(f"baseline saved to {path}")
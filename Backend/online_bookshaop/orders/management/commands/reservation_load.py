@@ -0,0 +1,99 @@
+import statistics
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from accounts.models import CustomUser
+from bookstore.models import Book, Category
+from cart import reservations
+from cart.models import Cart, CartItem, StockReservation
+from orders import checkout
+from orders.models import Order
+
+
+class Command(BaseCommand):
+    help = "Many buyers reserve and check out one hot title at once; report throughput, latency and oversell"
+
+    def add_arguments(self, parser):
+        parser.add_argument("--buyers", type=int, default=500)
+        parser.add_argument("--workers", type=int, default=32, help="concurrent buyers (each holds a connection)")
+        parser.add_argument("--stock", type=int, default=100)
+        parser.add_argument("--no-checkout", action="store_true", help="only reserve")
+
+    def report(self, label, latencies, wall, extra):
+        latencies.sort()
+        quantiles = statistics.quantiles(latencies, n=100) if len(latencies) > 1 else latencies * 99
+        self.stdout.write(
+            f"{label:<9} {len(latencies)} in {wall:.2f}s ({len(latencies) / wall:.1f}/s) "
+            f"p50={quantiles[49] * 1000:.1f}ms p95={quantiles[94] * 1000:.1f}ms p99={quantiles[98] * 1000:.1f}ms, {extra}"
+        )
+
+    def handle(self, *args, **options):
+        category, _ = Category.objects.get_or_create(name="Load test")
+        book = Book.objects.create(title="Hot title", author="Load test", price=100, isbn=f"hot-{time.time_ns() % 10**15}",
+                                   description="", category=category, stock=options["stock"])
+        users = CustomUser.objects.bulk_create(
+            CustomUser(email=f"hot-title-{book.pk}-{i}@example.com") for i in range(options["buyers"])
+        )
+        carts = Cart.objects.bulk_create(Cart(user=user) for user in users)
+
+        timings = {"reserve": [], "checkout": []}
+        held, sold_out = [], []
+        lock = threading.Lock()
+
+        def timed(name, fn, *args):
+            started = time.perf_counter()
+            try:
+                return fn(*args)
+            finally:
+                with lock:
+                    timings[name].append(time.perf_counter() - started)
+
+        def add_to_cart(cart):
+            with transaction.atomic():
+                items = CartItem.objects.add_books(cart, {book.pk: 1})
+                reservations.hold(cart, {item.book_id: item.quantity for item in items})
+
+        def buy(cart):
+            try:
+                timed("reserve", add_to_cart, cart)
+                with lock:
+                    held.append(cart)
+            except reservations.InsufficientStock:
+                with lock:
+                    sold_out.append(cart)
+            finally:
+                connection.close()
+
+        def pay(cart):
+            try:
+                timed("checkout", checkout.place_order, cart, cart.user)
+            finally:
+                connection.close()
+
+        try:
+            started = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                list(pool.map(buy, carts))
+            wall = time.perf_counter() - started
+            live = StockReservation.objects.filter(book=book).count()
+            self.report("reserve", timings["reserve"], wall, f"{len(held)} held, {len(sold_out)} sold out, {live} live holds")
+
+            if not options["no_checkout"]:
+                started = time.perf_counter()
+                with ThreadPoolExecutor(max_workers=options["workers"]) as pool:
+                    list(pool.map(pay, held))
+                wall = time.perf_counter() - started
+                book.refresh_from_db(fields=["stock"])
+                orders = Order.objects.filter(user__in=users).count()
+                self.report("checkout", timings["checkout"], wall, f"{orders} orders, {book.stock} left")
+
+            oversold = len(held) > options["stock"] or book.stock < 0
+            self.stdout.write(f"oversold: {'YES' if oversold else 'no'}")
+        finally:
+            Order.objects.filter(user__in=users).delete()
+            CustomUser.objects.filter(pk__in=[user.pk for user in users]).delete()
+            book.delete()
@@ -11,11 +11,23 @@ class Order(models.Model):
         ('Cancelled', 'Cancelled')
     ]
     
-    user = models.ForeignKey(User, on_delete=models.CASCADE,null=True, blank=True)
+    # order_user_created_idx covers lookups by user
+    user = models.ForeignKey(User, on_delete=models.CASCADE,null=True, blank=True, db_index=False)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     total_price = models.DecimalField(max_digits=10, decimal_places=2)
     status = models.CharField(max_length=50, choices=STATUS_CHOICES, default='Pending')
 
+    class Meta:
+        indexes = [
+            # a user's history, newest first
+            models.Index(fields=["user", "-created_at"], name="order_user_created_idx"),
+            # admin listings by status and period
+            models.Index(fields=["status", "created_at"], name="order_status_created_idx"),
+            # admin listings over everything, in the listing's (created_at, id) order
+            models.Index(fields=["-created_at", "-id"], name="order_created_idx"),
+        ]
+
     def __str__(self):
         return f"Order {self.id} - {self.user.username}"
 
@@ -28,3 +40,30 @@ class OrderItem(models.Model):
 
     def __str__(self):
         return f"{self.quantity} x {self.book.title}"
+
+
+class ArchivedOrder(models.Model):
+    """An order moved out of Order by orders/archive.py, with its id and columns unchanged"""
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, db_index=False,
+                             related_name="archived_orders")
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    total_price = models.DecimalField(max_digits=10, decimal_places=2)
+    status = models.CharField(max_length=50, choices=Order.STATUS_CHOICES)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "-created_at"], name="archived_user_created_idx"),
+            models.Index(fields=["status", "created_at"], name="archived_status_created_idx"),
+            models.Index(fields=["-created_at", "-id"], name="archived_created_idx"),
+        ]
+
+
+class ArchivedOrderItem(models.Model):
+    id = models.BigIntegerField(primary_key=True)
+    order = models.ForeignKey(ArchivedOrder, related_name="items", on_delete=models.CASCADE)
+    book = models.ForeignKey(Book, on_delete=models.CASCADE, related_name="+")
+    quantity = models.PositiveIntegerField()
+    price = models.DecimalField(max_digits=8, decimal_places=2)
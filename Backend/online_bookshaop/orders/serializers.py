@@ -1,20 +1,66 @@
+import django_filters
+from django.db.models import Prefetch
 from rest_framework import serializers
-from .models import Order, OrderItem
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
 from bookstore.models import Book
+from bookstore.instrumentation import TimedSerializerMixin
 from bookstore.serializers import BookSerializer
 
 
-class OrderItemSerializer(serializers.ModelSerializer):
+class OrderItemSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     book = BookSerializer(read_only=True)
 
     class Meta:
         model = OrderItem
         fields = ['id', 'book', 'quantity', 'price']
 
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return BookSerializer.setup_eager_loading(queryset, prefix="book__")
 
-class OrderSerializer(serializers.ModelSerializer):
+
+class OrderSerializer(TimedSerializerMixin, serializers.ModelSerializer):
     items = OrderItemSerializer(many=True, read_only=True)
 
     class Meta:
         model = Order
         fields = ['id', 'user', 'created_at', 'total_price', 'status', 'items']
+
+    @staticmethod
+    def items_prefetch():
+        return Prefetch("items", queryset=OrderItemSerializer.setup_eager_loading(OrderItem.objects.order_by("id")))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(OrderSerializer.items_prefetch())
+
+
+class ArchivedOrderItemSerializer(OrderItemSerializer):
+    class Meta(OrderItemSerializer.Meta):
+        model = ArchivedOrderItem
+
+
+class ArchivedOrderSerializer(OrderSerializer):
+    items = ArchivedOrderItemSerializer(many=True, read_only=True)
+
+    class Meta(OrderSerializer.Meta):
+        model = ArchivedOrder
+
+    @staticmethod
+    def items_prefetch():
+        return Prefetch("items", queryset=ArchivedOrderItemSerializer.setup_eager_loading(ArchivedOrderItem.objects.order_by("id")))
+
+    @staticmethod
+    def setup_eager_loading(queryset):
+        return queryset.prefetch_related(ArchivedOrderSerializer.items_prefetch())
+
+
+class OrderFilter(django_filters.FilterSet):
+    """Status and period filters, served by the (status, created_at) and (user, created_at) indexes"""
+
+    created_after = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr="gte")
+    created_before = django_filters.IsoDateTimeFilter(field_name="created_at", lookup_expr="lt")
+
+    class Meta:
+        model = Order
+        fields = ["status", "created_after", "created_before"]
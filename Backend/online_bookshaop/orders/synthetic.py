@@ -0,0 +1,124 @@
+# orders/synthetic.py
+"""Synthetic users, carts and orders for load tests, on top of bookstore.synthetic."""
+import random
+
+from django.contrib.auth.hashers import make_password
+from django.db import connection, transaction
+from django.db.models.functions import Now
+
+from accounts.models import CustomUser
+from bookstore import facets
+from bookstore.cache import bump_catalog_version
+from bookstore.synthetic import seed_books
+from cart.models import Cart, CartItem
+from .models import Order, OrderItem
+
+PASSWORD = "loadtest-password"
+
+
+def user_email(prefix, n):
+    return f"{prefix}-{n}@example.com"
+
+
+def seed_users(count, prefix="loadtest", batch_size=5000):
+    """Users ``<prefix>-<n>@example.com`` sharing PASSWORD, hashed once for all of them"""
+    password = make_password(PASSWORD)
+    users = CustomUser.objects.filter(email__startswith=prefix + "-")
+    existing = users.count()
+    for start in range(existing, count, batch_size):
+        CustomUser.objects.bulk_create(
+            [
+                CustomUser(email=user_email(prefix, n), password=password, first_name="Load", last_name=str(n))
+                for n in range(start, min(start + batch_size, count))
+            ],
+            ignore_conflicts=True,
+        )
+    return users.order_by("id")
+
+
+def seed_carts(users, books, items=3, seed=0):
+    """A cart holding `items` random books for every user that has none"""
+    rng = random.Random(seed)
+    book_ids = list(books.values_list("id", flat=True))
+    missing = users.filter(cart__isnull=True)
+    carts = Cart.objects.bulk_create([Cart(user=user) for user in missing.iterator()], batch_size=5000)
+    CartItem.objects.bulk_create(
+        (
+            CartItem(cart=cart, book_id=book_id, quantity=rng.randint(1, 3))
+            for cart in carts for book_id in rng.sample(book_ids, min(items, len(book_ids)))
+        ),
+        batch_size=5000,
+        ignore_conflicts=True,
+    )
+    Cart.recalculate(Cart.objects.filter(pk__in=[cart.pk for cart in carts]))
+
+
+def seed_orders(users, books, per_user=2, seed=0):
+    """Order history, `per_user` orders of one to three books for users without orders"""
+    rng = random.Random(seed)
+    prices = dict(books.values_list("id", "price"))
+    book_ids = list(prices)
+    statuses = [choice for choice, _ in Order.STATUS_CHOICES]
+    orders, lines = [], []
+    for user in users.filter(order__isnull=True).iterator():
+        for _ in range(per_user):
+            picked = [(book_id, rng.randint(1, 2)) for book_id in rng.sample(book_ids, rng.randint(1, min(3, len(book_ids))))]
+            total = sum(prices[book_id] * quantity for book_id, quantity in picked)
+            orders.append(Order(user=user, total_price=total, status=rng.choice(statuses)))
+            lines.append(picked)
+    Order.objects.bulk_create(orders, batch_size=5000)
+    OrderItem.objects.bulk_create(
+        (
+            OrderItem(order=order, book_id=book_id, quantity=quantity, price=prices[book_id])
+            for order, picked in zip(orders, lines) for book_id, quantity in picked
+        ),
+        batch_size=5000,
+    )
+
+
+def seed_order_history(users, books, count, months=36, batch_size=1_000_000):
+    """
+    `count` single-item orders spread over the last `months` months, generated in SQL
+    (bulk_create is far too slow for tens of millions). Recent ones may still be pending.
+    """
+    user_ids = list(users.values_list("id", flat=True))
+    book_ids = list(books.values_list("id", flat=True))
+    orders = connection.ops.quote_name(Order._meta.db_table)
+    items = connection.ops.quote_name(OrderItem._meta.db_table)
+    seconds = months * 30 * 86400
+    for start in range(0, count, batch_size):
+        with transaction.atomic(), connection.cursor() as cursor:
+            cursor.execute(f"SELECT coalesce(max(id), 0) FROM {orders}")
+            last_id = cursor.fetchone()[0]
+            # 7919 is prime, so g * 7919 % seconds scatters the timestamps over the period
+            cursor.execute(
+                f"""
+                INSERT INTO {orders} (user_id, created_at, updated_at, total_price, status)
+                SELECT (%s::bigint[])[1 + g %% %s], at, at, 5 + g %% 95,
+                       CASE WHEN at > now() - interval '7 days' AND g %% 3 = 0 THEN 'Pending'
+                            WHEN g %% 20 = 0 THEN 'Cancelled' ELSE 'Completed' END
+                FROM (SELECT g, now() - (g::bigint * 7919 %% %s) * interval '1 second' AS at
+                      FROM generate_series(%s, %s) g) generated
+                """,
+                [user_ids, len(user_ids), seconds, start, min(start + batch_size, count) - 1],
+            )
+            cursor.execute(
+                f"""
+                INSERT INTO {items} (order_id, book_id, quantity, price)
+                SELECT id, (%s::bigint[])[1 + id %% %s], 1, total_price FROM {orders} WHERE id > %s
+                """,
+                [book_ids, len(book_ids), last_id],
+            )
+
+
+def seed_dataset(users=1000, books=10000, prefix="loadtest", stock=1_000_000):
+    """Catalog, users, carts and orders, topping up what an earlier run left"""
+    catalog = seed_books(books, prefix=prefix)
+    # plenty of stock so the checkout mix measures checkout, not sold-out rejections
+    catalog.filter(stock__lt=stock // 2).update(stock=stock, updated_at=Now())
+    facets.rebuild()
+    bump_catalog_version()
+    people = seed_users(users, prefix=prefix)
+    seed_carts(people, catalog)
+    seed_orders(people, catalog)
+    return people, catalog
@@ -1,3 +1,315 @@
-from django.test import TestCase
+import threading
+from datetime import timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Sum
+from django.test import RequestFactory, TestCase, TransactionTestCase, override_settings
+from django.utils import timezone
+from rest_framework.response import Response
+from rest_framework.test import APIClient
+
+from accounts.models import CustomUser
+from bookstore import facets, idempotency
+from bookstore.models import Book, BookFacetCount
+from bookstore.tests import cursor_param, make_books
+from cart.models import Cart, CartItem
+from . import loadtest
+from .models import ArchivedOrder, ArchivedOrderItem, Order, OrderItem
+from .synthetic import seed_dataset
+
+
+class OrderQueryBudgetTests(TestCase):
+    """Order listings must run a constant number of queries whatever the history size."""
+
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        books = make_books(6)
+        for _ in range(5):
+            order = Order.objects.create(user=self.user, total_price=0)
+            OrderItem.objects.bulk_create(OrderItem(order=order, book=book, quantity=1, price=book.price) for book in books)
+
+    def test_list_orders(self):
+        # ETag aggregate, orders, items with books and categories
+        with self.assertNumQueries(3):
+            response = self.client.get("/api/orders/orders/")
+        self.assertEqual(len(response.json()), 5)
+
+    def test_list_orders_as_admin(self):
+        self.user.is_staff = True
+        self.user.save()
+        with self.assertNumQueries(3):
+            self.client.get("/api/orders/orders/")
+
+
+class PlaceOrderTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.books = make_books(5)
+        Book.objects.update(stock=3)
+        cart = Cart.objects.create(user=self.user)
+        CartItem.objects.bulk_create(CartItem(cart=cart, book=book, quantity=2) for book in self.books)
+
+    def test_place_order(self):
+        # cart, lock items, other carts' holds, total, order, order items, stock, drop holds,
+        # clear cart, reset totals, response prefetch, plus the savepoint pair the test case
+        # wraps around transaction.atomic
+        with self.assertNumQueries(13):
+            response = self.client.post("/api/orders/orders/place_order/")
+        self.assertEqual(response.status_code, 201)
+        order = Order.objects.get()
+        self.assertEqual(order.total_price, sum(book.price * 2 for book in self.books))
+        self.assertEqual(order.items.count(), 5)
+        self.assertEqual(set(Book.objects.values_list("stock", flat=True)), {1})
+        self.assertFalse(CartItem.objects.exists())
+
+    def test_sold_out_books_move_in_the_facet_counts(self):
+        Book.objects.filter(pk=self.books[0].pk).update(stock=2)
+        facets.rebuild()
+        self.client.post("/api/orders/orders/place_order/")
+        in_stock = BookFacetCount.objects.filter(facet="format", in_stock=True).aggregate(n=Sum("count"))["n"]
+        sold_out = BookFacetCount.objects.filter(facet="format", in_stock=False).aggregate(n=Sum("count"))["n"]
+        self.assertEqual((in_stock, sold_out), (4, 1))
+
+    def test_out_of_stock_rolls_back(self):
+        Book.objects.filter(pk=self.books[0].pk).update(stock=1)
+        response = self.client.post("/api/orders/orders/place_order/")
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Order.objects.exists())
+        self.assertEqual(CartItem.objects.count(), 5)
+        self.assertEqual(Book.objects.filter(stock=3).count(), 4)
+
+    def test_empty_cart(self):
+        CartItem.objects.all().delete()
+        response = self.client.post("/api/orders/orders/place_order/")
+        self.assertEqual(response.status_code, 400)
+
+
+class ConcurrentPlaceOrderTests(TransactionTestCase):
+    def test_no_oversell(self):
+        book = make_books(1)[0]
+        Book.objects.filter(pk=book.pk).update(stock=5)
+        users = []
+        for i in range(10):
+            user = CustomUser.objects.create_user(email=f"buyer{i}@example.com", password="secret")
+            CartItem.objects.create(cart=Cart.objects.create(user=user), book=book, quantity=1)
+            users.append(user)
+
+        codes = []
+
+        def buy(user):
+            client = APIClient()
+            client.force_authenticate(user)
+            codes.append(client.post("/api/orders/orders/place_order/").status_code)
+            connection.close()
+
+        threads = [threading.Thread(target=buy, args=(user,)) for user in users]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(codes.count(201), 5)
+        self.assertEqual(Order.objects.count(), 5)
+        self.assertEqual(Book.objects.get(pk=book.pk).stock, 0)
+
+
+class OrderConditionalGetTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = make_books(1)[0]
+        self.order = Order.objects.create(user=self.user, total_price=0)
+        OrderItem.objects.create(order=self.order, book=self.book, quantity=1, price=self.book.price)
+
+    def test_not_modified_without_serializing(self):
+        etag = self.client.get("/api/orders/orders/")["ETag"]
+        # validators only, no order/items prefetch
+        with self.assertNumQueries(1):
+            response = self.client.get("/api/orders/orders/", HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.order.status = "Completed"
+        self.order.save()
+        self.assertEqual(self.client.get("/api/orders/orders/", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class LoadTestHarnessTests(TransactionTestCase):
+    def test_seed_and_replay(self):
+        users, books = seed_dataset(users=3, books=40)
+        # a second run only tops up
+        seed_dataset(users=3, books=40)
+        self.assertEqual(users.count(), 3)
+        self.assertEqual(Order.objects.filter(user__in=users).count(), 6)
+        self.assertTrue(all(cart.item_count for cart in Cart.objects.filter(user__in=users)))
+
+        summary = loadtest.run(
+            loadtest.InProcessTransport, list(users.values_list("email", flat=True)),
+            list(books.values_list("id", flat=True)), [books.first().category_id],
+            workers=2, duration=30, max_requests=60,
+        )
+        self.assertGreaterEqual(summary["requests"], 60)
+        # every shopper logs in first
+        self.assertGreaterEqual(summary["endpoints"]["login"]["count"], 2)
+        for name, row in summary["endpoints"].items():
+            self.assertEqual(row["server_errors"], 0, name)
+            self.assertIsNotNone(row["queries"], name)
+            self.assertLessEqual(row["p50"], row["p99"], name)
+
+
+class IdempotencyKeyTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = make_books(1)[0]
+        Book.objects.update(stock=10)
+
+    def post(self, path, data=None, key="retry-1"):
+        return self.client.post(path, data, format="json", HTTP_IDEMPOTENCY_KEY=key)
+
+    def test_retried_checkout_replays_the_order(self):
+        self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": 2}, key="add-1")
+        first = self.post("/api/orders/orders/place_order/")
+        self.assertEqual(first.status_code, 201)
+        with self.assertNumQueries(0):
+            retry = self.post("/api/orders/orders/place_order/")
+        self.assertEqual(retry.status_code, 201)
+        self.assertEqual(retry["Idempotent-Replayed"], "true")
+        self.assertEqual(retry.json(), first.json())
+        self.assertEqual(Order.objects.count(), 1)
+        self.assertEqual(Book.objects.get().stock, 8)
+
+    def test_retried_add_item_does_not_double_the_quantity(self):
+        for _ in range(2):
+            self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": 2})
+        self.assertEqual(CartItem.objects.get().quantity, 2)
+        # without a key, or with a new one, it is a new request
+        self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": 2}, key="retry-2")
+        self.client.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": 2}, format="json")
+        self.assertEqual(CartItem.objects.get().quantity, 6)
+
+    def test_key_reused_for_another_request(self):
+        self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk})
+        response = self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk, "quantity": 3})
+        self.assertEqual(response.status_code, 422)
+        self.assertEqual(CartItem.objects.get().quantity, 1)
+
+    def test_keys_are_per_user(self):
+        self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk})
+        other = CustomUser.objects.create_user(email="other@example.com", password="secret")
+        self.client.force_authenticate(other)
+        self.assertNotIn("Idempotent-Replayed", self.post("/api/cart/cart/add_item/", {"book_id": self.book.pk}))
+        self.assertEqual(CartItem.objects.count(), 2)
+
+    @override_settings(IDEMPOTENCY_WAIT=0.2)
+    def test_duplicate_waits_for_the_request_in_flight(self):
+        claimed = idempotency.claim(self.post_request(), "retry-1")
+        self.assertEqual(self.post("/api/orders/orders/place_order/").status_code, 409)
+
+        done = threading.Timer(0.1, idempotency.complete, (claimed, Response({"id": 1}, status=201)))
+        done.start()
+        with override_settings(IDEMPOTENCY_WAIT=2):
+            response = self.post("/api/orders/orders/place_order/")
+        done.join()
+        self.assertEqual((response.status_code, response.json()), (201, {"id": 1}))
+        self.assertFalse(Order.objects.exists())
+
+    def test_vanishing_entry_is_retried_a_bounded_number_of_times(self):
+        # add() keeps failing and the entry is gone again before get(), as under eviction
+        with mock.patch.object(idempotency, "store") as store, mock.patch.object(idempotency.time, "sleep") as sleep:
+            store.return_value.add.return_value = False
+            store.return_value.get.return_value = None
+            with self.assertRaises(idempotency.IdempotencyConflict):
+                idempotency.claim(self.post_request(), "retry-1")
+        self.assertEqual(store.return_value.add.call_count, idempotency.CLAIM_ATTEMPTS)
+        delays = [call.args[0] for call in sleep.call_args_list]
+        self.assertEqual(len(delays), idempotency.CLAIM_ATTEMPTS - 1)
+        self.assertEqual(delays, sorted(delays))
+
+    def post_request(self):
+        request = RequestFactory().post("/api/orders/orders/place_order/", "", content_type="application/json")
+        request.user = self.user
+        return request
+
+
+class OrderArchiveTests(TestCase):
+    def setUp(self):
+        self.user = CustomUser.objects.create_user(email="reader@example.com", password="secret")
+        self.other = CustomUser.objects.create_user(email="other@example.com", password="secret")
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+        self.book = make_books(1)[0]
+        now = timezone.now()
+        self.orders = {}
+        for name, user, months, status in (
+            ("ancient", self.user, 30, "Completed"),
+            ("old", self.user, 14, "Cancelled"),
+            ("stuck", self.user, 14, "Pending"),
+            ("others", self.other, 14, "Completed"),
+            ("recent", self.user, 1, "Completed"),
+            ("new", self.user, 0, "Pending"),
+        ):
+            order = Order.objects.create(user=user, total_price=self.book.price, status=status)
+            OrderItem.objects.create(order=order, book=self.book, quantity=1, price=self.book.price)
+            Order.objects.filter(pk=order.pk).update(created_at=now - timedelta(days=31 * months))
+            self.orders[name] = order.pk
+
+    def ids(self, rows):
+        return [row["id"] for row in rows]
+
+    def test_rollover(self):
+        out = StringIO()
+        call_command("archive_orders", "--months", "12", "--batch-size", "1", stdout=out)
+        self.assertIn("Archived 3 orders", out.getvalue())
+
+        archived = {"ancient", "old", "others"}
+        self.assertEqual(set(ArchivedOrder.objects.values_list("pk", flat=True)), {self.orders[name] for name in archived})
+        self.assertEqual(ArchivedOrderItem.objects.filter(order_id=self.orders["old"]).get().book_id, self.book.pk)
+        self.assertEqual(
+            set(Order.objects.values_list("pk", flat=True)), {self.orders[name] for name in ("stuck", "recent", "new")}
+        )
+        self.assertFalse(OrderItem.objects.filter(order_id__in=[self.orders[name] for name in archived]).exists())
+
+        # a second run in the same month has nothing left to do
+        call_command("archive_orders", "--months", "12", stdout=out)
+        self.assertIn("Archived 0 orders", out.getvalue())
+
+    def test_listings(self):
+        call_command("archive_orders", "--months", "12", stdout=StringIO())
+        response = self.client.get("/api/orders/orders/")
+        self.assertEqual(self.ids(response.json()), [self.orders["new"], self.orders["recent"], self.orders["stuck"]])
+        response = self.client.get("/api/orders/orders/?status=Pending")
+        self.assertEqual(self.ids(response.json()), [self.orders["new"], self.orders["stuck"]])
+
+        page = self.client.get("/api/orders/orders/?page_size=2").json()
+        self.assertEqual(self.ids(page["results"]), [self.orders["new"], self.orders["recent"]])
+        self.assertEqual(self.ids(self.client.get(page["next"]).json()["results"]), [self.orders["stuck"]])
+
+        with self.assertNumQueries(2):
+            history = self.client.get("/api/orders/orders/history/").json()
+        self.assertEqual(self.ids(history["results"]), [self.orders["old"], self.orders["ancient"]])
+        self.assertEqual(history["results"][0]["items"][0]["book"]["id"], self.book.pk)
+        history = self.client.get("/api/orders/orders/history/?status=Completed").json()
+        self.assertEqual(self.ids(history["results"]), [self.orders["ancient"]])
+
+        self.user.is_staff = True
+        self.user.save()
+        history = self.client.get("/api/orders/orders/history/").json()
+        self.assertEqual(len(history["results"]), 3)
+
+    def test_invalid_cursor(self):
+        for value in ("garbage", [1], None, "2026-13-45 00:00:00"):
+            cursor = cursor_param(f="created_at", v=value, id=1)
+            for url in ("/api/orders/orders/", "/api/orders/orders/history/"):
+                with self.subTest(url=url, value=value):
+                    self.assertEqual(self.client.get(f"{url}?cursor={cursor}").status_code, 404)
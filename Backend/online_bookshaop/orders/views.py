@@ -2,55 +2,79 @@ from rest_framework import viewsets, status
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.decorators import action
 from rest_framework.response import Response
-from .models import Order, OrderItem
-from .serializers import OrderSerializer
-from cart.models import Cart, CartItem
-from accounts.serializers import UserSerializer
+from django.db.models import Count, Max, prefetch_related_objects
+from django_filters.rest_framework import DjangoFilterBackend
+from .models import ArchivedOrder, Order
+from .serializers import ArchivedOrderSerializer, OrderFilter, OrderSerializer
+from . import checkout
+from cart.models import Cart
+from bookstore.conditional import ConditionalGetMixin, latest
+from bookstore.idempotency import IdempotencyMixin
+from bookstore.pagination import ArchivePagination, RecentFirstPagination
 
 
-class OrderViewSet(viewsets.ModelViewSet):
+class OrderViewSet(IdempotencyMixin, ConditionalGetMixin, viewsets.ModelViewSet):
     serializer_class = OrderSerializer
     permission_classes = [IsAuthenticated]
+    filter_backends = [DjangoFilterBackend]
+    filterset_class = OrderFilter
+    # opt-in like the catalog, `?page_size=` or `?cursor=`
+    pagination_class = RecentFirstPagination
 
-    def get_queryset(self):
-        user_data = UserSerializer(self.request.user).data
-        is_admin = user_data.get("is_staff", False)
-        if is_admin:
-            return Order.objects.all()
+    def own(self, queryset):
+        # is_staff comes from the token claims, no user query
+        if self.request.user.is_staff:
+            return queryset
         # Users can only see their own orders
-        return Order.objects.filter(user=self.request.user)
+        return queryset.filter(user=self.request.user)
 
-    @action(detail=False, methods=["post"])
-    def place_order(self, request):
-        """Place an order from the current user's cart"""
-        cart, _ = Cart.objects.get_or_create(user=request.user)
-        if not cart.items.exists():
-            return Response(
-                {"detail": "Cart is empty"}, status=status.HTTP_400_BAD_REQUEST
-            )
+    def get_queryset(self):
+        # the live table only holds the last ORDER_ARCHIVE_MONTHS, older orders are in history
+        return OrderSerializer.setup_eager_loading(self.own(Order.objects.order_by("-created_at", "-id")))
 
-        total_price = sum(
-            [item.book.price * item.quantity for item in cart.items.all()]
-        )
+    def object_validators(self, obj):
+        # nested books are rendered with their current data
+        books = [item.book for item in obj.items.all()]
+        updated = latest(obj.updated_at, *(book.updated_at for book in books), *(book.category.updated_at for book in books))
+        return (obj.pk, obj.updated_at, updated), updated
 
-        # Create Order
-        order = Order.objects.create(user=request.user, total_price=total_price)
+    def validator_aggregates(self):
+        return {
+            "count": Count("pk", distinct=True),
+            "updated": Max("updated_at"),
+            "books": Max("items__book__updated_at"),
+            "categories": Max("items__book__category__updated_at"),
+        }
 
-        # Create OrderItems
-        for item in cart.items.all():
-            OrderItem.objects.create(
-                order=order,
-                book=item.book,
-                quantity=item.quantity,
-                price=item.book.price,
-            )
+    def aggregate_validators(self, aggregate):
+        return tuple(aggregate.values()), latest(aggregate["updated"], aggregate["books"], aggregate["categories"])
 
-        # Clear the cart
-        cart.items.all().delete()
+    @action(detail=False, methods=["post"])
+    def place_order(self, request):
+        """Place an order from the current user's cart"""
+        cart, _ = Cart.objects.get_or_create(user=request.user)
+        try:
+            order = checkout.place_order(cart, request.user)
+        except checkout.CheckoutError as exc:
+            return Response({"detail": str(exc)}, status=status.HTTP_400_BAD_REQUEST)
 
+        prefetch_related_objects([order], OrderSerializer.items_prefetch())
         serializer = self.get_serializer(order)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
+    @action(detail=False, methods=["get"])
+    def history(self, request):
+        """Archived orders (orders/archive.py), newest first, with the list filters. Always paginated."""
+        queryset = self.own(ArchivedOrder.objects.order_by("-created_at", "-id"))
+        # same field names, so OrderFilter applies to the archive as well
+        filterset = OrderFilter(request.query_params, queryset=ArchivedOrderSerializer.setup_eager_loading(queryset), request=request)
+        if not filterset.is_valid():
+            return Response(filterset.errors, status=status.HTTP_400_BAD_REQUEST)
+        paginator = ArchivePagination()
+        page = paginator.paginate_queryset(filterset.qs, request, view=self)
+        serializer = ArchivedOrderSerializer(page, many=True, context=self.get_serializer_context())
+        return paginator.get_paginated_response(serializer.data)
+
     @action(detail=True, methods=["patch"])
     def update_status(self, request, pk=None):
         """Admin can update order status"""